@@ -0,0 +1,34 @@
+"""book change log
+
+Revision ID: 2e6a9c4f8b13
+Revises: 7b3d5e9a2c48
+Create Date: 2025-10-20 10:14:52.406117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6a9c4f8b13'
+down_revision: Union[str, None] = '7b3d5e9a2c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('book_change_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('origin', sa.String(), nullable=False),
+    sa.Column('changes', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_book_change_log_created_at'), 'book_change_log', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_book_change_log_created_at'), table_name='book_change_log')
+    op.drop_table('book_change_log')
@@ -0,0 +1,57 @@
+"""catalog aggregates
+
+Revision ID: 4a8e6c2f1d95
+Revises: 9d4f2b7e1c36
+Create Date: 2025-09-29 11:27:45.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a8e6c2f1d95'
+down_revision: Union[str, None] = '9d4f2b7e1c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('author_stats',
+    sa.Column('author', sa.String(), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.Column('priced_count', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('author')
+    )
+    op.create_index(op.f('ix_author_stats_book_count'), 'author_stats', ['book_count'], unique=False)
+    op.create_table('price_bucket_stats',
+    sa.Column('bucket', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket')
+    )
+    op.create_index(op.f('ix_user_library_stats_total_value'), 'user_library_stats', ['total_value'], unique=False)
+    # from here on every book write keeps these rows current; the buckets follow the
+    # default STATS_PRICE_BUCKETS, so run `python -m app.services.catalog_stats rebuild` if you changed them
+    op.execute(
+        "INSERT INTO author_stats (author, book_count, priced_count, total_value) "
+        "SELECT author, count(id), count(price), coalesce(sum(price), 0) FROM books GROUP BY author"
+    )
+    op.execute(
+        "INSERT INTO price_bucket_stats (bucket, book_count, total_value) "
+        "SELECT bucket, count(*), coalesce(sum(price), 0) FROM ("
+        "SELECT price, CASE WHEN price IS NULL THEN -1 WHEN price < 5 THEN 0 WHEN price < 10 THEN 1 "
+        "WHEN price < 15 THEN 2 WHEN price < 20 THEN 3 WHEN price < 30 THEN 4 WHEN price < 50 THEN 5 "
+        "WHEN price < 100 THEN 6 ELSE 7 END AS bucket FROM books"
+        ") AS priced GROUP BY bucket"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_library_stats_total_value'), table_name='user_library_stats')
+    op.drop_table('price_bucket_stats')
+    op.drop_index(op.f('ix_author_stats_book_count'), table_name='author_stats')
+    op.drop_table('author_stats')
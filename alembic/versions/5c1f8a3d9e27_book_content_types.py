@@ -0,0 +1,44 @@
+"""book content types
+
+Revision ID: 5c1f8a3d9e27
+Revises: 2e6a9c4f8b13
+Create Date: 2025-10-21 09:32:18.204571
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1f8a3d9e27'
+down_revision: Union[str, None] = '2e6a9c4f8b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# copied from app.services.storage, which may change after this migration
+COVER_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('file_content_type', sa.String(), nullable=True))
+    op.add_column('books', sa.Column('cover_content_type', sa.String(), nullable=True))
+
+    books = sa.table('books', sa.column('file_path'), sa.column('cover_image'),
+                     sa.column('file_content_type'), sa.column('cover_content_type'))
+    stored = sa.table('stored_files', sa.column('sha256'), sa.column('content_type'))
+    op.execute(books.update().where(books.c.file_path.isnot(None)).values(
+        file_content_type=sa.select(stored.c.content_type).where(stored.c.sha256 == books.c.file_path).scalar_subquery()
+    ))
+    # covers were never checked, so a type that isn't an image is served as a download instead
+    op.execute(books.update().where(books.c.cover_image.isnot(None)).values(
+        cover_content_type=sa.select(
+            sa.case((stored.c.content_type.in_(COVER_TYPES), stored.c.content_type), else_='application/octet-stream')
+        ).where(stored.c.sha256 == books.c.cover_image).scalar_subquery()
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('books', 'cover_content_type')
+    op.drop_column('books', 'file_content_type')
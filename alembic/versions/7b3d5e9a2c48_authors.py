@@ -0,0 +1,128 @@
+"""authors
+
+Revision ID: 7b3d5e9a2c48
+Revises: 4a8e6c2f1d95
+Create Date: 2025-10-06 09:42:13.581640
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3d5e9a2c48'
+down_revision: Union[str, None] = '4a8e6c2f1d95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+_WORDS = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _normalize(name: str) -> str:
+    # a copy of app.services.authors.normalize as of this revision, so later changes there can't alter it
+    folded = "".join(
+        char for char in unicodedata.normalize("NFKD", name).casefold() if not unicodedata.combining(char)
+    )
+    return " ".join(_WORDS.findall(folded)) or name.strip().casefold()
+
+
+def _backfill() -> None:
+    conn = op.get_bind()
+    authors = sa.table('authors', sa.column('id', sa.Integer), sa.column('name', sa.String))
+    aliases = sa.table(
+        'author_aliases',
+        sa.column('normalized_name', sa.String), sa.column('author_id', sa.Integer), sa.column('name', sa.String),
+    )
+    known = {}
+    last = None
+    while True:
+        query = sa.select(sa.column('author')).select_from(sa.table('books')).distinct().order_by('author').limit(BATCH_SIZE)
+        if last is not None:
+            query = query.where(sa.column('author') > last)
+        names = conn.execute(query).scalars().all()
+        if not names:
+            return
+        last = names[-1]
+        updates = []
+        for name in names:
+            normalized = _normalize(name)
+            if normalized not in known:
+                known[normalized] = conn.execute(
+                    sa.insert(authors).values(name=name).returning(authors.c.id)
+                ).scalar_one()
+                conn.execute(sa.insert(aliases).values(normalized_name=normalized, author_id=known[normalized], name=name))
+            updates.append({"author_id": known[normalized], "name": name})
+        conn.execute(sa.text("UPDATE books SET author_id = :author_id WHERE author = :name AND author_id IS NULL"), updates)
+
+
+def upgrade() -> None:
+    op.create_table('authors',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('author_aliases',
+    sa.Column('normalized_name', sa.String(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['authors.id'], ),
+    sa.PrimaryKeyConstraint('normalized_name')
+    )
+    op.create_index(op.f('ix_author_aliases_author_id'), 'author_aliases', ['author_id'], unique=False)
+    op.create_index('ix_author_aliases_normalized_name_prefix', 'author_aliases', ['normalized_name'], unique=False,
+                    postgresql_ops={'normalized_name': 'varchar_pattern_ops'})
+    op.add_column('books', sa.Column('author_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('books_author_id_fkey', 'books', 'authors', ['author_id'], ['id'])
+
+    _backfill()
+    # built after the backfill, which is faster than updating the index row by row
+    op.create_index(op.f('ix_books_author_id'), 'books', ['author_id'], unique=False)
+
+    op.drop_index(op.f('ix_author_stats_book_count'), table_name='author_stats')
+    op.drop_table('author_stats')
+    op.create_table('author_stats',
+    sa.Column('author_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.Column('priced_count', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['authors.id'], ),
+    sa.PrimaryKeyConstraint('author_id')
+    )
+    op.create_index(op.f('ix_author_stats_book_count'), 'author_stats', ['book_count'], unique=False)
+    op.execute(
+        "INSERT INTO author_stats (author_id, book_count, priced_count, total_value) "
+        "SELECT author_id, count(id), count(price), coalesce(sum(price), 0) FROM books "
+        "WHERE author_id IS NOT NULL GROUP BY author_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_author_stats_book_count'), table_name='author_stats')
+    op.drop_table('author_stats')
+    op.create_table('author_stats',
+    sa.Column('author', sa.String(), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.Column('priced_count', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('author')
+    )
+    op.create_index(op.f('ix_author_stats_book_count'), 'author_stats', ['book_count'], unique=False)
+    op.execute(
+        "INSERT INTO author_stats (author, book_count, priced_count, total_value) "
+        "SELECT author, count(id), count(price), coalesce(sum(price), 0) FROM books GROUP BY author"
+    )
+
+    op.drop_index(op.f('ix_books_author_id'), table_name='books')
+    op.drop_constraint('books_author_id_fkey', 'books', type_='foreignkey')
+    op.drop_column('books', 'author_id')
+    op.drop_index('ix_author_aliases_normalized_name_prefix', table_name='author_aliases')
+    op.drop_index(op.f('ix_author_aliases_author_id'), table_name='author_aliases')
+    op.drop_table('author_aliases')
+    op.drop_table('authors')
@@ -0,0 +1,37 @@
+"""add stored files
+
+Revision ID: 7c3e19a4b5d2
+Revises: 0b7d3e5f9a21
+Create Date: 2025-09-18 09:27:44.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e19a4b5d2'
+down_revision: Union[str, None] = '0b7d3e5f9a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stored_files',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('content_type', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    # books.file_path and books.cover_image date from the initial schema and were never written
+    op.create_foreign_key('books_file_path_fkey', 'books', 'stored_files', ['file_path'], ['sha256'])
+    op.create_foreign_key('books_cover_image_fkey', 'books', 'stored_files', ['cover_image'], ['sha256'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('books_cover_image_fkey', 'books', type_='foreignkey')
+    op.drop_constraint('books_file_path_fkey', 'books', type_='foreignkey')
+    op.drop_table('stored_files')
@@ -0,0 +1,49 @@
+"""price bucket shards
+
+Revision ID: 8f4b2d6e1a73
+Revises: 5c1f8a3d9e27
+Create Date: 2025-10-21 14:05:41.873920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f4b2d6e1a73'
+down_revision: Union[str, None] = '5c1f8a3d9e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing totals stay whole in shard 0; writes spread over the other shards from here on
+    with op.batch_alter_table('price_bucket_stats') as batch_op:
+        batch_op.add_column(sa.Column('shard', sa.Integer(), server_default='0', autoincrement=False, nullable=False))
+        if op.get_bind().dialect.name != 'sqlite':
+            # SQLite's primary key has no name; batch mode rebuilds the table with the new one
+            batch_op.drop_constraint('price_bucket_stats_pkey', type_='primary')
+        batch_op.create_primary_key('price_bucket_stats_pkey', ['bucket', 'shard'])
+
+
+def downgrade() -> None:
+    # fold every bucket's shards back into shard 0
+    op.execute(
+        "INSERT INTO price_bucket_stats (bucket, shard, book_count, total_value) "
+        "SELECT DISTINCT bucket, 0, 0, 0 FROM price_bucket_stats "
+        "WHERE bucket NOT IN (SELECT bucket FROM price_bucket_stats WHERE shard = 0)"
+    )
+    op.execute(
+        "UPDATE price_bucket_stats SET "
+        "book_count = (SELECT sum(book_count) FROM price_bucket_stats AS s WHERE s.bucket = price_bucket_stats.bucket), "
+        "total_value = (SELECT sum(total_value) FROM price_bucket_stats AS s WHERE s.bucket = price_bucket_stats.bucket) "
+        "WHERE shard = 0"
+    )
+    op.execute("DELETE FROM price_bucket_stats WHERE shard <> 0")
+    with op.batch_alter_table('price_bucket_stats') as batch_op:
+        if op.get_bind().dialect.name != 'sqlite':
+            batch_op.drop_constraint('price_bucket_stats_pkey', type_='primary')
+        batch_op.create_primary_key('price_bucket_stats_pkey', ['bucket'])
+        batch_op.drop_column('shard')
@@ -0,0 +1,40 @@
+"""user library index and stats
+
+Revision ID: 9d4f2b7e1c36
+Revises: 7c3e19a4b5d2
+Create Date: 2025-09-22 16:03:12.640187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4f2b7e1c36'
+down_revision: Union[str, None] = '7c3e19a4b5d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_books_user_id_created_at_id', 'books', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_table('user_library_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # from here on every book write keeps these rows current
+    op.execute(
+        "INSERT INTO user_library_stats (user_id, book_count, total_value) "
+        "SELECT user_id, count(id), coalesce(sum(price), 0) FROM books "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_library_stats')
+    op.drop_index('ix_books_user_id_created_at_id', table_name='books')
@@ -0,0 +1,30 @@
+"""import job conflict policy
+
+Revision ID: a83c5e19f4d2
+Revises: 6d2f8a41c0b7
+Create Date: 2025-09-04 16:41:07.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83c5e19f4d2'
+down_revision: Union[str, None] = '6d2f8a41c0b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('import_jobs', sa.Column('conflict_policy', sa.String(length=16), server_default='fail', nullable=False))
+    op.add_column('import_jobs', sa.Column('rows_updated', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('import_jobs', sa.Column('rows_skipped', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('import_jobs', 'rows_skipped')
+    op.drop_column('import_jobs', 'rows_updated')
+    op.drop_column('import_jobs', 'conflict_policy')
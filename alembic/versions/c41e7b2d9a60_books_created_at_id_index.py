@@ -0,0 +1,26 @@
+"""books created_at id index
+
+Revision ID: c41e7b2d9a60
+Revises: a83c5e19f4d2
+Create Date: 2025-09-08 11:02:33.470519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7b2d9a60'
+down_revision: Union[str, None] = 'a83c5e19f4d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_books_created_at_id', 'books', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_created_at_id', table_name='books')
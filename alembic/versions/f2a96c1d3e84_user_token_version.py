@@ -0,0 +1,28 @@
+"""user token version and soft delete
+
+Revision ID: f2a96c1d3e84
+Revises: e5b90d3f7a18
+Create Date: 2025-09-15 10:12:08.331760
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a96c1d3e84'
+down_revision: Union[str, None] = 'e5b90d3f7a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'deleted_at')
+    op.drop_column('users', 'token_version')
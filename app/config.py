@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+from typing import Literal, Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Every environment setting, read once from the environment and .env
+
+    Field names match the environment variables case-insensitively, so
+    DB_POOL_SIZE sets db_pool_size.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # Database
+    database_url: Optional[str] = None
+    # Optional read replica; GET handlers read from it when set
+    database_replica_url: Optional[str] = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # Recycle connections before PgBouncer or a load balancer drops them as idle
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Set at the start of every transaction; 0 leaves the server default in place
+    db_statement_timeout_ms: int = 0
+    # Connections go through PgBouncer in transaction pooling mode: turns off asyncpg's
+    # prepared statement caches, which can't survive a change of server connection
+    db_pgbouncer: bool = False
+    # What boot does about the schema: "create" builds the tables of a database Alembic
+    # doesn't manage, "strict" refuses to start unless it is at the head revision,
+    # "off" skips the check
+    schema_check: Literal["off", "create", "strict"] = "create"
+
+    # Auth
+    secret_key: Optional[str] = None
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 30
+    # Read-only routes trust the token claims instead of looking the user up
+    auth_claims_only_reads: bool = True
+    token_cache_max_entries: int = 10000
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_entries: int = 10000
+
+    # Password hashing
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = os.cpu_count() or 1
+    # Calls allowed to wait for a free worker before new ones are turned away; defaults to 4 per worker
+    password_hash_queue_size: Optional[int] = None
+
+    # Response cache
+    cache_backend: str = "memory"
+    cache_ttl_seconds: int = 60
+    cache_max_entries: int = 10000
+    # Responses read from the replica aren't cached for this long after a write
+    # invalidated them, so a page the replica hasn't caught up on isn't stored
+    replica_cache_delay_seconds: float = 5
+    redis_url: Optional[str] = None
+    # Seconds to wait for Redis before giving up on a call; the cache and rate limiter carry on without it
+    redis_connect_timeout_seconds: float = 0.5
+    redis_socket_timeout_seconds: float = 0.5
+
+    # Rate limiting: a token bucket per route class and client IP, and another
+    # per route class and user for requests with a valid token; each limit is
+    # "requests/seconds"
+    rate_limit_enabled: bool = True
+    rate_limit_backend: Literal["memory", "redis"] = "memory"
+    rate_limits: str = "auth=10/60,search=120/60,write=120/60,bulk=10/60,default=600/60"
+    # IP buckets for the classes listed here, e.g. looser ones for users behind a
+    # shared NAT; other classes use rate_limits for IPs too
+    ip_rate_limits: str = ""
+    # Requests of a class one process handles at once; past that they are turned away
+    concurrency_limits: str = "bulk=4,search=64"
+    rate_limit_max_keys: int = 100000
+
+    # Metrics
+    metrics_enabled: bool = True
+    n_plus_one_threshold: int = 10
+
+    # Search
+    search_index_enabled: bool = False
+    suggest_index_enabled: bool = True
+    # Other processes' book writes reach this process's search indexes and response
+    # cache within this many seconds, through the book_change_log table; 0 turns the
+    # log off, which is only safe with a single worker process
+    book_change_poll_seconds: float = 2.0
+    book_change_retention_seconds: int = 3600
+
+    # Catalog stats: lower edges of the price distribution's buckets; run the
+    # rebuild command after changing them
+    stats_price_buckets: str = "0,5,10,15,20,30,50,100"
+    # Rows each price range's totals are spread over; more lets more writers add to one range at once
+    stats_price_shards: int = 8
+
+    # Imports, batches and exports
+    import_batch_size: int = 1000
+    import_use_copy: bool = True
+    import_max_rejected: int = 1000
+    import_workers: int = 2
+    import_spool_dir: str = "uploads/imports"
+    import_job_stale_seconds: int = 300
+    batch_max_operations: int = 10000
+    batch_chunk_size: int = 1000
+    export_batch_size: int = 1000
+
+    # File storage and thumbnails
+    storage_backend: str = "local"
+    storage_dir: str = "uploads/files"
+    storage_chunk_size: int = 1024 * 1024
+    max_upload_bytes: int = 100 * 1024 * 1024
+    max_cover_bytes: int = 10 * 1024 * 1024
+    # Longest edge, in pixels, of each cover variant
+    thumbnail_sizes: str = "64,160,320,640"
+    thumbnail_format: str = "webp"
+    thumbnail_quality: int = 80
+    thumbnail_workers: int = 2
+    # Jobs allowed to wait for a free worker; past that, new covers are left for a later read to retry
+    thumbnail_queue_size: int = 64
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
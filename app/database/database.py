@@ -1,18 +1,179 @@
-from sqlalchemy import create_engine
+import asyncio
+import threading
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from app.config import settings
+from app.database.pool import TimedAsyncQueuePool, TimedQueuePool, attach_metrics
+
+
+DATABASE_URL = settings.database_url
+DATABASE_REPLICA_URL = settings.database_replica_url
+
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+DB_STATEMENT_TIMEOUT_MS = settings.db_statement_timeout_ms
+DB_PGBOUNCER = settings.db_pgbouncer
+
+# Async drivers for the request path; the sync engine stays for Alembic, scripts and import workers
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+HEALTH_CHECK_TIMEOUT = 5
+
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def async_database_url(url: str) -> str:
+    """Swap the sync driver in a database URL for its async counterpart"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool and timeout settings for create_engine / create_async_engine"""
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # in-memory SQLite needs its single-connection pool
+        return options
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if DB_PGBOUNCER and is_async and url.get_backend_name() == "postgresql":
+        # in transaction pooling a prepared statement can't outlive its transaction, since the
+        # next one may run on another server connection; names must be unique across clients
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4().hex}__",
+        }
+    return options
+
+
+def _set_statement_timeout(conn):
+    # per transaction rather than as a startup parameter, which PgBouncer refuses;
+    # SET LOCAL also ends with the transaction, so it never leaks to another client
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(DB_STATEMENT_TIMEOUT_MS)}")
+
+
+def _configure(engine: Engine):
+    attach_metrics(engine.pool)
+    if DB_STATEMENT_TIMEOUT_MS and engine.dialect.name == "postgresql":
+        event.listen(engine, "begin", _set_statement_timeout)
+
+
+def _create_engine(url: str) -> Engine:
+    engine = create_engine(url, **engine_options(url))
+    _configure(engine)
+    return engine
+
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    url = async_database_url(url)
+    engine = create_async_engine(url, **engine_options(url, is_async=True))
+    _configure(engine.sync_engine)
+    return engine
+
+
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def _get(name: str, create):
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = create()
+    return engine
+
+
+def get_engine() -> Engine:
+    """The sync engine, created on first use"""
+    return _get("engine", lambda: _create_engine(DATABASE_URL))
+
 
-import os
-from dotenv import load_dotenv
-load_dotenv()
+def get_async_engine() -> AsyncEngine:
+    """The async engine on the primary, created on first use"""
+    return _get("async_engine", lambda: _create_async_engine(DATABASE_URL))
 
-DATABASE_URL = os.getenv('DATABASE_URL')
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_async_replica_engine() -> AsyncEngine:
+    """The async engine on the read replica, or the primary's without one"""
+    if not DATABASE_REPLICA_URL:
+        return get_async_engine()
+    return _get("async_replica_engine", lambda: _create_async_engine(DATABASE_REPLICA_URL))
+
+
+_ENGINE_GETTERS = {
+    "engine": get_engine,
+    "async_engine": get_async_engine,
+    "async_replica_engine": get_async_replica_engine,
+}
+
+
+def __getattr__(name: str):
+    # keeps `database.engine` and friends working without creating engines at import
+    if name in _ENGINE_GETTERS:
+        return _ENGINE_GETTERS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySessionFactory:
+    """Calls through to a session factory that is built on first use"""
+
+    def __init__(self, build):
+        self._build = build
+        self._factory = None
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            self._factory = self._build()
+        return self._factory(**kwargs)
+
+
+SessionLocal = LazySessionFactory(lambda: sessionmaker(autocommit=False, autoflush=False, bind=get_engine()))
 Base = declarative_base()
 
+# Objects stay readable after commit, since response models are built from them afterwards
+AsyncSessionLocal = LazySessionFactory(lambda: async_sessionmaker(
+    get_async_engine(), class_=AsyncSession, autoflush=False, expire_on_commit=False
+))
+AsyncReplicaSessionLocal = LazySessionFactory(lambda: async_sessionmaker(
+    get_async_replica_engine(), class_=AsyncSession, autoflush=False, expire_on_commit=False
+)) if DATABASE_REPLICA_URL else AsyncSessionLocal
+
+
+async def dispose_engines():
+    """Close the pools of every engine created so far"""
+    for engine in list(_engines.values()):
+        if isinstance(engine, AsyncEngine):
+            await engine.dispose()
+        else:
+            engine.dispose()
+
 
 def get_db():
     """Dependency to get database session"""
@@ -21,3 +182,53 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency to get an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """Dependency to get an async session on the read replica, or the primary without one
+
+    Replica reads can trail a write that just committed on the primary.
+    """
+    async with AsyncReplicaSessionLocal() as db:
+        yield db
+
+
+def reads_replica(db: AsyncSession) -> bool:
+    """Whether db reads from the replica, so may not see writes that just committed"""
+    return db.bind is not get_async_engine()
+
+
+async def replica_lag_seconds() -> Optional[float]:
+    """Replication delay reported by the replica, None without a PostgreSQL replica"""
+    if not DATABASE_REPLICA_URL:
+        return None
+    replica = get_async_replica_engine()
+    if replica.dialect.name != "postgresql":
+        return None
+    async with replica.connect() as conn:
+        lag = await conn.scalar(REPLICA_LAG_QUERY)
+    return float(lag) if lag is not None else None
+
+
+async def database_health() -> dict:
+    """Pool usage of every engine plus replica lag, for /health"""
+    engine, async_engine = get_engine(), get_async_engine()
+    health = {
+        "primary": engine.pool.metrics.snapshot(engine.pool),
+        "primary_async": async_engine.sync_engine.pool.metrics.snapshot(async_engine.sync_engine.pool),
+    }
+    if DATABASE_REPLICA_URL:
+        replica_pool = get_async_replica_engine().sync_engine.pool
+        health["replica"] = replica_pool.metrics.snapshot(replica_pool)
+        try:
+            health["replica_lag_seconds"] = await asyncio.wait_for(replica_lag_seconds(), HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            health["replica_lag_seconds"] = None
+            health["replica_error"] = str(e)
+    return health
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import settings
+from app.models.models import Base
+from app.services.search import ensure_search_schema
+
+
+SCHEMA_CHECK = settings.schema_check
+SCRIPT_LOCATION = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic")
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaOutOfDate(RuntimeError):
+    """Raised in strict mode when the database is not at the migration head"""
+
+
+def _versions_fingerprint() -> str:
+    """Changes whenever a migration script is added, removed or edited"""
+    digest = hashlib.sha256(SCRIPT_LOCATION.encode())
+    for entry in sorted(os.scandir(os.path.join(SCRIPT_LOCATION, "versions")), key=lambda entry: entry.name):
+        if entry.name.endswith(".py"):
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+@lru_cache
+def head_revisions() -> FrozenSet[str]:
+    """Head revision(s) of the migration scripts
+
+    Finding them means importing Alembic and every migration, so the answer
+    is also kept in a temp file keyed by the scripts' names, sizes and
+    mtimes, which later processes read instead.
+    """
+    fingerprint = _versions_fingerprint()
+    cache_path = os.path.join(tempfile.gettempdir(), f"bookstore-alembic-heads-{fingerprint[:32]}.json")
+    try:
+        with open(cache_path) as f:
+            return frozenset(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+    from alembic.script import ScriptDirectory
+
+    heads = frozenset(ScriptDirectory(SCRIPT_LOCATION).get_heads())
+    try:
+        staged = f"{cache_path}.{os.getpid()}"
+        with open(staged, "w") as f:
+            json.dump(sorted(heads), f)
+        os.replace(staged, cache_path)
+    except OSError:
+        logger.warning("Could not cache migration heads in %s", cache_path)
+    return heads
+
+
+def database_revisions(conn: Connection) -> Optional[FrozenSet[str]]:
+    """Revision(s) the database was migrated to, None if Alembic doesn't manage it"""
+    if not inspect(conn).has_table("alembic_version"):
+        return None
+    return frozenset(conn.execute(text("SELECT version_num FROM alembic_version")).scalars())
+
+
+def check_schema(engine: Engine, mode: str = SCHEMA_CHECK) -> dict:
+    """Make sure the database schema matches the code before serving requests
+
+    A database Alembic manages is only compared against the migration head;
+    create_all runs just for one it doesn't, such as a fresh SQLite file.
+    """
+    status = {"mode": mode}
+    if mode != "off":
+        with engine.connect() as conn:
+            current = database_revisions(conn)
+        if current is None:
+            if mode == "strict":
+                raise SchemaOutOfDate("Database is not managed by Alembic; run alembic upgrade head")
+            Base.metadata.create_all(bind=engine)
+            status.update(state="created", revision=None)
+        else:
+            heads = head_revisions()
+            status.update(revision=sorted(current), head=sorted(heads))
+            if current == heads:
+                status["state"] = "current"
+            elif mode == "strict":
+                raise SchemaOutOfDate(
+                    f"Database is at revision {', '.join(sorted(current))}, not {', '.join(sorted(heads))}; "
+                    "run alembic upgrade head"
+                )
+            else:
+                status["state"] = "out_of_date"
+                logger.warning("Database is at revision %s, migrations are at %s; run alembic upgrade head",
+                               ", ".join(sorted(current)), ", ".join(sorted(heads)))
+    # also decides whether SQLite search can use FTS5, so it runs even with the check off
+    ensure_search_schema(engine)
+    return status
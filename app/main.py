@@ -1,23 +1,74 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.routes import auth, books, upload
-from app.database.database import engine
-from app.models.models import Base
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.routes import auth, authors, books, upload
+from app.middleware import metrics
+from app.middleware.cache import CacheInvalidationMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.database.database import database_health, dispose_engines, get_engine
+from app.database.schema import check_schema
+from app.services import book_events, catalog_stats, import_jobs, library_stats, passwords, rate_limit, response_cache, search_index, suggest, thumbnails
+from app.services.passwords import PasswordHasherBusy
+from app.services.startup import StartupReport
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report = app.state.startup = StartupReport(_import_seconds)
+    with report.step("schema"):
+        report.schema = check_schema(get_engine())
+    with report.step("aggregates"):
+        # subscribed before import jobs resume, so their writes are counted too
+        library_stats.start()
+        catalog_stats.start()
+    with report.step("import_jobs"):
+        import_jobs.resume_pending_jobs()
+    with report.step("book_change_feed"):
+        book_events.start_feed()
+    with report.step("search_index"):
+        search_index.start()
+    with report.step("suggest"):
+        suggest.start()
+    with report.step("response_cache"):
+        response_cache.start()
+    report.log()
 
-Base.metadata.create_all(bind=engine)
+    yield
+
+    book_events.stop_feed()
+    import_jobs.shutdown()
+    passwords.shutdown()
+    thumbnails.shutdown()
+    await dispose_engines()
 
 
 app = FastAPI(
     title="Bookstore API",
     description="A FastAPI microservice for a mini Bookstore with authentication, search, and file upload",
+    lifespan=lifespan,
 )
 
+# innermost, so the time a write waits on cache invalidation counts in its metrics
+app.add_middleware(CacheInvalidationMiddleware)
+# inside MetricsMiddleware, which then counts the requests it turns away
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(books.router)
+app.include_router(authors.router)
 app.include_router(upload.router)
 
+_import_seconds = time.perf_counter() - _import_started
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -29,9 +80,27 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "bookstore-api"}
+    health = {"status": "healthy", "service": "bookstore-api"}
+    health["database"] = await database_health()
+    health["password_hashing"] = passwords.stats()
+    health["thumbnails"] = thumbnails.stats()
+    if hasattr(app.state, "startup"):
+        health["startup"] = app.state.startup.as_dict()
+    if search_index.SEARCH_INDEX_ENABLED:
+        health["search_index"] = search_index.index.stats()
+    if suggest.SUGGEST_INDEX_ENABLED:
+        health["suggest"] = suggest.index.stats()
+    if rate_limit.RATE_LIMIT_ENABLED:
+        health["rate_limit"] = rate_limit.stats()
+    return health
+
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -39,3 +108,12 @@ async def http_exception_handler(request, exc):
         status_code=exc.status_code,
         content={"detail": exc.detail}
     )
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many sign-in attempts in progress, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
@@ -1,70 +1,142 @@
 from starlette import status
-from jose import jwt, JWTError
-from datetime import timedelta, datetime
+import time
+from typing import Optional
+from datetime import timedelta, datetime, timezone
 from app.models.models import User
-from passlib.context import CryptContext
-from app.database.database import get_db
-from sqlalchemy.orm import Session
+from app.database.database import get_async_db
+from sqlalchemy import select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.schemas.schemas import Current_User
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from app.services import passwords, principals
+from app.services.cache import LRUTTLCache
+from app.services.principals import Principal
+from app.config import settings
 
 
 
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = os.getenv('ALGORITHM')
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+AUTH_CLAIMS_ONLY_READS = settings.auth_claims_only_reads
+TOKEN_CACHE_MAX_ENTRIES = settings.token_cache_max_entries
 
 
-bcrypt_context =  CryptContext(schemes= ['bcrypt'], deprecated= 'auto')
-
 bearer_scheme = HTTPBearer()
 
+# token -> decoded claims, each entry expiring with its token, so a repeat
+# request skips the signature check
+_verified_tokens = LRUTTLCache(TOKEN_CACHE_MAX_ENTRIES, 0)
+
 
-def authenticate_user(email: str, password:str , db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(email: str, password:str , db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == email, User.deleted_at.is_(None)))
     if user is None:
         raise HTTPException(status_code=404, detail="User does not exist")
-    if not bcrypt_context.verify(password, user.hashed_password):
+    ok, new_hash = await passwords.verify_password(password, user.hashed_password)
+    if not ok:
         raise HTTPException(status_code=404, detail="Incorrect Password")
+    if new_hash:
+        # BCRYPT_ROUNDS changed; a Core update keeps this from counting as a credential change
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
+        set_committed_value(user, "hashed_password", new_hash)
     return user
 
 
 
-def create_access_token(email: str, expire_delta: timedelta):
-    encode = {'sub': email }
-    expires = expire_delta + datetime.now()
+def create_access_token(user: User, expire_delta: timedelta):
+    # uid and tv let get_current_user resolve and check the user without a query
+    encode = {'sub': user.email, 'uid': user.id, 'tv': user.token_version or 0}
+    # jose reads a naive exp as UTC, so local time would skew it by the UTC offset
+    expires = expire_delta + datetime.now(timezone.utc)
     encode.update({'exp': expires})
+    # jose pulls in the crypto backends, so it is imported on first use rather than at boot
+    from jose import jwt
     return jwt.encode(encode, SECRET_KEY, algorithm= ALGORITHM)
 
- 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db)
-):  
-    
-        token = credentials.credentials
+
+def _decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
+    token = credentials.credentials
+    payload = _verified_tokens.get(token)
+    if payload is not None:
+        return payload
+    from jose import JWTError, jwt
+    try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorize user"
+        )
+    if payload.get("sub") is None or payload.get("uid") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized user"
+        )
+    if "exp" in payload:
+        _verified_tokens.set(token, payload, payload["exp"] - time.time())
+    return payload
+
+
+def token_user_id(authorization: str) -> Optional[int]:
+    """User id of a valid "Bearer <token>" header value, None for anything else"""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return _decode_token(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))["uid"]
+    except HTTPException:
+        return None
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Resolve the token's user from the principal cache, querying only on a miss"""
+    payload = _decode_token(credentials)
+    user_id = payload["uid"]
+
+    principal = principals.get(user_id)
+    if principal is None:
+        generation = principals.generation()
+        user = await db.scalar(select(User).where(User.id == user_id, User.deleted_at.is_(None)))
+        if not user:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Unauthorized user"
-            )
-        try:
-            user = db.query(User).filter(User.email == email).first()
-            if not user:
-                raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
+        principal = Principal.from_user(user)
+        principals.put(principal, generation)
 
-            return user
-        except JWTError:
-            raise HTTPException(
+    if principal.token_version != payload.get("tv"):
+        raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorize user"
-        )
\ No newline at end of file
+            detail="Token has been revoked"
+        )
+    return principal
+
+
+async def get_token_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Principal for read-only routes, built from the token claims alone
+
+    A revoked token still reads until it expires, unless this worker already
+    has the user's current token version cached. Set AUTH_CLAIMS_ONLY_READS=false
+    to check every read like get_current_user does.
+    """
+    if not AUTH_CLAIMS_ONLY_READS:
+        return await get_current_user(credentials, db)
+    payload = _decode_token(credentials)
+    cached = principals.get(payload["uid"])
+    if cached is not None and cached.token_version != payload.get("tv"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
+        )
+    return Principal(id=payload["uid"], email=payload["sub"], token_version=payload.get("tv"))
@@ -0,0 +1,29 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services import response_cache
+
+
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class CacheInvalidationMiddleware:
+    """Holds back a write's response until the cache entries it invalidated are gone
+
+    A client that re-reads right after a write then can't be served the old
+    body and ETag from the cache.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_after_flush(message: Message):
+            if message["type"] == "http.response.start":
+                await response_cache.flush()
+            await send(message)
+
+        await self.app(scope, receive, send_after_flush)
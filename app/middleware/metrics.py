@@ -0,0 +1,185 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+
+METRICS_ENABLED = settings.metrics_enabled
+# The same statement run this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = settings.n_plus_one_threshold
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """Database work done on behalf of one request"""
+
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: Counter = Counter()
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    """Request metrics keyed by (method, route template, status)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[tuple, Histogram] = {}
+        self.queries: Dict[tuple, Histogram] = {}
+        self.db_seconds: Dict[tuple, float] = {}
+        self.n_plus_one: Counter = Counter()
+
+    def record(self, labels: tuple, seconds: float, stats: RequestStats, repeated: Optional[str]):
+        with self._lock:
+            if labels not in self.latency:
+                self.latency[labels] = Histogram(LATENCY_BUCKETS)
+                self.queries[labels] = Histogram(QUERY_BUCKETS)
+                self.db_seconds[labels] = 0.0
+            self.latency[labels].observe(seconds)
+            self.queries[labels].observe(stats.queries)
+            self.db_seconds[labels] += stats.db_seconds
+            if repeated is not None:
+                self.n_plus_one[labels[:2]] += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            _render_histogram(lines, "http_request_duration_seconds", "Request latency", self.latency)
+            _render_histogram(lines, "http_request_db_queries", "Database queries per request", self.queries)
+            lines.append("# HELP http_request_db_seconds_total Time spent in database queries")
+            lines.append("# TYPE http_request_db_seconds_total counter")
+            for labels, seconds in self.db_seconds.items():
+                lines.append(f"http_request_db_seconds_total{{{_labels(labels)}}} {seconds}")
+            lines.append("# HELP http_request_n_plus_one_total Requests that repeated one statement at least N_PLUS_ONE_THRESHOLD times")
+            lines.append("# TYPE http_request_n_plus_one_total counter")
+            for (method, route), count in self.n_plus_one.items():
+                lines.append(f'http_request_n_plus_one_total{{method="{method}",route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    method, route, status = labels
+    return f'method="{method}",route="{route}",status="{status}"'
+
+
+def _render_histogram(lines: List[str], name: str, help_text: str, histograms: Dict[tuple, Histogram]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms.items():
+        label_text = _labels(labels)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+        cumulative += histogram.counts[-1]
+        lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label_text}}} {histogram.total}")
+        lines.append(f"{name}_count{{{label_text}}} {cumulative}")
+
+
+registry = Registry()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    stats.db_seconds += time.perf_counter() - started.pop()
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+
+class MetricsMiddleware:
+    """Times each request, counts its queries, and adds a Server-Timing header
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streaming responses pass
+    straight through.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"app;dur={elapsed_ms:.1f}"
+                )
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # the template, not the raw path, keeps label cardinality bounded
+            labels = (scope["method"], route.path if route is not None else "unmatched", status_code)
+            repeated = _repeated_statement(stats)
+            if repeated is not None:
+                logger.warning(
+                    "Possible N+1 in %s %s: statement ran %d times: %s",
+                    labels[0], labels[1], stats.statements[repeated], repeated[:200],
+                )
+            registry.record(labels, time.perf_counter() - started, stats, repeated)
+
+
+def _repeated_statement(stats: RequestStats) -> Optional[str]:
+    if stats.queries < N_PLUS_ONE_THRESHOLD:
+        return None
+    statement, count = stats.statements.most_common(1)[0]
+    return statement if count >= N_PLUS_ONE_THRESHOLD else None
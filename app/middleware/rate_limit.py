@@ -0,0 +1,69 @@
+from typing import List
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.middleware.auth import token_user_id
+from app.services import rate_limit
+
+
+class RateLimitMiddleware:
+    """Turns requests away with 429 before they reach a route or the database
+
+    Each request takes a token from the bucket of its route class (see
+    rate_limit.classify) and its client IP, and, when it carries a valid
+    token, one from the bucket of its class and user too, so rotating
+    accounts doesn't get one client past its IP's limit. Classes with a concurrency limit also turn requests away
+    while that many are already being handled by this process.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not rate_limit.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route_class = rate_limit.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = await rate_limit.admit_rate(route_class, _identities(scope))
+        if retry_after:
+            await _reject(send, "Too many requests, slow down", retry_after)
+            return
+        if not rate_limit.enter(route_class):
+            await _reject(send, "Too many requests in progress, try again shortly", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            rate_limit.leave(route_class)
+
+
+def _identities(scope: Scope) -> List[str]:
+    # behind a proxy, run uvicorn with --proxy-headers so this is the original client
+    client = scope.get("client")
+    identities = [f"ip:{client[0] if client else 'unknown'}"]
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            user_id = token_user_id(value.decode("latin-1"))
+            if user_id is not None:
+                identities.append(f"user:{user_id}")
+            break
+    return identities
+
+
+async def _reject(send: Send, detail: str, retry_after: float):
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", rate_limit.retry_after_header(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
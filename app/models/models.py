@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.database import Base
@@ -11,8 +11,11 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     username = Column(String, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # bumped when credentials change; tokens carrying an older version are rejected
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at = Column(DateTime(timezone=True))
     
 
     books = relationship("Book", back_populates="owner")
@@ -24,11 +27,164 @@ class Book(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False, index=True)
     author = Column(String, nullable=False, index=True)
+    # the Author this spelling resolves to, set by every book write
+    author_id = Column(Integer, ForeignKey("authors.id"), index=True)
     description = Column(Text)
     isbn = Column(String, unique=True, index=True)
     price = Column(Float)
+    # sha256 of the stored book file and cover image, see StoredFile
+    file_path = Column(String, ForeignKey("stored_files.sha256"))
+    cover_image = Column(String, ForeignKey("stored_files.sha256"))
+    # what each is served as: kept per book, since the same bytes can come from
+    # several uploads that don't agree on a type
+    file_content_type = Column(String)
+    cover_content_type = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     owner = relationship("User", back_populates="books")
+
+    __table_args__ = (
+        # keyset pagination seeks on (created_at, id)
+        Index("ix_books_created_at_id", "created_at", "id"),
+        # and a user's library on (user_id, created_at, id)
+        Index("ix_books_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+    # fetch created_at/updated_at with RETURNING on flush, so change snapshots need no extra SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    filename = Column(String)
+    file_path = Column(String, nullable=False)
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    batch_size = Column(Integer, nullable=False)
+    conflict_policy = Column(String(16), nullable=False, default="fail")
+    total_bytes = Column(Integer, nullable=False, default=0)
+    bytes_processed = Column(Integer, nullable=False, default=0)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    rows_inserted = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    rows_skipped = Column(Integer, nullable=False, default=0)
+    resumed_from_row = Column(Integer, nullable=False, default=0)
+    rejected = Column(Text)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    resumed_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    owner = relationship("User")
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    # sha256 of the opaque token; the token itself is only ever held by the client
+    token_hash = Column(String(64), unique=True, nullable=False)
+    # every token rotated from the same login shares a family, so a replay can revoke them all
+    family_id = Column(String(32), index=True, nullable=False)
+    token_version = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    used_at = Column(DateTime(timezone=True))
+    revoked_at = Column(DateTime(timezone=True))
+
+    owner = relationship("User")
+
+
+class StoredFile(Base):
+    """Uploaded content, stored once per distinct sha256 whoever uploads it"""
+    __tablename__ = "stored_files"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    # as the first upload declared it; responses use the type on the book instead
+    content_type = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserLibraryStats(Base):
+    """Per-user book count and inventory value, kept current by every book write"""
+    __tablename__ = "user_library_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0, index=True)
+
+
+class Author(Base):
+    """One author, however many spellings of the name books use, see AuthorAlias"""
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    # the first spelling seen
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    aliases = relationship("AuthorAlias", back_populates="author", order_by="AuthorAlias.normalized_name")
+
+
+class AuthorAlias(Base):
+    """A normalized spelling of an author's name; every author has at least one"""
+    __tablename__ = "author_aliases"
+
+    normalized_name = Column(String, primary_key=True)
+    author_id = Column(Integer, ForeignKey("authors.id"), nullable=False, index=True)
+    # the first spelling seen that normalizes to this
+    name = Column(String, nullable=False)
+
+    author = relationship("Author", back_populates="aliases")
+
+    __table_args__ = (
+        # lets LIKE 'prefix%' use the index on PostgreSQL whatever the database collation
+        Index("ix_author_aliases_normalized_name_prefix", "normalized_name",
+              postgresql_ops={"normalized_name": "varchar_pattern_ops"}),
+    )
+
+
+class AuthorStats(Base):
+    """Per-author book count and price totals, kept current by every book write"""
+    __tablename__ = "author_stats"
+
+    author_id = Column(Integer, ForeignKey("authors.id"), primary_key=True, autoincrement=False)
+    book_count = Column(Integer, nullable=False, default=0, index=True)
+    priced_count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+
+class PriceBucketStats(Base):
+    """Books per price range, see STATS_PRICE_BUCKETS; bucket -1 holds books without a price
+
+    A range's totals are spread over several shard rows, summed on read, so
+    concurrent writes to books in one price range don't all queue on a single row.
+    A single shard can go negative when a book leaves a range through another shard.
+    """
+    __tablename__ = "price_bucket_stats"
+
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(Integer, primary_key=True, autoincrement=False, default=0, server_default="0")
+    book_count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+
+class BookChangeLog(Base):
+    """The book changes of one committed transaction, so other processes can follow them, see book_events"""
+    __tablename__ = "book_change_log"
+
+    id = Column(Integer, primary_key=True)
+    # the process that made the changes; it applied them itself when they committed
+    origin = Column(String, nullable=False)
+    # JSON list of [before, after] snapshot pairs
+    changes = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
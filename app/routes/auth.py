@@ -1,21 +1,21 @@
 from typing import Annotated
 from starlette import status
 from pydantic import EmailStr
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends
-from app.database.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException
+from app.database.database import get_async_db
 from app.models.models import User
 from datetime import datetime, timedelta
 from fastapi.responses import JSONResponse
-from app.schemas.schemas import Create_User, User_log_In, User_delete
-from app.middleware.auth import get_current_user, create_access_token, authenticate_user, bcrypt_context
+from app.schemas.schemas import Create_User, User_log_In, User_delete, Refresh_Token
+from app.middleware.auth import get_current_user, create_access_token, authenticate_user
+from app.services import passwords, refresh_tokens
+from app.services.refresh_tokens import InvalidRefreshToken
+from app.config import settings
 
 
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES')
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
 
 router = APIRouter(
@@ -26,8 +26,8 @@ router = APIRouter(
 
 
 @router.post("/sign_up")
-def sign_up(user: Create_User , db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def sign_up(user: Create_User , db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user is not None:
         return JSONResponse(content={
                     "message": "User Already Existed", 
@@ -36,11 +36,11 @@ def sign_up(user: Create_User , db: Session = Depends(get_db)):
     create_user = User(
         username = user.username,
         email = user.email,
-        hashed_password = bcrypt_context.hash(user.password),
+        hashed_password = await passwords.hash_password(user.password),
     )
     db.add(create_user)
-    db.commit()
-    db.refresh(create_user)
+    await db.commit()
+    await db.refresh(create_user)
     return JSONResponse(content={
                     "message": "User Account Created Successfully",
                     "data": {"id": create_user.id, "name": create_user.username, "email": create_user.email}, 
@@ -49,34 +49,57 @@ def sign_up(user: Create_User , db: Session = Depends(get_db)):
 
 
 @router.post("/log_in")
-def log_In(user: User_log_In, db: Session = Depends(get_db)):
+async def log_In(user: User_log_In, db: AsyncSession = Depends(get_async_db)):
 
-    user = authenticate_user(user.email, user.password, db)
+    user = await authenticate_user(user.email, user.password, db)
     if not user: 
         return JSONResponse(content={
                     "message": "User Does not exist", 
                     "status": 404},
                     status_code=status.HTTP_404_NOT_FOUND)
-    token = create_access_token(user.email , timedelta(int(ACCESS_TOKEN_EXPIRE_MINUTES)))
+    token = create_access_token(user, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    refresh_token = refresh_tokens.issue(db, user)
+    await db.commit()
 
     return JSONResponse(content={
         'message':"login succefully","status_code":200,
         "access_token":token,
+        "refresh_token":refresh_token,
+        "data":{"id" :user.id,  "email":user.email}},
+                            status_code=status.HTTP_200_OK)
+
+
+@router.post("/refresh")
+async def refresh(body: Refresh_Token, db: AsyncSession = Depends(get_async_db)):
+    """Trade a refresh token for a new access token and the next refresh token, without a password"""
+    try:
+        user, refresh_token = await refresh_tokens.rotate(db, body.refresh_token)
+    except InvalidRefreshToken as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    token = create_access_token(user, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+    return JSONResponse(content={
+        'message':"token refreshed succefully","status_code":200,
+        "access_token":token,
+        "refresh_token":refresh_token,
         "data":{"id" :user.id,  "email":user.email}},
                             status_code=status.HTTP_200_OK)
 
  
 @router.delete("/delete_user")
-def delet_user(user: User_delete, current_user: Annotated[dict, Depends(get_current_user)],db: Session = Depends(get_db)):
-    delete_user = authenticate_user(current_user.email, user.password, db)
+async def delet_user(user: User_delete, current_user: Annotated[dict, Depends(get_current_user)],db: AsyncSession = Depends(get_async_db)):
+    delete_user = await authenticate_user(current_user.email, user.password, db)
     if delete_user.id == current_user.id:    
-        db_user = db.query(User).filter(User.id == delete_user.id).first()
+        db_user = await db.get(User, delete_user.id)
         db_user.deleted_at = datetime.now()
-        db.commit()
-        db.refresh(db_user) 
+        await db.commit()
+        await db.refresh(db_user) 
         return JSONResponse(content={
         'message':"User Deleted Succefully","status_code":200,
-        "data":{"id" :user.id,  "email":user.email}},
+        "data":{"id" :db_user.id,  "email":db_user.email}},
                             status_code=status.HTTP_200_OK)
     else:
         return JSONResponse(content={"message": "You don't have permission to perform this action", "status": 401}, status_code=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
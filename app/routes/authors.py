@@ -0,0 +1,124 @@
+from typing import Annotated, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.database import get_async_db, get_async_read_db
+from app.models.models import Author, AuthorAlias, AuthorStats
+from app.middleware.auth import get_current_user
+from app.schemas.schemas import AuthorAliasCreate, AuthorListResponse, AuthorResponse
+from app.services import authors, response_cache
+from app.services.principals import Principal
+
+router = APIRouter(prefix="/authors", tags=["authors"])
+
+
+async def _author_response(db: AsyncSession, author_id: int) -> Optional[dict]:
+    row = (await db.execute(
+        select(Author, AuthorStats.book_count)
+        .outerjoin(AuthorStats, AuthorStats.author_id == Author.id)
+        .where(Author.id == author_id)
+    )).first()
+    if row is None:
+        return None
+    author, book_count = row
+    aliases = (await db.execute(
+        select(AuthorAlias.name).where(AuthorAlias.author_id == author_id).order_by(AuthorAlias.normalized_name)
+    )).scalars().all()
+    return {"id": author.id, "name": author.name, "book_count": book_count or 0, "aliases": aliases}
+
+
+@router.get("/", response_model=AuthorListResponse)
+async def list_authors(
+    q: Optional[str] = Query(None, description="Name prefix to complete, in any spelling"),
+    limit: int = Query(10, ge=1, le=100, description="Authors per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Authors in name order, or those with a spelling starting with q
+
+    Pages walk the alias prefix index, so a page costs the same however many
+    books or authors there are.
+    """
+    prefix = authors.normalize(q) if q else None
+    dialect = db.get_bind().dialect.name
+    matched: Dict[int, AuthorAlias] = {}
+    position = cursor
+    exhausted = False
+    # one author can have several matching spellings, so keep reading until there are enough authors
+    while len(matched) < limit:
+        query = select(AuthorAlias).order_by(AuthorAlias.normalized_name).limit(limit)
+        if prefix:
+            query = query.where(authors.prefix_match(AuthorAlias.normalized_name, prefix, dialect))
+        if position is not None:
+            query = query.where(AuthorAlias.normalized_name > position)
+        aliases = (await db.execute(query)).scalars().all()
+        for alias in aliases:
+            position = alias.normalized_name
+            matched.setdefault(alias.author_id, alias)
+            if len(matched) == limit:
+                break
+        if len(aliases) < limit:
+            exhausted = True
+            break
+
+    rows = (await db.execute(
+        select(Author, AuthorStats.book_count)
+        .outerjoin(AuthorStats, AuthorStats.author_id == Author.id)
+        .where(Author.id.in_(matched))
+    )).all() if matched else []
+    by_id = {author.id: (author, book_count) for author, book_count in rows}
+    return {
+        "items": [
+            {
+                "id": author_id,
+                "name": by_id[author_id][0].name,
+                "book_count": by_id[author_id][1] or 0,
+                "matched": alias.name if prefix else None,
+            }
+            for author_id, alias in matched.items() if author_id in by_id
+        ],
+        "next_cursor": None if exhausted else position,
+    }
+
+
+@router.get("/{author_id}", response_model=AuthorResponse)
+async def get_author(author_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    author = await _author_response(db, author_id)
+    if author is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Author not found"
+        )
+    return author
+
+
+@router.post("/{author_id}/aliases", response_model=AuthorResponse, status_code=status.HTTP_201_CREATED)
+async def add_author_alias(
+    author_id: int,
+    alias: AuthorAliasCreate,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Make another spelling resolve to this author, e.g. a pen name
+
+    Books already filed under that spelling keep their author; this only
+    affects books written from now on and author filters.
+    """
+    if await db.get(Author, author_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Author not found"
+        )
+    normalized = authors.normalize(alias.name)
+    existing = await db.get(AuthorAlias, normalized)
+    if existing is not None and existing.author_id != author_id:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This spelling already belongs to another author"
+        )
+    if existing is None:
+        db.add(AuthorAlias(normalized_name=normalized, author_id=author_id, name=alias.name))
+        await db.commit()
+        # lists filtered by this spelling matched nothing until now
+        response_cache.invalidate_tags([response_cache.author_tag(alias.name)])
+    return await _author_response(db, author_id)
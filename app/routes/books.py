@@ -1,27 +1,54 @@
-from typing import Annotated, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from app.database.database import get_db
-from app.models.models import Book, User
-from app.schemas.schemas import BookCreate, BookUpdate, BookResponse, BookSearch, PaginationParams, PaginatedResponse
-from app.middleware.auth import get_current_user
+import json
+from typing import Annotated, List, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, func, select
+from app.database.database import get_async_db, get_async_read_db, get_async_replica_engine, reads_replica
+from app.models.models import Author, AuthorAlias, AuthorStats, Book, UserLibraryStats
+from app.schemas.schemas import BookBatchResponse, BookCreate, BookUpdate, BookResponse, BookSearch, BookSortField, CatalogStats, ConflictPolicy, ExportFormat, LibraryResponse, PaginationParams, PaginatedResponse, PriceDistribution, SortOrder, SuggestResponse, TopAuthorsResponse, TopUsersResponse
+from app.middleware.auth import get_current_user, get_token_principal
+from app.services import authors, book_batch, book_events, book_export, catalog_stats, library_stats, response_cache, search_index, serialization, suggest
+from app.services.book_events import BookChange, snapshot
+from app.services.book_writes import find_existing_isbns
+from app.services.pagination import InvalidCursor, after_cursor, estimated_count, exact_count, next_cursor, order_books
+from app.services.principals import Principal
+from app.services.search import apply_price_range, apply_search, search_terms
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 @router.post("/", response_model=BookResponse, status_code=status.HTTP_201_CREATED)
 async def create_book(
     book_data: BookCreate,
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    response: Response,
+    on_conflict: ConflictPolicy = Query(ConflictPolicy.fail, description="What to do if the ISBN already exists"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if book_data.isbn:
-        existing_book = db.query(Book).filter(Book.isbn == book_data.isbn).first()
-        if existing_book:
+    existing = (await db.run_sync(find_existing_isbns, [book_data.isbn])).get(book_data.isbn)
+    if existing:
+        if on_conflict == ConflictPolicy.fail:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Book with this ISBN already exists"
             )
+        if on_conflict == ConflictPolicy.overwrite and existing.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+        response.status_code = status.HTTP_200_OK
+        book = await db.get(Book, existing.id)
+        if on_conflict == ConflictPolicy.overwrite:
+            before = snapshot(book)
+            for field, value in book_data.model_dump().items():
+                setattr(book, field, value)
+            await db.flush()
+            book_events.record(db, [BookChange(before, snapshot(book))])
+            await db.commit()
+            await db.refresh(book)
+        return book
+
     db_book = Book(
         title = book_data.title,
         author = book_data.author,
@@ -30,72 +57,398 @@ async def create_book(
         price = book_data.price,
         user_id = current_user.id)
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await db.flush()
+    book_events.record(db, [BookChange(None, snapshot(db_book))])
+    await db.commit()
+    await db.refresh(db_book)
 
     return db_book
 
 
+@router.post("/batch", response_model=BookBatchResponse)
+async def batch_books(
+    request: Request,
+    response: Response,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    atomic: bool = Query(False, description="Apply all operations in one transaction, or none of them"),
+    chunk_size: int = Query(book_batch.BATCH_CHUNK_SIZE, ge=1, le=10000, description="Operations per transaction when not atomic"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create, update and delete books in bulk from a JSON array or NDJSON body"""
+    too_many = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {book_batch.BATCH_MAX_OPERATIONS} operations per batch"
+    )
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            # validated line by line as the body arrives, so it is never held whole
+            operations = []
+            async for item in book_batch.iter_ndjson(request.stream()):
+                if len(operations) == book_batch.BATCH_MAX_OPERATIONS:
+                    raise too_many
+                operations.append(book_batch.parse_operation(item))
+        else:
+            items = json.loads(await request.body())
+            if isinstance(items, dict):
+                items = items.get("operations")
+            if not isinstance(items, list):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Expected a list of operations"
+                )
+            if len(items) > book_batch.BATCH_MAX_OPERATIONS:
+                raise too_many
+            operations = [book_batch.parse_operation(item) for item in items]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body")
+
+    results = await db.run_sync(book_batch.apply_batch, operations, current_user.id, atomic, chunk_size)
+    failed = sum(1 for result in results if result["status"] == "error")
+    applied = sum(1 for result in results if result["status"] not in ("error", "skipped"))
+    if atomic and failed:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+    return {"applied": applied, "failed": failed, "results": results}
+
+
 @router.get("/", response_model=PaginatedResponse)
 async def get_books(
+    request: Request,
+    search: Annotated[BookSearch, Depends()],
     title: Optional[str] = Query(None, description="Search by book title"),
-    author: Optional[str] = Query(None, description="Search by author name"),
-    page: int = Query(1, ge=1, description="Page number (starts from 1)"),
+    page: int = Query(1, ge=1, description="Page number (starts from 1), ignored when a cursor is given"),
     size: int = Query(10, ge=1, le=100, description="Books per page"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    sort: Optional[BookSortField] = Query(None, description="Sort column, defaults to relevance for a search query and created_at otherwise"),
+    order: SortOrder = Query(SortOrder.desc, description="Sort direction"),
+    include_total: bool = Query(False, description="Return an exact total instead of an estimate"),
+    fields: Optional[str] = Query(None, description="Comma-separated book fields to return, e.g. id,title,price"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
+    try:
+        selected = serialization.parse_fields(fields)
+    except serialization.InvalidFields as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    terms = search_terms(search.query)
+    key = response_cache.list_key(
+        query=" ".join(terms) or None,
+        title=title,
+        author=search.author,
+        min_price=search.min_price,
+        max_price=search.max_price,
+        page=None if cursor else page,
+        size=size,
+        cursor=cursor,
+        sort=sort.value if sort else None,
+        order=order.value,
+        include_total=include_total,
+        fields=",".join(selected) if fields else None,
+    )
+    body, generation = await response_cache.lookup(key)
+    if body is None:
+        author_id = await authors.find_id(db, search.author) if search.author else None
+        result, book_ids = await _list_books(db, terms, search, author_id, title, page, size, cursor, sort, order, include_total, selected)
+        tags = response_cache.list_tags(
+            book_ids,
+            title=title,
+            author=search.author,
+            query=" ".join(terms),
+            price_filtered=search.min_price is not None or search.max_price is not None,
+            author_id=author_id,
+        )
+        body = await response_cache.store(
+            key, serialization.dumps(result), tags, generation, from_replica=reads_replica(db)
+        )
+    return response_cache.respond(request, body)
+
 
-    query = db.query(Book)
+async def _list_books(
+    db: AsyncSession,
+    terms: List[str],
+    search: BookSearch,
+    author_id: Optional[int],
+    title: Optional[str],
+    page: int,
+    size: int,
+    cursor: Optional[str],
+    sort: Optional[BookSortField],
+    order: SortOrder,
+    include_total: bool,
+    fields: Tuple[str, ...],
+) -> Tuple[dict, List[int]]:
+    """A PaginatedResponse as plain data, plus the ids of the books on the page
+
+    Only the requested columns are selected, as rows rather than ORM objects,
+    and the page is rendered without building response models.
+    """
+    query = select(Book)
 
     if title:
-        query = query.filter(Book.title == title)
-        total = query.count()
-  
-    if author:
-        query = query.filter(Book.author == author)
-        total = query.count()
+        query = query.where(Book.title == title)
+
+    if search.author:
+        # any spelling of the author's name matches, see app.services.authors
+        query = query.where(authors.books_by_id(author_id))
+
+    query = apply_price_range(query, search.min_price, search.max_price)
+
+    rank = None
+    # an author no book has used yet matches nothing, which the SQL path already answers
+    if terms and sort is None and not cursor and search_index.is_ready() and not (search.author and author_id is None):
+        total, books = search_index.index.search(
+            terms,
+            title=title,
+            author_id=author_id,
+            min_price=search.min_price,
+            max_price=search.max_price,
+            offset=(page - 1) * size,
+            limit=size,
+        )
+        return {
+            "items": serialization.project(books, fields),
+            "total": total,
+            "page": page,
+            "size": size,
+            "pages": (total + size - 1) // size if total else 1,
+            "total_is_estimate": False,
+            "next_cursor": None,
+        }, [book["id"] for book in books]
+
+    if terms:
+        query, rank = apply_search(query, terms, db.get_bind().dialect.name)
+
+    if include_total:
+        total, total_is_estimate = await db.run_sync(exact_count, query), False
+    else:
+        total, total_is_estimate = await db.run_sync(estimated_count, query)
 
-    if title is None and author is None:
-        total = query.count()
- 
+    if rank is not None and sort is None:
+        if cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursors are not supported for relevance-sorted results, use page"
+            )
+        page_query = query.order_by(rank.desc(), Book.id.desc()).offset((page - 1) * size)
+    else:
+        sort = sort or BookSortField.created_at
+        page_query = order_books(query, sort, order)
+        if cursor:
+            try:
+                page_query = after_cursor(db, page_query, cursor, sort, order)
+            except InvalidCursor as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+        else:
+            page_query = page_query.offset((page - 1) * size)
 
-    offset = (page - 1) * size
-    books = query.offset(offset).limit(size).all()
+    books, has_more = await _fetch_page(db, page_query, fields, sort, size)
     pages = (total + size - 1) // size if total else 1
 
+    return {
+        "items": serialization.project(books, fields),
+        "total": total,
+        "page": page,
+        "size": size,
+        "pages": pages,
+        "total_is_estimate": total_is_estimate,
+        "next_cursor": next_cursor(books, has_more, sort, order) if sort else None,
+    }, [book.id for book in books]
 
-    
-    return PaginatedResponse(
-        items=books,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
-    )
+async def _fetch_page(
+    db: AsyncSession,
+    page_query,
+    fields: Tuple[str, ...],
+    sort: Optional[BookSortField],
+    size: int,
+) -> Tuple[list, bool]:
+    """Up to size rows of just the columns needed, and whether more follow"""
+    # the cursor needs id and the sort column even when they are not requested
+    needed = set(fields) | {"id"} | ({sort.value} if sort else set())
+    columns = serialization.book_columns(name for name in serialization.BOOK_FIELDS if name in needed)
+
+    # one extra row tells us whether there is a next page without counting
+    books = (await db.execute(page_query.with_only_columns(*columns).limit(size + 1))).all()
+    return books[:size], len(books) > size
+
+
+@router.get("/export")
+async def export_books(
+    request: Request,
+    search: Annotated[BookSearch, Depends()],
+    title: Optional[str] = Query(None, description="Export only books with this exact title"),
+    format: ExportFormat = Query(ExportFormat.ndjson, description="ndjson or csv"),
+):
+    """Stream every matching book, gzip-compressed when the client accepts it"""
+    query = select(Book)
+    if title:
+        query = query.where(Book.title == title)
+    if search.author:
+        query = query.where(authors.books_by(search.author))
+    query = apply_price_range(query, search.min_price, search.max_price)
+    terms = search_terms(search.query)
+    if terms:
+        query, _ = apply_search(query, terms, get_async_replica_engine().dialect.name)
+    query = query.order_by(Book.id)
+
+    body = book_export.export_books(query, format)
+    headers = {"Content-Disposition": f'attachment; filename="books.{format.value}"'}
+    if book_export.accepts_gzip(request.headers.get("accept-encoding", "")):
+        body = book_export.gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(body, media_type=book_export.MEDIA_TYPES[format], headers=headers)
+
+
+@router.get("/suggest", response_model=SuggestResponse, response_class=serialization.FastJSONResponse)
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=200, description="What has been typed so far"),
+    limit: int = Query(10, ge=1, le=50, description="Number of suggestions"),
+    kind: Optional[Literal["title", "author"]] = Query(None, description="Only suggest titles or only authors"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Titles and authors starting with q, those with the most books first
+
+    Case, accents and punctuation are ignored. Answered from memory once the
+    suggest index is built, from the database until then; the database has no
+    normalized titles, so there titles only ignore case, while authors are
+    still matched on their normalized aliases.
+    """
+    if suggest.is_ready():
+        return {"items": suggest.index.suggest(suggest.query_prefix(q), limit, kind)}
+
+    items = []
+    if kind != "author":
+        book_count = func.count().label("book_count")
+        rows = (await db.execute(
+            select(Book.title, book_count)
+            # ILIKE rather than lower() LIKE, so PostgreSQL can use the title's trigram index
+            .where(Book.title.ilike(_like_escape(q.strip()) + "%", escape="/"))
+            .group_by(Book.title)
+            .order_by(book_count.desc(), Book.title)
+            .limit(limit)
+        )).all()
+        items.extend({"text": title, "kind": "title", "book_count": count} for title, count in rows)
+    if kind != "title":
+        prefix = authors.normalize(q)
+        rows = (await db.execute(
+            select(Author.name, AuthorStats.book_count)
+            .join(AuthorStats, AuthorStats.author_id == Author.id)
+            .where(
+                Author.id.in_(select(AuthorAlias.author_id).where(
+                    authors.prefix_match(AuthorAlias.normalized_name, prefix, db.get_bind().dialect.name)
+                )),
+                AuthorStats.book_count > 0,
+            )
+            .order_by(AuthorStats.book_count.desc(), Author.name)
+            .limit(limit)
+        )).all()
+        items.extend({"text": name, "kind": "author", "book_count": count} for name, count in rows)
+    items.sort(key=lambda item: -item["book_count"])
+    return {"items": items[:limit]}
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+@router.get("/stats", response_model=CatalogStats)
+async def get_catalog_stats(db: AsyncSession = Depends(get_async_read_db)):
+    """Catalog totals, summed from the price distribution rather than counted from books"""
+    buckets = (await db.execute(catalog_stats.price_buckets())).all()
+    book_count = sum(bucket.book_count for bucket in buckets)
+    unpriced = sum(bucket.book_count for bucket in buckets if bucket.bucket == catalog_stats.UNPRICED)
+    total_value = sum(bucket.total_value for bucket in buckets)
+    priced_count = book_count - unpriced
+    return {
+        "book_count": book_count,
+        "priced_count": priced_count,
+        "author_count": await db.scalar(select(func.count()).select_from(AuthorStats).where(AuthorStats.book_count > 0)),
+        "total_value": round(total_value, 2),
+        "average_price": round(total_value / priced_count, 2) if priced_count else None,
+    }
+
+
+@router.get("/stats/prices", response_model=PriceDistribution)
+async def get_price_distribution(db: AsyncSession = Depends(get_async_read_db)):
+    """Books per price range, see STATS_PRICE_BUCKETS, then the books without a price"""
+    buckets = (await db.execute(catalog_stats.price_buckets())).all()
+    return {"buckets": catalog_stats.distribution(buckets)}
+
+
+@router.get("/stats/authors", response_model=TopAuthorsResponse)
+async def get_top_authors(
+    limit: int = Query(10, ge=1, le=100, description="Number of authors to return"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Authors with the most titles, every spelling of a name counted together"""
+    rows = (await db.execute(
+        select(AuthorStats, Author.name)
+        .join(Author, Author.id == AuthorStats.author_id)
+        .where(AuthorStats.book_count > 0)
+        .order_by(AuthorStats.book_count.desc(), AuthorStats.author_id)
+        .limit(limit)
+    )).all()
+    return {"items": [
+        {
+            "author_id": stats.author_id,
+            "author": name,
+            "book_count": stats.book_count,
+            "priced_count": stats.priced_count,
+            "total_value": round(stats.total_value, 2),
+            "average_price": round(stats.total_value / stats.priced_count, 2) if stats.priced_count else None,
+        }
+        for stats, name in rows
+    ]}
+
+
+@router.get("/stats/users", response_model=TopUsersResponse)
+async def get_top_users(
+    limit: int = Query(10, ge=1, le=100, description="Number of users to return"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Users with the highest inventory value"""
+    users = (await db.execute(
+        select(UserLibraryStats)
+        .where(UserLibraryStats.book_count > 0)
+        .order_by(UserLibraryStats.total_value.desc(), UserLibraryStats.user_id)
+        .limit(limit)
+    )).scalars().all()
+    return {"items": [library_stats.as_dict(user, user.user_id) for user in users]}
 
 @router.get("/{book_id}", response_model=BookResponse)
-async def get_book(book_id: int, db: Session = Depends(get_db)):
-    
-    book = db.query(Book).filter(Book.id == book_id).first()
-    
-    if not book:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Book not found"
+async def get_book(book_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+
+    key = response_cache.book_tag(book_id)
+    body, generation = await response_cache.lookup(key)
+    if body is None:
+        book = await db.get(Book, book_id)
+
+        if not book:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Book not found"
+            )
+
+        body = await response_cache.store(
+            key, BookResponse.model_validate(book), [key], generation, from_replica=reads_replica(db)
         )
-    
-    return book
+
+    return response_cache.respond(request, body)
 
 
 @router.put("/{book_id}", response_model=BookResponse)
 async def update_book(
     book_id: int,
     book_data: BookUpdate,
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db)
 ):
 
-    book = db.query(Book).filter(Book.id == book_id).first()
+    book = await db.get(Book, book_id)
     
     if not book:
         raise HTTPException(
@@ -111,19 +464,21 @@ async def update_book(
     
     # Check if ISBN already exists (if changing)
     if book_data.isbn and book_data.isbn != book.isbn:
-        existing_book = db.query(Book).filter(Book.isbn == book_data.isbn).first()
-        if existing_book:
+        if await db.run_sync(find_existing_isbns, [book_data.isbn]):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Book with this ISBN already exists"
             )
     
     # Update book data
-    for field, value in book_data.dict(exclude_unset=True).items():
+    before = snapshot(book)
+    for field, value in book_data.model_dump(exclude_unset=True).items():
         setattr(book, field, value)
     
-    db.commit()
-    db.refresh(book)
+    await db.flush()
+    book_events.record(db, [BookChange(before, snapshot(book))])
+    await db.commit()
+    await db.refresh(book)
     
     
     return book
@@ -132,11 +487,11 @@ async def update_book(
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_book(
     book_id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db)
 ):
   
-    book = db.query(Book).filter(Book.id == book_id).first()
+    book = await db.get(Book, book_id)
     
     if not book:
         raise HTTPException(
@@ -150,16 +505,61 @@ async def delete_book(
             detail="Not enough permissions"
         )
     
-    db.delete(book)
-    db.commit()
+    book_events.record(db, [BookChange(snapshot(book), None)])
+    await db.delete(book)
+    await db.commit()
     return {"message" : "Book Deleted Successfully"}
 
 
-@router.get("/my/books", response_model=List[BookResponse])
+@router.get("/my/books", response_model=LibraryResponse, response_class=serialization.FastJSONResponse)
 async def get_my_books(
-    current_user: Annotated[dict, Depends(get_current_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[Principal, Depends(get_token_principal)],
+    search: Annotated[BookSearch, Depends()],
+    title: Optional[str] = Query(None, description="Search by book title"),
+    size: int = Query(20, ge=1, le=100, description="Books per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    sort: BookSortField = Query(BookSortField.created_at, description="Sort column"),
+    order: SortOrder = Query(SortOrder.desc, description="Sort direction"),
+    fields: Optional[str] = Query(None, description="Comma-separated book fields to return, e.g. id,title,price"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    
-    books = db.query(Book).filter(Book.user_id == current_user.id).all()
-    return books
+    """The caller's books a page at a time, with their library's count and inventory value
+
+    The default created_at order seeks on the (user_id, created_at, id) index.
+    """
+    try:
+        selected = serialization.parse_fields(fields)
+    except serialization.InvalidFields as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    query = select(Book).where(Book.user_id == current_user.id)
+    if title:
+        query = query.where(Book.title == title)
+    if search.author:
+        query = query.where(authors.books_by(search.author))
+    query = apply_price_range(query, search.min_price, search.max_price)
+    terms = search_terms(search.query)
+    if terms:
+        query, _ = apply_search(query, terms, db.get_bind().dialect.name)
+
+    page_query = order_books(query, sort, order)
+    if cursor:
+        try:
+            page_query = after_cursor(db, page_query, cursor, sort, order)
+        except InvalidCursor as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    books, has_more = await _fetch_page(db, page_query, selected, sort, size)
+    stats = await db.get(UserLibraryStats, current_user.id)
+
+    return serialization.FastJSONResponse({
+        "items": serialization.project(books, selected),
+        "size": size,
+        "next_cursor": next_cursor(books, has_more, sort, order),
+        "stats": library_stats.as_dict(stats, current_user.id),
+    })
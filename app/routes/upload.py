@@ -1,43 +1,263 @@
-import csv
-import io
-from typing import Annotated
-from fastapi import APIRouter, Depends, UploadFile, File
+import mimetypes
+from typing import Annotated, Callable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, status
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.database import get_db
-from app.models.models import Book, User
+from app.database.database import get_async_db, get_async_read_db, get_db
+from app.models.models import Book, ImportJob, StoredFile
 from app.middleware.auth import get_current_user
+from app.schemas.schemas import BookResponse, ConflictPolicy, ImportJobResponse
+from app.services import book_events, import_jobs, storage, thumbnails
+from app.services.book_events import BookChange, snapshot
+from app.services.file_responses import StoredFileResponse
+from app.services.book_import import IMPORT_BATCH_SIZE, ImportFormatError, import_books
+from app.services.principals import Principal
 
 router = APIRouter(prefix="/upload", tags=["file upload"])
 
 @router.post("/books/upload")
 def upload_books_sync(
-    current_user: Annotated[User, Depends(get_current_user)], 
-    file: UploadFile = File(...), 
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    file: UploadFile = File(...),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000, description="Rows per insert batch"),
+    background: bool = Query(False, description="Queue the import as a job and return its id right away"),
+    on_conflict: ConflictPolicy = Query(ConflictPolicy.fail, description="What to do with rows whose ISBN already exists"),
     db: Session = Depends(get_db)
 ):
+    if background:
+        job = import_jobs.create_job(db, current_user.id, file.file, file.filename, batch_size, on_conflict)
+        import_jobs.submit_job(job.id)
+        return JSONResponse(
+            content=jsonable_encoder(import_jobs.job_progress(job)),
+            status_code=status.HTTP_202_ACCEPTED
+        )
+
+    try:
+        result = import_books(db, file.file, current_user.id, batch_size=batch_size, on_conflict=on_conflict)
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return result.as_dict()
+
+
+def _get_own_job(job_id: str, current_user: Principal, db: Session) -> ImportJob:
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found"
+        )
+    if job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return job
+
+
+@router.get("/jobs", response_model=List[ImportJobResponse])
+def list_import_jobs(
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    jobs = (
+        db.query(ImportJob)
+        .filter(ImportJob.user_id == current_user.id)
+        .order_by(ImportJob.created_at.desc())
+        .limit(50)
+        .all()
+    )
+    return [import_jobs.job_progress(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}", response_model=ImportJobResponse)
+def get_import_job(
+    job_id: str,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    return import_jobs.job_progress(_get_own_job(job_id, current_user, db))
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=ImportJobResponse)
+def cancel_import_job(
+    job_id: str,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    job = import_jobs.request_cancel(db, _get_own_job(job_id, current_user, db))
+    return import_jobs.job_progress(job)
+
+
+# the body is read straight off the request, so describe it for the docs by hand
+UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            },
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+async def _get_own_book(book_id: int, current_user: Principal, db: AsyncSession) -> Book:
+    book = await db.get(Book, book_id)
+    if not book:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Book not found"
+        )
+    if book.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return book
+
+
+async def _attach_upload(
+    request: Request,
+    book: Book,
+    column: str,
+    type_column: str,
+    db: AsyncSession,
+    allowed_types: Optional[tuple] = None,
+    max_bytes: int = storage.MAX_UPLOAD_BYTES,
+    identify: Optional[Callable[[bytes], str]] = None,
+) -> Book:
     try:
+        upload = await storage.store_upload(
+            storage.UploadStream(request, allowed_types=allowed_types), max_bytes, identify
+        )
+    except storage.UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except storage.InvalidUpload as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    # identical content is stored once, whoever uploaded it first
+    if await db.get(StoredFile, upload.sha256) is None:
+        try:
+            async with db.begin_nested():
+                db.add(StoredFile(sha256=upload.sha256, size=upload.size, content_type=upload.content_type))
+        except IntegrityError:
+            pass
+
+    before = snapshot(book)
+    setattr(book, column, upload.sha256)
+    setattr(book, type_column, upload.content_type)
+    await db.flush()
+    book_events.record(db, [BookChange(before, snapshot(book))])
+    await db.commit()
+    await db.refresh(book)
+    return book
+
+
+async def _get_stored_file(sha256: Optional[str], db: AsyncSession) -> StoredFile:
+    stored = await db.get(StoredFile, sha256) if sha256 else None
+    if stored is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return stored
+
+
+@router.post("/books/{book_id}/file", response_model=BookResponse, openapi_extra=UPLOAD_BODY)
+async def upload_book_file(
+    book_id: int,
+    request: Request,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Attach the book's file (PDF, EPUB, ...) as a multipart "file" field or a raw body"""
+    book = await _get_own_book(book_id, current_user, db)
+    return await _attach_upload(request, book, "file_path", "file_content_type", db)
+
+
+@router.post("/books/{book_id}/cover", response_model=BookResponse, openapi_extra=UPLOAD_BODY)
+async def upload_book_cover(
+    book_id: int,
+    request: Request,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Attach a JPEG, PNG, WebP or GIF cover image; resized variants are rendered in the background"""
+    book = await _get_own_book(book_id, current_user, db)
+    book = await _attach_upload(
+        request, book, "cover_image", "cover_content_type", db,
+        storage.COVER_TYPES, storage.MAX_COVER_BYTES, storage.identify_cover,
+    )
+    thumbnails.enqueue(book.cover_image)
+    return book
+
+
+@router.get("/books/{book_id}/file")
+async def download_book_file(
+    book_id: int,
+    request: Request,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """The book's file for its owner; supports Range requests"""
+    book = await _get_own_book(book_id, current_user, db)
+    stored = await _get_stored_file(book.file_path, db)
+    content_type = book.file_content_type or "application/octet-stream"
+    filename = f"book-{book_id}{mimetypes.guess_extension(content_type) or ''}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StoredFileResponse(request, stored.sha256, stored.size, content_type, headers)
+
+
+@router.get("/books/{book_id}/cover")
+async def download_book_cover(
+    book_id: int,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1, description="Longest edge in pixels; served from the nearest rendered variant"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """The cover image, or a resized variant of it
+
+    While no variant has been rendered yet, a placeholder of the requested
+    size is returned with X-Thumbnail-Pending set.
+    """
+    book = await db.get(Book, book_id)
+    stored = await _get_stored_file(book.cover_image if book else None, db)
+    if size is None:
+        # only types identify_cover found in the image itself are served inline
+        content_type = book.cover_content_type if book.cover_content_type in storage.COVER_TYPES else "application/octet-stream"
+        return StoredFileResponse(request, stored.sha256, stored.size, content_type, {"Content-Disposition": "inline"})
 
-        contents = file.file.read().decode("utf-8")
-        reader = csv.DictReader(io.StringIO(contents))
-
-        total_records = 0
-        for row in reader:
-            book = Book(
-                user_id = current_user.id,
-                title=row["title"],
-                author=row["author"],
-                description=row.get("description"),
-                isbn=row["isbn"],
-                price=float(row["price"])
-            )
-            db.add(book)
-            db.commit()
-            total_records += 1
-         
-
-        db.refresh(book)
-
-
-        return {"inserted_records": total_records}
-    except Exception as e:
-        return {"error": str(e)}
+    served, wanted = await thumbnails.nearest(stored.sha256, size)
+    if served is None:
+        return Response(
+            content=thumbnails.placeholder(wanted),
+            media_type="image/svg+xml",
+            headers={
+                "Cache-Control": "no-store", "Retry-After": "1", "X-Thumbnail-Pending": "true",
+                "X-Content-Type-Options": "nosniff",
+            },
+        )
+    key = thumbnails.derivative_key(stored.sha256, served)
+    headers = {"Content-Disposition": "inline", "X-Thumbnail-Size": str(served)}
+    if served != wanted:
+        # a closer size is on its way, so don't let clients keep this one
+        headers.update({"Cache-Control": "no-store", "X-Thumbnail-Pending": "true"})
+    return StoredFileResponse(request, key, await storage.backend.size(key), thumbnails.media_type(), headers)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Annotated, Literal, Optional, List, Union
 from datetime import datetime
+from enum import Enum
+from app.services.isbn import normalize_isbn
 
 
 class Create_User(BaseModel):
@@ -17,6 +19,10 @@ class User_delete(BaseModel):
     password : str
 
 
+class Refresh_Token(BaseModel):
+    refresh_token: str
+
+
 class Current_User(BaseModel):
     email : EmailStr  
 
@@ -37,17 +43,30 @@ class BookCreate(BaseModel):
     isbn: Optional[str] = None
     price: Optional[float] = Field(None, ge=0)
 
+    _normalize_isbn = field_validator("isbn")(normalize_isbn)
+
 
 class BookUpdate(BookBase):
     title: Optional[str] = Field(None, min_length=1, max_length=200)
     author: Optional[str] = Field(None, min_length=1, max_length=100)
     price: Optional[float] = Field(None, ge=0)
 
+    _normalize_isbn = field_validator("isbn")(normalize_isbn)
+
+
+class ConflictPolicy(str, Enum):
+    """What to do when a book's ISBN is already in the catalog"""
+    skip = "skip"
+    overwrite = "overwrite"
+    fail = "fail"
+
 
 class BookResponse(BookBase):
     id: int
+    author_id: Optional[int] = None
     user_id: int
     file_path: Optional[str] = None
+    cover_image: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     
@@ -55,6 +74,22 @@ class BookResponse(BookBase):
         from_attributes = True
 
 
+class BookFields(BaseModel):
+    """A book in a listing: only the fields named in ?fields=, or all of BookResponse's without it"""
+    id: Optional[int] = None
+    title: Optional[str] = None
+    author: Optional[str] = None
+    description: Optional[str] = None
+    isbn: Optional[str] = None
+    price: Optional[float] = None
+    author_id: Optional[int] = None
+    user_id: Optional[int] = None
+    file_path: Optional[str] = None
+    cover_image: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 # Search and Pagination Schemas
 class BookSearch(BaseModel):
     query: Optional[str] = None
@@ -63,14 +98,175 @@ class BookSearch(BaseModel):
     max_price: Optional[float] = None
 
 
+class BookSortField(str, Enum):
+    created_at = "created_at"
+    id = "id"
+    title = "title"
+    author = "author"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class PaginationParams(BaseModel):
     page: int = Field(1, ge=1)
     size: int = Field(10, ge=1, le=100)
 
 
 class PaginatedResponse(BaseModel):
-    items: List[BookResponse]
+    items: List[BookFields]
     total: int
     page: int
     size: int
     pages: int
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
+
+
+class Suggestion(BaseModel):
+    text: str
+    kind: Literal["title", "author"]
+    book_count: int
+
+
+class SuggestResponse(BaseModel):
+    items: List[Suggestion]
+
+
+class LibraryStats(BaseModel):
+    user_id: int
+    book_count: int
+    total_value: float
+
+
+class LibraryResponse(BaseModel):
+    items: List[BookFields]
+    size: int
+    next_cursor: Optional[str] = None
+    stats: LibraryStats
+
+
+# Catalog Stats Schemas
+class CatalogStats(BaseModel):
+    book_count: int
+    priced_count: int
+    author_count: int
+    total_value: float
+    average_price: Optional[float] = None
+
+
+class PriceBucket(BaseModel):
+    # both None for the bucket of books without a price; max_price None for the last range
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    book_count: int
+    total_value: float
+
+
+class PriceDistribution(BaseModel):
+    buckets: List[PriceBucket]
+
+
+class AuthorTotals(BaseModel):
+    author_id: int
+    author: str
+    book_count: int
+    priced_count: int
+    total_value: float
+    average_price: Optional[float] = None
+
+
+class TopAuthorsResponse(BaseModel):
+    items: List[AuthorTotals]
+
+
+class TopUsersResponse(BaseModel):
+    items: List[LibraryStats]
+
+
+# Author Schemas
+class AuthorSummary(BaseModel):
+    id: int
+    name: str
+    book_count: int
+    # the spelling that matched the autocomplete prefix
+    matched: Optional[str] = None
+
+
+class AuthorListResponse(BaseModel):
+    items: List[AuthorSummary]
+    next_cursor: Optional[str] = None
+
+
+class AuthorResponse(BaseModel):
+    id: int
+    name: str
+    book_count: int
+    aliases: List[str]
+
+
+class AuthorAliasCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+
+
+# Batch Write Schemas
+class BookBatchCreate(BaseModel):
+    op: Literal["create"]
+    book: BookCreate
+
+
+class BookBatchUpdate(BaseModel):
+    op: Literal["update"]
+    id: int
+    book: BookUpdate
+
+
+class BookBatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+
+BookBatchOperation = Annotated[Union[BookBatchCreate, BookBatchUpdate, BookBatchDelete], Field(discriminator="op")]
+
+
+class BookBatchResult(BaseModel):
+    index: int
+    op: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+    book: Optional[BookResponse] = None
+
+
+class BookBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: List[BookBatchResult]
+
+
+# Import Job Schemas
+class ImportJobResponse(BaseModel):
+    id: str
+    status: str
+    filename: Optional[str] = None
+    rows_processed: int
+    rows_inserted: int
+    rows_failed: int
+    rows_updated: int
+    rows_skipped: int
+    conflict_policy: str
+    progress: float
+    throughput: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    rejected: List[dict] = []
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
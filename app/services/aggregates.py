@@ -0,0 +1,46 @@
+from typing import List, Union
+
+from sqlalchemy import Table, insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+
+def dialect_name(db: Union[Session, Connection]) -> str:
+    return (db.get_bind() if isinstance(db, Session) else db).dialect.name
+
+
+def add(db: Union[Session, Connection], table: Table, rows: List[dict]):
+    """Add each row's values onto the row with the same primary key, creating it if missing
+
+    An additive upsert, so concurrent writers to the same key never lose an update.
+    """
+    if not rows:
+        return
+    keys = [column.name for column in table.primary_key.columns]
+    values = [name for name in rows[0] if name not in keys]
+    dialect = dialect_name(db)
+    if dialect not in ("postgresql", "sqlite"):
+        for row in rows:
+            _add_without_upsert(db, table, keys, values, row)
+        return
+    # imported here rather than at module level, where the PostgreSQL dialect would load its drivers at boot
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in keys],
+            set_={name: table.c[name] + stmt.excluded[name] for name in values},
+        ),
+        rows,
+    )
+
+
+def _add_without_upsert(db: Union[Session, Connection], table: Table, keys: List[str], values: List[str], row: dict):
+    updated = db.execute(
+        table.update()
+        .where(*(table.c[name] == row[name] for name in keys))
+        .values({name: table.c[name] + row[name] for name in values})
+    )
+    if not updated.rowcount:
+        db.execute(insert(table), [row])
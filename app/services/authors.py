@@ -0,0 +1,171 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import bindparam, delete, false, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.models import Author, AuthorAlias, Book
+from app.services import aggregates, book_events
+from app.services.book_events import BookChange
+
+
+LOOKUP_CHUNK_SIZE = 500
+BACKFILL_BATCH_SIZE = 1000
+
+_WORDS = re.compile(r"[^\W_]+", re.UNICODE)
+
+_books = Book.__table__
+_set_author_id = (
+    _books.update()
+    .where(_books.c.id == bindparam("book_id"))
+    # set to itself so the column's onupdate doesn't make this look like an edit
+    .values(author_id=bindparam("new_author_id"), updated_at=_books.c.updated_at)
+)
+_backfill_author_id = (
+    _books.update()
+    .where(_books.c.author == bindparam("author_name"), _books.c.author_id.is_(None))
+    .values(author_id=bindparam("new_author_id"), updated_at=_books.c.updated_at)
+)
+
+
+def normalize(name: str) -> str:
+    """Case, accents, punctuation and spacing folded away
+
+    "J.K. Rowling", "J. K. Rowling" and "j k rowling" all give "j k rowling".
+    """
+    if name.isascii():
+        folded = name.lower()
+    else:
+        folded = "".join(
+            char for char in unicodedata.normalize("NFKD", name).casefold() if not unicodedata.combining(char)
+        )
+    return " ".join(_WORDS.findall(folded)) or name.strip().casefold()
+
+
+def prefix_match(column: ColumnElement, prefix: str, dialect: str) -> ColumnElement:
+    """column starts with prefix, in a form the database can answer from an index
+
+    Normalized names hold no LIKE wildcards, so the prefix needs no escaping.
+    """
+    if dialect == "postgresql":
+        return column.like(prefix + "%")
+    return (column >= prefix) & (column < prefix + "\U0010ffff")
+
+
+def _insert_alias(db: Union[Session, Connection], row: dict) -> bool:
+    """Insert an alias unless its spelling is already taken; True if it went in"""
+    dialect = aggregates.dialect_name(db)
+    if dialect not in ("postgresql", "sqlite"):
+        taken = db.execute(select(AuthorAlias.author_id).where(AuthorAlias.normalized_name == row["normalized_name"]))
+        if taken.first() is not None:
+            return False
+        db.execute(insert(AuthorAlias), [row])
+        return True
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    stmt = (postgresql if dialect == "postgresql" else sqlite).insert(AuthorAlias).values(row)
+    inserted = db.execute(stmt.on_conflict_do_nothing().returning(AuthorAlias.normalized_name))
+    return inserted.first() is not None
+
+
+def resolve(db: Union[Session, Connection], names: Iterable[str]) -> Dict[str, int]:
+    """Author id for each name, creating authors for spellings never seen before"""
+    by_normalized: Dict[str, str] = {}
+    for name in names:
+        by_normalized.setdefault(normalize(name), name)
+    found: Dict[str, int] = {}
+    pending = sorted(by_normalized)
+    for start in range(0, len(pending), LOOKUP_CHUNK_SIZE):
+        chunk = pending[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(db.execute(
+            select(AuthorAlias.normalized_name, AuthorAlias.author_id).where(AuthorAlias.normalized_name.in_(chunk))
+        ).all())
+
+    for normalized in pending:
+        if normalized in found:
+            continue
+        name = by_normalized[normalized]
+        author_id = db.execute(insert(Author).values(name=name).returning(Author.id)).scalar_one()
+        if not _insert_alias(db, {"normalized_name": normalized, "author_id": author_id, "name": name}):
+            # another transaction created this author first; use theirs
+            db.execute(delete(Author).where(Author.id == author_id))
+            author_id = db.execute(
+                select(AuthorAlias.author_id).where(AuthorAlias.normalized_name == normalized)
+            ).scalar_one()
+        found[normalized] = author_id
+    return {name: found[normalize(name)] for name in names}
+
+
+def _alias_lookup(name: str):
+    return select(AuthorAlias.author_id).where(AuthorAlias.normalized_name == normalize(name))
+
+
+async def find_id(db: AsyncSession, name: str) -> Optional[int]:
+    """Author id a spelling resolves to, None if no book has used it"""
+    return await db.scalar(_alias_lookup(name))
+
+
+def books_by(name: str) -> ColumnElement:
+    """Books whose author resolves to the same Author as name, found through the author_id index"""
+    return Book.author_id == _alias_lookup(name).scalar_subquery()
+
+
+def books_by_id(author_id: Optional[int]) -> ColumnElement:
+    return Book.author_id == author_id if author_id is not None else false()
+
+
+def apply(db: Session, changes: List[BookChange]):
+    """Transaction listener: point created and re-authored books at their Author
+
+    The changes' after snapshots get the author_id too, so listeners that run
+    later, in or after the transaction, see it.
+    """
+    todo = [
+        change for change in changes
+        if change.after is not None and (
+            change.after.get("author_id") is None
+            or change.before is None
+            or change.before["author"] != change.after["author"]
+        )
+    ]
+    if not todo:
+        return
+    ids = resolve(db, [change.after["author"] for change in todo])
+    rows = []
+    for change in todo:
+        author_id = ids[change.after["author"]]
+        if change.after.get("author_id") != author_id:
+            rows.append({"book_id": change.after["id"], "new_author_id": author_id})
+        change.after["author_id"] = author_id
+    if not rows:
+        return
+    db.execute(_set_author_id, rows)
+
+    by_book = {row["book_id"]: row["new_author_id"] for row in rows}
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Book) and obj.id in by_book:
+            set_committed_value(obj, "author_id", by_book[obj.id])
+
+
+def backfill(db: Union[Session, Connection], batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Set author_id on every book missing one, a batch of distinct spellings at a time; returns books updated"""
+    updated = 0
+    while True:
+        names = db.execute(
+            select(Book.author).where(Book.author_id.is_(None)).distinct().order_by(Book.author).limit(batch_size)
+        ).scalars().all()
+        if not names:
+            return updated
+        ids = resolve(db, names)
+        updated += db.execute(_backfill_author_id, [
+            {"author_name": name, "new_author_id": author_id} for name, author_id in ids.items()
+        ]).rowcount
+
+
+def start():
+    book_events.subscribe_in_transaction(apply)
@@ -0,0 +1,256 @@
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import Book
+from app.schemas.schemas import BookBatchCreate, BookBatchDelete, BookBatchOperation, BookBatchUpdate
+from app.services import book_events
+from app.services.book_events import SNAPSHOT_FIELDS, BookChange, snapshot
+from app.services.book_writes import find_existing_isbns
+
+
+BATCH_MAX_OPERATIONS = settings.batch_max_operations
+BATCH_CHUNK_SIZE = settings.batch_chunk_size
+
+Operation = Union[BookBatchCreate, BookBatchUpdate, BookBatchDelete]
+
+_operation_adapter = TypeAdapter(BookBatchOperation)
+
+CONFLICT_ERROR = "Conflicts with a concurrent write, retry"
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Decode an NDJSON body as it arrives, one item per non-blank line; ValueError if a line is not JSON"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+def parse_operation(item: Any) -> Union[Operation, str]:
+    """A validated operation, or the reason it is invalid"""
+    try:
+        return _operation_adapter.validate_python(item)
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _result(index: int, op: Optional[str], status: str, book_id: Optional[int] = None,
+            error: Optional[str] = None, book: Optional[dict] = None) -> dict:
+    return {"index": index, "op": op, "status": status, "id": book_id, "error": error, "book": book}
+
+
+def apply_batch(
+    db: Session,
+    operations: List[Union[Operation, str]],
+    user_id: int,
+    atomic: bool = False,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> List[dict]:
+    """Apply create/update/delete operations for user_id and return one result per operation
+
+    Atomic batches run in one transaction and apply nothing if any operation
+    fails. Otherwise each chunk of chunk_size operations commits on its own
+    and failed operations are skipped; a chunk the database refuses as a
+    whole is retried one operation at a time.
+    """
+    results: List[Optional[dict]] = [None] * len(operations)
+    for index, operation in enumerate(operations):
+        if isinstance(operation, str):
+            results[index] = _result(index, None, "error", error=operation)
+
+    if atomic:
+        chunks = [range(len(operations))]
+    else:
+        chunks = [range(start, min(start + chunk_size, len(operations)))
+                  for start in range(0, len(operations), chunk_size)]
+    for chunk in chunks:
+        _apply_chunk(db, operations, chunk, user_id, results, atomic)
+    return results
+
+
+def _claim_isbn(isbn: Optional[str], book_id: Optional[int], owners: Dict[str, int], claimed: Set[str]) -> Optional[str]:
+    if not isbn:
+        return None
+    if isbn in claimed:
+        return "Duplicate ISBN in this batch"
+    owner = owners.get(isbn)
+    if owner is not None and owner != book_id:
+        return "Book with this ISBN already exists"
+    claimed.add(isbn)
+    return None
+
+
+def _apply_chunk(
+    db: Session,
+    operations: List[Union[Operation, str]],
+    indexes: range,
+    user_id: int,
+    results: List[Optional[dict]],
+    atomic: bool,
+):
+    pending = [(index, operations[index]) for index in indexes if results[index] is None]
+
+    # one query for every targeted book and one for every ISBN, whatever the chunk size
+    ids = {op.id for _, op in pending if op.op != "create"}
+    before: Dict[int, dict] = {}
+    if ids:
+        before = {row.id: snapshot(row) for row in db.execute(select(*SNAPSHOT_FIELDS).where(Book.id.in_(ids)))}
+    isbns = {op.book.isbn for _, op in pending if op.op != "delete" and op.book.isbn}
+    owners = {isbn: row.id for isbn, row in find_existing_isbns(db, isbns).items()}
+    claimed: Set[str] = set()
+
+    # operations apply in order against this view of the chunk's books
+    current: Dict[int, Optional[dict]] = dict(before)
+    creates: List[Tuple[int, dict]] = []
+    updates: Dict[int, dict] = {}
+    update_indexes: Dict[int, List[int]] = {}
+    deletes: Dict[int, int] = {}
+
+    for index, op in pending:
+        if op.op == "create":
+            values = op.book.model_dump()
+            error = _claim_isbn(values["isbn"], None, owners, claimed)
+            if error:
+                results[index] = _result(index, op.op, "error", error=error)
+                continue
+            values["user_id"] = user_id
+            creates.append((index, values))
+            continue
+
+        book = current.get(op.id)
+        if book is None:
+            results[index] = _result(index, op.op, "error", op.id, "Book not found")
+            continue
+        if book["user_id"] != user_id:
+            results[index] = _result(index, op.op, "error", op.id, "Not enough permissions")
+            continue
+
+        if op.op == "delete":
+            current[op.id] = None
+            updates.pop(op.id, None)
+            deletes[op.id] = index
+            # deletes run first, so later operations may reuse the ISBN
+            if book["isbn"] and owners.get(book["isbn"]) == op.id:
+                del owners[book["isbn"]]
+            continue
+
+        values = op.book.model_dump(exclude_unset=True)
+        missing = [name for name in ("title", "author") if name in values and values[name] is None]
+        if missing:
+            results[index] = _result(index, op.op, "error", op.id, f"{missing[0]}: cannot be null")
+            continue
+        if "isbn" in values and values["isbn"] != book["isbn"]:
+            error = _claim_isbn(values["isbn"], op.id, owners, claimed)
+            if error:
+                results[index] = _result(index, op.op, "error", op.id, error)
+                continue
+        current[op.id] = {**book, **values}
+        updates.setdefault(op.id, {}).update(values)
+        update_indexes.setdefault(op.id, []).append(index)
+
+    if atomic and any(result is not None for result in results):
+        for index, op in pending:
+            if results[index] is None:
+                results[index] = _result(index, op.op, "skipped", getattr(op, "id", None))
+        return
+
+    try:
+        created = _write(db, creates, updates, deletes)
+    except IntegrityError:
+        db.rollback()
+        if atomic:
+            for index, op in pending:
+                if results[index] is None:
+                    results[index] = _result(index, op.op, "error", getattr(op, "id", None), CONFLICT_ERROR)
+            return
+        creates, created = _write_one_by_one(db, creates, updates, update_indexes, deletes, results)
+
+    after = {}
+    if updates:
+        rows = db.execute(select(*SNAPSHOT_FIELDS).where(Book.id.in_(list(updates))))
+        after = {row.id: snapshot(row) for row in rows}
+
+    changes = [BookChange(before[book_id], None) for book_id in deletes]
+    changes += [BookChange(before[book_id], after[book_id]) for book_id in updates]
+    changes += [BookChange(None, book) for book in created]
+    book_events.record(db, changes)
+    db.commit()
+
+    for (index, _), book in zip(creates, created):
+        results[index] = _result(index, "create", "created", book["id"], book=book)
+    for book_id, indexes_for_book in update_indexes.items():
+        for index in indexes_for_book:
+            # an update followed by a delete of the same book reports no final state
+            results[index] = _result(index, "update", "updated", book_id, book=after.get(book_id))
+    for book_id, index in deletes.items():
+        results[index] = _result(index, "delete", "deleted", book_id)
+
+
+def _write_one_by_one(
+    db: Session,
+    creates: List[Tuple[int, dict]],
+    updates: Dict[int, dict],
+    update_indexes: Dict[int, List[int]],
+    deletes: Dict[int, int],
+    results: List[Optional[dict]],
+) -> Tuple[List[Tuple[int, dict]], List[dict]]:
+    """Apply a chunk one operation per savepoint so only the conflicting ones fail
+
+    Failed updates and deletes are taken out of updates and deletes; returns
+    the creates that went through and their new books.
+    """
+    for book_id, index in list(deletes.items()):
+        try:
+            with db.begin_nested():
+                _write(db, [], {}, {book_id: index})
+        except IntegrityError:
+            del deletes[book_id]
+            results[index] = _result(index, "delete", "error", book_id, CONFLICT_ERROR)
+    for book_id, values in list(updates.items()):
+        try:
+            with db.begin_nested():
+                _write(db, [], {book_id: values}, {})
+        except IntegrityError:
+            del updates[book_id]
+            for index in update_indexes.pop(book_id):
+                results[index] = _result(index, "update", "error", book_id, CONFLICT_ERROR)
+    applied, created = [], []
+    for index, values in creates:
+        try:
+            with db.begin_nested():
+                created += _write(db, [(index, values)], {}, {})
+            applied.append((index, values))
+        except IntegrityError:
+            results[index] = _result(index, "create", "error", error=CONFLICT_ERROR)
+    return applied, created
+
+
+def _write(db: Session, creates: List[Tuple[int, dict]], updates: Dict[int, dict], deletes: Dict[int, int]) -> List[dict]:
+    if deletes:
+        db.execute(
+            delete(Book).where(Book.id.in_(list(deletes))),
+            execution_options={"synchronize_session": False},
+        )
+    rows = [{"id": book_id, **values} for book_id, values in updates.items() if values]
+    if rows:
+        db.execute(update(Book), rows, execution_options={"synchronize_session": False})
+    if not creates:
+        return []
+    inserted = db.execute(
+        insert(Book).returning(*SNAPSHOT_FIELDS, sort_by_parameter_order=True),
+        [values for _, values in creates],
+    )
+    return [snapshot(row) for row in inserted]
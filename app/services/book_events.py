@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import Book, BookChangeLog
+
+
+BOOK_CHANGE_POLL_SECONDS = settings.book_change_poll_seconds
+BOOK_CHANGE_RETENTION_SECONDS = settings.book_change_retention_seconds
+# A log row gets its id just before its transaction commits, so one with a lower id
+# than rows already read is committed within moments; ids are re-read this long
+# before they are taken as settled
+SETTLE_SECONDS = 10
+PRUNE_INTERVAL_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COLUMNS = (
+    "id", "title", "author", "author_id", "description", "isbn", "price", "user_id", "created_at", "updated_at",
+    "file_path", "cover_image",
+)
+SNAPSHOT_FIELDS = tuple(getattr(Book, name) for name in SNAPSHOT_COLUMNS)
+
+_SESSION_KEY = "book_changes"
+_APPLIED_KEY = "book_changes_applied"
+_DATETIME_COLUMNS = ("created_at", "updated_at")
+
+# forked workers share the random part, so the pid is added when the origin is read
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+
+@dataclass
+class BookChange:
+    """A committed change to one book: before is None for creates, after is None for deletes"""
+    before: Optional[dict]
+    after: Optional[dict]
+
+    @property
+    def book_id(self) -> int:
+        return (self.after or self.before)["id"]
+
+
+Listener = Callable[[List[BookChange]], None]
+TransactionListener = Callable[[Session, List[BookChange]], None]
+
+_listeners: List[Listener] = []
+_transaction_listeners: List[TransactionListener] = []
+
+
+def subscribe(listener: Listener):
+    """Call listener with every batch of book changes once its transaction commits"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener: Listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def subscribe_in_transaction(listener: TransactionListener):
+    """Call listener with the session and its book changes just before it commits
+
+    The listener's writes commit or roll back together with the changes.
+    Unlike subscribe, an exception here aborts the commit.
+    """
+    if listener not in _transaction_listeners:
+        _transaction_listeners.append(listener)
+
+
+def snapshot(book) -> dict:
+    """Plain-dict copy of a Book (or a row with the same columns)"""
+    if hasattr(book, "_mapping"):
+        book = book._mapping
+        return {name: book[name] for name in SNAPSHOT_COLUMNS}
+    return {name: getattr(book, name) for name in SNAPSHOT_COLUMNS}
+
+
+def record(db: Session, changes: List[BookChange]):
+    """Queue changes on the session; they are published only if it commits"""
+    if changes:
+        db.info.setdefault(_SESSION_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_in_transaction(session: Session):
+    changes = session.info.get(_SESSION_KEY)
+    applied = session.info.get(_APPLIED_KEY, 0)
+    if not changes or applied == len(changes):
+        return
+    # a failed commit can be retried, so only hand over changes not seen yet
+    session.info[_APPLIED_KEY] = len(changes)
+    for listener in _transaction_listeners:
+        listener(session, changes[applied:])
+    if BOOK_CHANGE_POLL_SECONDS > 0:
+        # last, so the logged snapshots include what the listeners added, like author_id
+        session.execute(insert(BookChangeLog).values(
+            origin=_origin(),
+            changes=orjson.dumps([[change.before, change.after] for change in changes[applied:]]).decode(),
+        ))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish(session: Session):
+    session.info.pop(_APPLIED_KEY, None)
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes:
+        _deliver(changes)
+
+
+def _deliver(changes: List[BookChange]):
+    for listener in _listeners:
+        try:
+            listener(changes)
+        except Exception:
+            logger.exception("Book change listener %r failed", listener)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_APPLIED_KEY, None)
+
+
+def _origin() -> str:
+    return f"{_PROCESS_TOKEN}:{os.getpid()}"
+
+
+def _parse_snapshot(data: Optional[dict]) -> Optional[dict]:
+    if data is None:
+        return None
+    for name in _DATETIME_COLUMNS:
+        if data.get(name) is not None:
+            data[name] = datetime.fromisoformat(data[name])
+    return data
+
+
+class ChangeFeed:
+    """Hands book changes other processes committed to this process's subscribe listeners
+
+    Polls book_change_log by id. Ids are handed out in insert order but can
+    commit slightly out of order, so ids from the last SETTLE_SECONDS are read
+    again, and those already delivered are skipped.
+    """
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._watermark = 0
+        # log id -> when it was first read, for ids above the watermark
+        self._seen: Dict[int, float] = {}
+        self._pruned_at = 0.0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def skip_to_end(self):
+        """Ignore everything logged so far"""
+        with self._session_factory() as db:
+            self._watermark = db.scalar(select(func.max(BookChangeLog.id))) or 0
+        self._seen.clear()
+
+    def start(self):
+        self.skip_to_end()
+        self._thread = threading.Thread(target=self._run, name="book-change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(BOOK_CHANGE_POLL_SECONDS):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Reading the book change log failed")
+
+    def poll(self) -> int:
+        """Deliver changes committed by other processes since the last poll; returns how many"""
+        delivered = 0
+        now = time.monotonic()
+        with self._session_factory() as db:
+            ids = db.execute(
+                select(BookChangeLog.id).where(BookChangeLog.id > self._watermark).order_by(BookChangeLog.id)
+            ).scalars().all()
+            new_ids = [log_id for log_id in ids if log_id not in self._seen]
+            if new_ids:
+                rows = db.execute(
+                    select(BookChangeLog.origin, BookChangeLog.changes)
+                    .where(BookChangeLog.id.in_(new_ids))
+                    .order_by(BookChangeLog.id)
+                ).all()
+                origin = _origin()
+                for row_origin, payload in rows:
+                    if row_origin == origin:
+                        continue
+                    changes = [
+                        BookChange(_parse_snapshot(before), _parse_snapshot(after))
+                        for before, after in orjson.loads(payload)
+                    ]
+                    _deliver(changes)
+                    delivered += len(changes)
+                for log_id in new_ids:
+                    self._seen[log_id] = now
+            if now - self._pruned_at > PRUNE_INTERVAL_SECONDS:
+                self._pruned_at = now
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=BOOK_CHANGE_RETENTION_SECONDS)
+                db.execute(delete(BookChangeLog).where(BookChangeLog.created_at < cutoff))
+                db.commit()
+
+        settled = [log_id for log_id, seen_at in self._seen.items() if now - seen_at > SETTLE_SECONDS]
+        if settled:
+            self._watermark = max(self._watermark, max(settled))
+            self._seen = {log_id: seen_at for log_id, seen_at in self._seen.items() if log_id > self._watermark}
+        return delivered
+
+
+_feed: Optional[ChangeFeed] = None
+
+
+def start_feed():
+    """Follow the book changes other processes commit from now on
+
+    Start it before building anything from the books table, so changes made
+    while the table is read are not missed.
+    """
+    global _feed
+    if BOOK_CHANGE_POLL_SECONDS <= 0 or _feed is not None:
+        return
+    from app.database.database import SessionLocal
+
+    _feed = ChangeFeed(SessionLocal)
+    _feed.start()
+
+
+def stop_feed():
+    global _feed
+    if _feed is not None:
+        _feed.stop()
+        _feed = None
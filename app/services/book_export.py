@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Sequence
+
+from sqlalchemy import Select
+
+from app.config import settings
+from app.database.database import AsyncReplicaSessionLocal
+from app.models.models import Book
+from app.schemas.schemas import ExportFormat
+
+
+EXPORT_BATCH_SIZE = settings.export_batch_size
+
+EXPORT_COLUMNS = (
+    "id", "title", "author", "author_id", "description", "isbn", "price", "user_id", "file_path", "cover_image",
+    "created_at", "updated_at",
+)
+EXPORT_FIELDS = tuple(getattr(Book, name) for name in EXPORT_COLUMNS)
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_lines(rows: Iterable[Sequence]) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row))), separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+def csv_lines(rows: Iterable[Sequence]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+
+async def export_books(query: Select, format: ExportFormat) -> AsyncIterator[bytes]:
+    """Stream the rows of query as NDJSON or CSV, one chunk per fetched batch
+
+    Rows come from a server-side cursor as plain tuples, so memory stays flat
+    whatever the catalog size. The generator owns its session because it runs
+    after the request's dependencies may already have been closed.
+    """
+    serialize = ndjson_lines if format == ExportFormat.ndjson else csv_lines
+    if format == ExportFormat.csv:
+        yield _csv_header().encode()
+    query = query.with_only_columns(*EXPORT_FIELDS).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    async with AsyncReplicaSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield serialize(rows).encode()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a byte stream on the fly into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
@@ -0,0 +1,277 @@
+import codecs
+import csv
+import io
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import Book
+from app.schemas.schemas import BookCreate, ConflictPolicy
+from app.services import book_events
+from app.services.book_events import SNAPSHOT_COLUMNS, SNAPSHOT_FIELDS, BookChange, snapshot
+from app.services.book_writes import ConflictPlan, plan_isbn_conflicts
+
+
+IMPORT_BATCH_SIZE = settings.import_batch_size
+IMPORT_USE_COPY = settings.import_use_copy
+IMPORT_MAX_REJECTED = settings.import_max_rejected
+
+READ_CHUNK_SIZE = 64 * 1024
+REQUIRED_COLUMNS = ("title", "author")
+BOOK_COLUMNS = ("title", "author", "description", "isbn", "price", "user_id")
+
+
+class ImportFormatError(ValueError):
+    """Raised when the uploaded file cannot be read as a books CSV"""
+
+
+@dataclass
+class ImportResult:
+    rows_read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    rejected_count: int = 0
+    batches: List[dict] = field(default_factory=list)
+    rejected: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def reject(self, line: int, reason: str):
+        self.rejected_count += 1
+        if len(self.rejected) < IMPORT_MAX_REJECTED:
+            self.rejected.append({"line": line, "reason": reason})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted_records": self.inserted,
+            "updated_records": self.updated,
+            "skipped_records": self.skipped,
+            "rejected_records": self.rejected_count,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "error": self.error,
+        }
+
+
+def iter_lines(stream: BinaryIO, encoding: str = "utf-8-sig") -> Iterator[str]:
+    """Decode a binary stream chunk by chunk and yield it line by line"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        pending += decoder.decode(chunk, final=not chunk)
+        start = 0
+        while True:
+            end = pending.find("\n", start)
+            if end < 0:
+                break
+            yield pending[start:end + 1]
+            start = end + 1
+        # whatever is left is an unterminated line that continues in the next chunk
+        pending = pending[start:]
+        if not chunk:
+            if pending:
+                yield pending
+            return
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (line number, row) pairs from CSV text lines"""
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        raise ImportFormatError("The uploaded file is empty")
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def validate_row(row: Dict[str, str]) -> BookCreate:
+    """Validate a raw CSV row against BookCreate, treating blank cells as missing"""
+    values = {}
+    for column in ("title", "author", "description", "isbn", "price"):
+        value = row.get(column)
+        if value is not None:
+            value = value.strip()
+        values[column] = value or None
+    return BookCreate(**values)
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def _supports_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return IMPORT_USE_COPY and dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+# Per-connection staging table: COPY lands here, then one INSERT ... SELECT moves
+# the rows into books with RETURNING, which COPY itself can't do
+_STAGE_DDL = (
+    "CREATE TEMP TABLE IF NOT EXISTS books_import_stage ("
+    "title varchar, author varchar, description text, isbn varchar, "
+    "price double precision, user_id integer) ON COMMIT DELETE ROWS"
+)
+
+
+def _copy_rows(db: Session, rows: List[dict]) -> List[dict]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[column] is None else row[column] for column in BOOK_COLUMNS])
+    buffer.seek(0)
+    columns = ", ".join(BOOK_COLUMNS)
+    db.execute(text(_STAGE_DDL))
+    # COPY runs on the session's own connection so it shares its transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY books_import_stage ({columns}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+    inserted = db.execute(text(
+        f"INSERT INTO books ({columns}) SELECT {columns} FROM books_import_stage "
+        f"RETURNING {', '.join(SNAPSHOT_COLUMNS)}"
+    ))
+    return [snapshot(row) for row in inserted]
+
+
+def _insert_rows(db: Session, rows: List[dict]) -> List[dict]:
+    """Insert rows and return snapshots of the new books"""
+    if _supports_copy(db):
+        return _copy_rows(db, rows)
+    return [snapshot(row) for row in db.execute(insert(Book).returning(*SNAPSHOT_FIELDS), rows)]
+
+
+def _updated_snapshots(db: Session, book_ids: List[int]) -> List[dict]:
+    if not book_ids:
+        return []
+    rows = db.execute(select(*SNAPSHOT_FIELDS).where(Book.id.in_(book_ids)))
+    return [snapshot(row) for row in rows]
+
+
+# Called with (db, result) right before a batch is committed, inside its transaction
+Checkpoint = Callable[[Session, ImportResult], None]
+
+
+def _apply_row_by_row(db: Session, plan: ConflictPlan, result: ImportResult) -> Tuple[List[dict], List[int]]:
+    """Apply a batch one row per savepoint so only the offending rows are rejected"""
+    inserted, updated = [], []
+    for line, row in plan.updates:
+        try:
+            with db.begin_nested():
+                db.execute(update(Book), [row])
+            updated.append(row["id"])
+        except SQLAlchemyError as e:
+            result.reject(line, str(getattr(e, "orig", e)).strip())
+    for line, row in plan.inserts:
+        try:
+            with db.begin_nested():
+                new_book = db.execute(insert(Book).returning(*SNAPSHOT_FIELDS), [row]).one()
+            inserted.append(snapshot(new_book))
+        except SQLAlchemyError as e:
+            result.reject(line, str(getattr(e, "orig", e)).strip())
+    return inserted, updated
+
+
+def flush_batch(
+    db: Session,
+    batch: List[Tuple[int, dict]],
+    result: ImportResult,
+    checkpoint: Optional[Checkpoint] = None,
+    on_conflict: ConflictPolicy = ConflictPolicy.fail,
+):
+    """Write a batch with one ISBN lookup and one statement per operation type
+
+    Falls back to row by row if the database refuses the batch as a whole.
+    """
+    if not batch:
+        return
+    plan = plan_isbn_conflicts(db, batch, on_conflict)
+    for line, reason in plan.rejected:
+        result.reject(line, reason)
+
+    # COPY goes through the raw driver, so its errors are not wrapped by SQLAlchemy
+    driver_error = db.get_bind().dialect.loaded_dbapi.Error
+    try:
+        updated_ids = [row["id"] for _, row in plan.updates]
+        if updated_ids:
+            db.execute(update(Book), [row for _, row in plan.updates])
+        new_books = _insert_rows(db, [row for _, row in plan.inserts]) if plan.inserts else []
+    except (SQLAlchemyError, driver_error):
+        db.rollback()
+        new_books, updated_ids = _apply_row_by_row(db, plan, result)
+
+    updated_books = _updated_snapshots(db, updated_ids)
+    book_events.record(
+        db,
+        [BookChange(None, book) for book in new_books]
+        + [BookChange(plan.previous[book["id"]], book) for book in updated_books]
+    )
+    inserted, updated = len(new_books), len(updated_books)
+
+    result.inserted += inserted
+    result.updated += updated
+    result.skipped += len(plan.skipped)
+    result.batches.append({
+        "batch": len(result.batches) + 1,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": len(plan.skipped),
+        "rejected": len(batch) - inserted - updated - len(plan.skipped),
+    })
+    if checkpoint:
+        checkpoint(db, result)
+    db.commit()
+
+
+def import_books(
+    db: Session,
+    stream: BinaryIO,
+    user_id: int,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    skip_rows: int = 0,
+    result: Optional[ImportResult] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    on_conflict: ConflictPolicy = ConflictPolicy.fail,
+) -> ImportResult:
+    """Stream a books CSV into the database in batches
+
+    skip_rows and result let an interrupted import continue from its last
+    committed batch; result.rows_read always counts CSV records from the start.
+    """
+    result = result or ImportResult()
+    result.rows_read = 0
+    batch: List[Tuple[int, dict]] = []
+    try:
+        for line, row in iter_csv_rows(iter_lines(stream)):
+            result.rows_read += 1
+            if result.rows_read <= skip_rows:
+                continue
+            try:
+                book = validate_row(row)
+            except ValidationError as e:
+                result.reject(line, _format_validation_error(e))
+                continue
+            batch.append((line, {**book.model_dump(), "user_id": user_id}))
+            if len(batch) >= batch_size:
+                flush_batch(db, batch, result, checkpoint, on_conflict)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # keep what was read so far and report where the stream broke off
+        result.error = f"Could not read CSV: {e}"
+
+    flush_batch(db, batch, result, checkpoint, on_conflict)
+    return result
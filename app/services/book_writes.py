@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.models import Book
+from app.schemas.schemas import ConflictPolicy
+from app.services.book_events import SNAPSHOT_FIELDS, snapshot
+
+
+# Keeps the IN (...) lists well under the bound-parameter limits of every backend
+LOOKUP_CHUNK_SIZE = 5000
+
+
+def find_existing_isbns(db: Session, isbns: Iterable[str]) -> Dict[str, tuple]:
+    """Map each ISBN that is already taken to the current row of its book
+
+    One query per LOOKUP_CHUNK_SIZE ISBNs instead of one per book.
+    """
+    wanted = list({isbn for isbn in isbns if isbn})
+    existing = {}
+    for start in range(0, len(wanted), LOOKUP_CHUNK_SIZE):
+        chunk = wanted[start:start + LOOKUP_CHUNK_SIZE]
+        rows = db.execute(
+            select(*SNAPSHOT_FIELDS).where(Book.isbn.in_(chunk))
+        ).all()
+        existing.update({row.isbn: row for row in rows})
+    return existing
+
+
+@dataclass
+class ConflictPlan:
+    inserts: List[Tuple[int, dict]] = field(default_factory=list)
+    updates: List[Tuple[int, dict]] = field(default_factory=list)
+    skipped: List[int] = field(default_factory=list)
+    rejected: List[Tuple[int, str]] = field(default_factory=list)
+    # book id -> snapshot of the row an update replaces
+    previous: Dict[int, dict] = field(default_factory=dict)
+
+
+def plan_isbn_conflicts(
+    db: Session,
+    batch: List[Tuple[int, dict]],
+    policy: ConflictPolicy,
+) -> ConflictPlan:
+    """Split a batch of (key, row) pairs into inserts, updates, skips and rejections
+
+    Rows are checked against the catalog with a single lookup and against each
+    other, so a repeated ISBN within the batch is handled by the same policy.
+    Overwrites only ever touch books owned by the row's user_id.
+    """
+    plan = ConflictPlan()
+    existing = find_existing_isbns(db, (row["isbn"] for _, row in batch))
+    # isbn -> (target list, position) of the row currently claiming it
+    claimed: Dict[str, Tuple[list, int]] = {}
+
+    for key, row in batch:
+        isbn = row.get("isbn")
+        if not isbn:
+            plan.inserts.append((key, row))
+            continue
+
+        current = existing.get(isbn)
+        if isbn not in claimed and current is None:
+            claimed[isbn] = (plan.inserts, len(plan.inserts))
+            plan.inserts.append((key, row))
+            continue
+
+        if policy == ConflictPolicy.skip:
+            plan.skipped.append(key)
+        elif policy == ConflictPolicy.fail:
+            reason = "Duplicate ISBN in this batch" if current is None else "Book with this ISBN already exists"
+            plan.rejected.append((key, reason))
+        elif current is not None and current.user_id != row["user_id"]:
+            plan.rejected.append((key, "Book with this ISBN belongs to another user"))
+        else:
+            if current is not None:
+                row = {**row, "id": current.id}
+                plan.previous[current.id] = snapshot(current)
+            if isbn in claimed:
+                # a later row for the same ISBN replaces the earlier one
+                rows, position = claimed[isbn]
+                plan.skipped.append(rows[position][0])
+                rows[position] = (key, row)
+            else:
+                claimed[isbn] = (plan.updates, len(plan.updates))
+                plan.updates.append((key, row))
+    return plan
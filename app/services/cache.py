@@ -0,0 +1,259 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """Thread-safe mapping bounded by entry count, with a time-to-live per entry"""
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                evicted = True
+            else:
+                self._data.move_to_end(key)
+                return value
+        if evicted and self._on_evict:
+            self._on_evict(key)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        evicted = []
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self._on_evict:
+            for old_key in evicted:
+                self._on_evict(old_key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheBackend(ABC):
+    """Byte-value cache whose entries carry tags that can be invalidated together
+
+    Every invalidation bumps a generation. get hands out the current one, and set
+    only stores an entry if no invalidation happened since, so a response computed
+    before a write committed cannot be cached after that write was invalidated.
+    set can also refuse entries for a while after any invalidation, for values
+    read from a replica that may not have the write yet.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        """The cached value, or None, and the generation to pass to set"""
+
+    @abstractmethod
+    async def set(
+        self, key: str, value: bytes, ttl: int, tags: Iterable[str], generation: int, settle_seconds: float = 0
+    ) -> bool:
+        """Store value unless the generation moved on, or moved less than settle_seconds ago; True if stored"""
+
+    @abstractmethod
+    async def invalidate_tags(self, tags: Iterable[str]):
+        """Drop every entry stored under any of tags and move the generation on"""
+
+    @abstractmethod
+    async def clear(self):
+        """Drop every entry and move the generation on"""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU/TTL cache"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._entries = LRUTTLCache(maxsize, ttl, on_evict=self._forget)
+        self._tags: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, tuple] = {}
+        self._generation = 0
+        self._invalidated_at = -math.inf
+        self._lock = threading.RLock()
+
+    def _forget(self, key: str):
+        with self._lock:
+            for tag in self._key_tags.pop(key, ()):
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        generation = self._generation
+        return self._entries.get(key), generation
+
+    async def set(
+        self, key: str, value: bytes, ttl: int, tags: Iterable[str], generation: int, settle_seconds: float = 0
+    ) -> bool:
+        tags = tuple(tags)
+        # one lock around the check and the store, so no invalidation can land in between;
+        # reentrant, because storing can evict and _forget takes it again
+        with self._lock:
+            if generation != self._generation or time.monotonic() - self._invalidated_at < settle_seconds:
+                return False
+            self._forget(key)
+            self._key_tags[key] = tags
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._entries.set(key, value, ttl)
+        return True
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+        for key in keys:
+            self._entries.pop(key)
+            self._forget(key)
+
+    async def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._generation += 1
+            self._tags.clear()
+            self._key_tags.clear()
+
+
+# KEYS: generation, invalidation time, entry, tag sets
+# ARGV: generation read by get, value, ttl, entry key without the prefix, settle seconds
+_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+local settle = tonumber(ARGV[5])
+if settle > 0 then
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    if now - tonumber(redis.call('GET', KEYS[2]) or '0') < settle then
+        return 0
+    end
+end
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[3])
+for i = 4, #KEYS do
+    redis.call('SADD', KEYS[i], ARGV[4])
+    -- a tag set never needs to outlive the entries it points at
+    redis.call('EXPIRE', KEYS[i], ARGV[3])
+end
+return 1
+"""
+
+# KEYS: generation, invalidation time, tag sets; ARGV: key prefix. Atomic, so no
+# entry is stored under a tag between reading its set and deleting it
+_INVALIDATE_SCRIPT = """
+redis.call('INCR', KEYS[1])
+local clock = redis.call('TIME')
+redis.call('SET', KEYS[2], clock[1] .. '.' .. string.format('%06d', tonumber(clock[2])))
+for i = 3, #KEYS do
+    local keys = redis.call('SMEMBERS', KEYS[i])
+    for j = 1, #keys do
+        redis.call('DEL', ARGV[1] .. keys[j])
+    end
+    redis.call('DEL', KEYS[i])
+end
+return 1
+"""
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache on a redis.asyncio client (or one with the same get/mget/eval/scan_iter/delete API)
+
+    Each tag is a set of the keys stored under it, and the generation is a
+    counter on the server, so invalidation reaches every process that shares it.
+    Every call is a single round trip.
+    """
+
+    CLEAR_BATCH_SIZE = 500
+
+    def __init__(self, client, prefix: str = "bookstore:cache:"):
+        self._client = client
+        self._prefix = prefix
+        self._generation_key = f"{prefix}generation"
+        self._invalidated_at_key = f"{prefix}invalidated_at"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self._prefix}tag:{tag}"
+
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        generation, value = await self._client.mget(self._generation_key, self._prefix + key)
+        return value, int(generation or 0)
+
+    async def set(
+        self, key: str, value: bytes, ttl: int, tags: Iterable[str], generation: int, settle_seconds: float = 0
+    ) -> bool:
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        stored = await self._client.eval(
+            _STORE_SCRIPT, 3 + len(tag_keys),
+            self._generation_key, self._invalidated_at_key, self._prefix + key, *tag_keys,
+            str(generation), value, ttl, key, settle_seconds,
+        )
+        return bool(stored)
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        await self._client.eval(
+            _INVALIDATE_SCRIPT, 2 + len(tag_keys), self._generation_key, self._invalidated_at_key, *tag_keys, self._prefix
+        )
+
+    async def clear(self):
+        """Delete every entry and tag set under the prefix, a batch at a time"""
+        await self._client.incr(self._generation_key)
+        batch = []
+        async for key in self._client.scan_iter(match=self._prefix + "*", count=self.CLEAR_BATCH_SIZE):
+            # keep the generation, or it would start over and readers could store with an old one
+            if key in (self._generation_key, self._generation_key.encode()):
+                continue
+            batch.append(key)
+            if len(batch) >= self.CLEAR_BATCH_SIZE:
+                await self._client.delete(*batch)
+                batch = []
+        if batch:
+            await self._client.delete(*batch)
+
+
+class NullCacheBackend(CacheBackend):
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        return None, 0
+
+    async def set(
+        self, key: str, value: bytes, ttl: int, tags: Iterable[str], generation: int, settle_seconds: float = 0
+    ) -> bool:
+        return False
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        pass
+
+    async def clear(self):
+        pass
@@ -0,0 +1,219 @@
+"""Catalog aggregates: books per author and per price range, plus the per-user totals
+
+Every book write adjusts the summary rows inside its own transaction, so the
+/books/stats endpoints never scan books. The tables can be rebuilt from
+books, or compared against them, from the command line:
+
+    python -m app.services.catalog_stats check
+    python -m app.services.catalog_stats rebuild
+"""
+import argparse
+import bisect
+import json
+import random
+import sys
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+from sqlalchemy import Select, case, delete, func, insert, literal, select, text
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import AuthorStats, Book, PriceBucketStats, UserLibraryStats
+from app.services import aggregates, authors, book_events, library_stats
+from app.services.book_events import BookChange
+
+
+PRICE_BUCKETS = tuple(sorted(float(edge) for edge in settings.stats_price_buckets.split(',')))
+STATS_PRICE_SHARDS = max(settings.stats_price_shards, 1)
+UNPRICED = -1
+MISMATCH_SAMPLES = 20
+
+
+def bucket_of(price: Optional[float]) -> int:
+    """Index of the price range holding price; prices below the first edge count in the first range"""
+    if price is None:
+        return UNPRICED
+    return max(bisect.bisect_right(PRICE_BUCKETS, price) - 1, 0)
+
+
+def _bucket_column():
+    """bucket_of as SQL, for rebuilding and checking in one query"""
+    return case(
+        (Book.price.is_(None), UNPRICED),
+        *((Book.price < edge, index) for index, edge in enumerate(PRICE_BUCKETS[1:])),
+        else_=len(PRICE_BUCKETS) - 1,
+    )
+
+
+def _deltas(changes: List[BookChange], key) -> Dict[Hashable, List[float]]:
+    """key(snapshot) -> [book count change, priced count change, value change]; None keys are skipped"""
+    totals: Dict[Hashable, List[float]] = defaultdict(lambda: [0, 0, 0.0])
+    for change in changes:
+        for snap, sign in ((change.before, -1), (change.after, 1)):
+            if snap is None or key(snap) is None:
+                continue
+            total = totals[key(snap)]
+            total[0] += sign
+            if snap["price"] is not None:
+                total[1] += sign
+                total[2] += sign * snap["price"]
+    return {name: total for name, total in totals.items() if total != [0, 0, 0.0]}
+
+
+def apply(db: Session, changes: List[BookChange]):
+    """Transaction listener: add the changes' deltas to the author and price range rows"""
+    by_author = _deltas(changes, lambda snap: snap["author_id"])
+    aggregates.add(db, AuthorStats.__table__, [
+        {"author_id": author_id, "book_count": count, "priced_count": priced, "total_value": value}
+        for author_id, (count, priced, value) in sorted(by_author.items())
+    ])
+    emptied = [author_id for author_id, (count, _, _) in by_author.items() if count < 0]
+    if emptied:
+        # an author with no books left drops out rather than lingering at zero
+        db.execute(delete(AuthorStats).where(AuthorStats.author_id.in_(emptied), AuthorStats.book_count <= 0))
+
+    # every book write touches a price range row, and a few ranges hold most books,
+    # so each transaction adds to a random shard of them rather than to one shared row
+    shard = random.randrange(STATS_PRICE_SHARDS)
+    aggregates.add(db, PriceBucketStats.__table__, [
+        {"bucket": bucket, "shard": shard, "book_count": count, "total_value": value}
+        for bucket, (count, _, value) in sorted(_deltas(changes, lambda snap: bucket_of(snap["price"])).items())
+    ])
+
+
+def price_buckets() -> Select:
+    """Each price range's totals summed over its shards, as rows with bucket, book_count and total_value"""
+    return select(
+        PriceBucketStats.bucket,
+        func.sum(PriceBucketStats.book_count).label("book_count"),
+        func.sum(PriceBucketStats.total_value).label("total_value"),
+    ).group_by(PriceBucketStats.bucket)
+
+
+def _author_totals():
+    return select(
+        Book.author_id,
+        func.count(Book.id),
+        func.count(Book.price),
+        func.coalesce(func.sum(Book.price), 0.0),
+    ).where(Book.author_id.isnot(None)).group_by(Book.author_id)
+
+
+def _bucket_totals():
+    bucket = _bucket_column()
+    return select(bucket, func.count(Book.id), func.coalesce(func.sum(Book.price), 0.0)).group_by(bucket)
+
+
+def rebuild(db: Union[Session, Connection]):
+    """Recompute every aggregate, per-user totals included, from books; the caller commits
+
+    Books written without the app's hooks, such as a bulk load, get their
+    author_id here first.
+    """
+    if aggregates.dialect_name(db) == "postgresql":
+        # book writes wait until the rebuilt rows commit, so none of their deltas are lost
+        db.execute(text("LOCK TABLE books IN SHARE MODE"))
+    authors.backfill(db)
+    db.execute(delete(AuthorStats))
+    db.execute(insert(AuthorStats).from_select(
+        ["author_id", "book_count", "priced_count", "total_value"], _author_totals()
+    ))
+    db.execute(delete(PriceBucketStats))
+    bucket, book_count, total_value = _bucket_totals().subquery().c
+    db.execute(insert(PriceBucketStats).from_select(
+        ["bucket", "shard", "book_count", "total_value"], select(bucket, literal(0), book_count, total_value)
+    ))
+    library_stats.rebuild(db)
+
+
+def _compare(expected: Dict[Hashable, Tuple], actual: Dict[Hashable, Tuple]) -> dict:
+    def rounded(row):
+        # totals are floats summed in a different order, so compare them to the cent
+        return None if row is None else tuple(round(value, 2) if isinstance(value, float) else value for value in row)
+
+    mismatches = [
+        {"key": key, "expected": rounded(expected.get(key)), "actual": rounded(actual.get(key))}
+        for key in sorted(set(expected) | set(actual), key=str)
+        if rounded(expected.get(key)) != rounded(actual.get(key))
+    ]
+    return {"rows": len(actual), "mismatches": len(mismatches), "samples": mismatches[:MISMATCH_SAMPLES]}
+
+
+def check(db: Session) -> Dict[str, dict]:
+    """Compare each summary table with what books say it should hold"""
+    def rows(stmt):
+        return {row[0]: tuple(row[1:]) for row in db.execute(stmt)}
+
+    def nonzero(totals):
+        return {key: row for key, row in totals.items() if row[0]}
+
+    return {
+        "author_stats": _compare(
+            rows(_author_totals()),
+            nonzero(rows(select(
+                AuthorStats.author_id, AuthorStats.book_count, AuthorStats.priced_count, AuthorStats.total_value
+            ))),
+        ),
+        "price_bucket_stats": _compare(
+            rows(_bucket_totals()),
+            nonzero(rows(price_buckets())),
+        ),
+        "user_library_stats": _compare(
+            rows(select(Book.user_id, func.count(Book.id), func.coalesce(func.sum(Book.price), 0.0))
+                 .where(Book.user_id.isnot(None)).group_by(Book.user_id)),
+            nonzero(rows(select(UserLibraryStats.user_id, UserLibraryStats.book_count, UserLibraryStats.total_value))),
+        ),
+    }
+
+
+def distribution(rows: List[Row]) -> List[dict]:
+    """Every price range in order, empty ones included, then the unpriced books"""
+    counts = {row.bucket: row for row in rows}
+    buckets = []
+    for index, low in enumerate(PRICE_BUCKETS):
+        row = counts.get(index)
+        buckets.append({
+            "min_price": low,
+            "max_price": PRICE_BUCKETS[index + 1] if index + 1 < len(PRICE_BUCKETS) else None,
+            "book_count": row.book_count if row else 0,
+            "total_value": round(row.total_value, 2) if row else 0.0,
+        })
+    unpriced = counts.get(UNPRICED)
+    buckets.append({
+        "min_price": None,
+        "max_price": None,
+        "book_count": unpriced.book_count if unpriced else 0,
+        "total_value": 0.0,
+    })
+    return buckets
+
+
+def start():
+    # authors first, so every change carries the author_id keying author_stats
+    authors.start()
+    book_events.subscribe_in_transaction(apply)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "rebuild"])
+    args = parser.parse_args(argv)
+
+    from app.database.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuild(db)
+            db.commit()
+        report = check(db)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if any(table["mismatches"] for table in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+from typing import Mapping, Optional, Tuple
+
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.services import storage
+
+
+ZERO_COPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a Range header starts past the end of the file"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """The inclusive (start, end) of a single byte range, or None to send the whole file
+
+    Multiple ranges and malformed headers fall back to the whole file, which
+    RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+class StoredFileResponse(Response):
+    """A stored file with an ETag, served whole or as a single byte range
+
+    Local files go out through the server's zero-copy send extension when it
+    offers one, and are otherwise read in chunks without loading them whole.
+    """
+
+    def __init__(self, request: Request, key: str, size: int, media_type: str, headers: Optional[Mapping[str, str]] = None):
+        self.key = key
+        self.range: Optional[Tuple[int, int]] = None
+        etag = f'"{key}"'
+        response_headers = {
+            "ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "no-cache",
+            # browsers must go by media_type, never by sniffing uploaded bytes
+            "X-Content-Type-Options": "nosniff",
+            **(headers or {}),
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            status_code = 304
+        else:
+            status_code = 200
+            if_range = request.headers.get("if-range")
+            if if_range is None or if_range == etag:
+                try:
+                    self.range = parse_range(request.headers.get("range"), size)
+                except RangeNotSatisfiable:
+                    status_code = 416
+                    response_headers["Content-Range"] = f"bytes */{size}"
+            if self.range:
+                status_code = 206
+                response_headers["Content-Range"] = f"bytes {self.range[0]}-{self.range[1]}/{size}"
+        if status_code in (200, 206):
+            start, end = self.range or (0, size - 1)
+            self.length = end - start + 1
+            response_headers["Content-Length"] = str(self.length)
+        else:
+            self.length = 0
+            response_headers["Content-Length"] = "0"
+        super().__init__(status_code=status_code, headers=response_headers, media_type=media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.length or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        start, end = self.range or (0, self.length - 1)
+
+        path = storage.backend.local_path(self.key)
+        if path and ZERO_COPY_EXTENSION in scope.get("extensions", {}):
+            with open(path, "rb") as f:
+                await send({"type": ZERO_COPY_EXTENSION, "file": f, "offset": start, "count": self.length})
+            return
+
+        async for chunk in storage.backend.read(self.key, start, end):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Dict, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.models.models import ImportJob
+from app.schemas.schemas import ConflictPolicy
+from app.services.book_import import ImportFormatError, ImportResult, import_books
+
+
+IMPORT_WORKERS = settings.import_workers
+IMPORT_SPOOL_DIR = settings.import_spool_dir
+IMPORT_JOB_STALE_SECONDS = settings.import_job_stale_seconds
+
+ACTIVE_STATUSES = ("queued", "running")
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_cancel_events: Dict[str, threading.Event] = {}
+_shutting_down = threading.Event()
+
+
+class ImportCancelled(Exception):
+    """Raised at a batch boundary when the job was cancelled"""
+
+
+class ImportInterrupted(Exception):
+    """Raised at a batch boundary when the process is shutting down"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timestamps back without a timezone; they are stored in UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="book-import")
+        return _executor
+
+
+def create_job(
+    db: Session,
+    user_id: int,
+    stream: BinaryIO,
+    filename: Optional[str],
+    batch_size: int,
+    on_conflict: ConflictPolicy = ConflictPolicy.fail,
+) -> ImportJob:
+    """Spool the upload to disk and record a queued job for it"""
+    job_id = uuid.uuid4().hex
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    file_path = os.path.join(IMPORT_SPOOL_DIR, f"{job_id}.csv")
+    with open(file_path, "wb") as spool:
+        shutil.copyfileobj(stream, spool, 1024 * 1024)
+
+    job = ImportJob(
+        id=job_id,
+        user_id=user_id,
+        filename=filename,
+        file_path=file_path,
+        status="queued",
+        batch_size=batch_size,
+        conflict_policy=on_conflict.value,
+        total_bytes=os.path.getsize(file_path),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def submit_job(job_id: str):
+    _cancel_events.setdefault(job_id, threading.Event())
+    _get_executor().submit(run_job, job_id)
+
+
+def _claim(db: Session, job_id: str) -> bool:
+    """Atomically take ownership of a job so only one worker runs it"""
+    now = _now()
+    stale = now - timedelta(seconds=IMPORT_JOB_STALE_SECONDS)
+    claimed = db.execute(
+        update(ImportJob)
+        .where(
+            ImportJob.id == job_id,
+            ImportJob.status.in_(ACTIVE_STATUSES),
+            or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale),
+        )
+        .values(
+            status="running",
+            heartbeat_at=now,
+            resumed_at=now,
+            resumed_from_row=ImportJob.rows_processed,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return claimed.rowcount == 1
+
+
+def _store_counts(job: ImportJob, result: ImportResult):
+    job.rows_inserted = result.inserted
+    job.rows_updated = result.updated
+    job.rows_skipped = result.skipped
+    job.rows_failed = result.rejected_count
+    job.rejected = json.dumps(result.rejected)
+
+
+def _finish(db: Session, job: ImportJob, status: str, error: Optional[str] = None):
+    job.status = status
+    job.error = error
+    job.finished_at = _now()
+    job.heartbeat_at = None
+    db.commit()
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+def run_job(job_id: str):
+    """Run (or resume) an import job on the calling worker thread"""
+    db = SessionLocal()
+    cancel = _cancel_events.setdefault(job_id, threading.Event())
+    try:
+        if not _claim(db, job_id):
+            return
+        job = db.get(ImportJob, job_id)
+        if job.started_at is None:
+            job.started_at = job.resumed_at
+            db.commit()
+
+        result = ImportResult(
+            inserted=job.rows_inserted,
+            updated=job.rows_updated,
+            skipped=job.rows_skipped,
+            rejected_count=job.rows_failed,
+            rejected=json.loads(job.rejected or "[]"),
+        )
+
+        with open(job.file_path, "rb") as stream:
+            def checkpoint(session: Session, result: ImportResult):
+                # job attributes are expired on every commit, so this re-reads the cancel flag
+                if cancel.is_set() or job.cancel_requested:
+                    raise ImportCancelled()
+                if _shutting_down.is_set():
+                    raise ImportInterrupted()
+                job.rows_processed = result.rows_read
+                _store_counts(job, result)
+                job.bytes_processed = stream.tell()
+                job.heartbeat_at = _now()
+
+            result = import_books(
+                db,
+                stream,
+                job.user_id,
+                batch_size=job.batch_size,
+                skip_rows=job.rows_processed,
+                result=result,
+                checkpoint=checkpoint,
+                on_conflict=ConflictPolicy(job.conflict_policy),
+            )
+
+        job.rows_processed = result.rows_read
+        _store_counts(job, result)
+        job.bytes_processed = job.total_bytes
+        _finish(db, job, "failed" if result.error else "completed", result.error)
+    except ImportCancelled:
+        db.rollback()
+        _finish(db, db.get(ImportJob, job_id), "cancelled")
+    except ImportInterrupted:
+        # leave the job running with no heartbeat so the next boot picks it up at once
+        db.rollback()
+        db.execute(
+            update(ImportJob).where(ImportJob.id == job_id).values(heartbeat_at=None)
+        )
+        db.commit()
+    except ImportFormatError as e:
+        db.rollback()
+        _finish(db, db.get(ImportJob, job_id), "failed", str(e))
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        db.rollback()
+        _finish(db, db.get(ImportJob, job_id), "failed", str(e))
+    finally:
+        _cancel_events.pop(job_id, None)
+        db.close()
+
+
+def request_cancel(db: Session, job: ImportJob) -> ImportJob:
+    """Cancel a queued job immediately, or flag a running one to stop at its next batch"""
+    if job.status == "queued":
+        _finish(db, job, "cancelled")
+    elif job.status == "running":
+        job.cancel_requested = True
+        db.commit()
+        event = _cancel_events.get(job.id)
+        if event:
+            event.set()
+    db.refresh(job)
+    return job
+
+
+def resume_pending_jobs():
+    """Requeue jobs left unfinished by a previous process"""
+    stale = _now() - timedelta(seconds=IMPORT_JOB_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        job_ids = db.execute(
+            select(ImportJob.id)
+            .where(
+                ImportJob.status.in_(ACTIVE_STATUSES),
+                or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale),
+            )
+            .order_by(ImportJob.created_at)
+        ).scalars().all()
+    finally:
+        db.close()
+    for job_id in job_ids:
+        logger.info("Resuming import job %s", job_id)
+        submit_job(job_id)
+
+
+def shutdown():
+    """Stop the workers at their next batch boundary, leaving jobs resumable"""
+    _shutting_down.set()
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+
+
+def job_progress(job: ImportJob) -> dict:
+    """Progress, throughput and ETA for a job, computed from its stored counters"""
+    progress = 1.0 if job.status == "completed" else 0.0
+    if job.status != "completed" and job.total_bytes:
+        progress = min(job.bytes_processed / job.total_bytes, 1.0)
+
+    throughput = eta = None
+    resumed_at = _as_utc(job.resumed_at)
+    if resumed_at is not None:
+        until = _as_utc(job.finished_at) or _now()
+        elapsed = (until - resumed_at).total_seconds()
+        rows = job.rows_processed - job.resumed_from_row
+        if elapsed > 0 and rows > 0:
+            throughput = rows / elapsed
+        if job.status == "running" and 0 < progress < 1:
+            resumed_progress = job.resumed_from_row / job.rows_processed * progress if job.rows_processed else 0
+            if progress > resumed_progress and elapsed > 0:
+                eta = elapsed * (1 - progress) / (progress - resumed_progress)
+
+    return {
+        "id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "rows_processed": job.rows_processed,
+        "rows_inserted": job.rows_inserted,
+        "rows_failed": job.rows_failed,
+        "rows_updated": job.rows_updated,
+        "rows_skipped": job.rows_skipped,
+        "conflict_policy": job.conflict_policy,
+        "progress": progress,
+        "throughput": throughput,
+        "eta_seconds": eta,
+        "error": job.error,
+        "rejected": json.loads(job.rejected or "[]"),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,41 @@
+import re
+from typing import Optional
+
+
+_SEPARATORS = re.compile(r"[\s\-]+")
+_ISBN10 = re.compile(r"^\d{9}[\dX]$")
+_ISBN13 = re.compile(r"^\d{13}$")
+
+
+def _isbn10_is_valid(isbn: str) -> bool:
+    total = sum(int(digit) * (10 - i) for i, digit in enumerate(isbn[:9]))
+    total += 10 if isbn[9] == "X" else int(isbn[9])
+    return total % 11 == 0
+
+
+def _isbn13_check_digit(first12: str) -> str:
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value: Optional[str]) -> Optional[str]:
+    """Canonical form of an ISBN: no separators, ISBN-10 promoted to ISBN-13
+
+    ISBN-10 and ISBN-13 values with a wrong check digit raise ValueError, so a
+    mistyped ISBN can't collide with another book's. Values that look like
+    neither are returned with separators stripped, so equivalent spellings of
+    the same ISBN always collide on the unique index.
+    """
+    if value is None:
+        return None
+    isbn = _SEPARATORS.sub("", value).upper()
+    if not isbn:
+        return None
+    if _ISBN10.match(isbn):
+        if not _isbn10_is_valid(isbn):
+            raise ValueError(f"{value} is not a valid ISBN-10, check digit does not match")
+        first12 = "978" + isbn[:9]
+        return first12 + _isbn13_check_digit(first12)
+    if _ISBN13.match(isbn) and isbn[12] != _isbn13_check_digit(isbn[:12]):
+        raise ValueError(f"{value} is not a valid ISBN-13, check digit does not match")
+    return isbn
@@ -0,0 +1,58 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.models import Book, UserLibraryStats
+from app.services import aggregates, book_events
+from app.services.book_events import BookChange
+
+
+def deltas(changes: List[BookChange]) -> Dict[int, List[float]]:
+    """user_id -> [book count change, inventory value change]"""
+    totals: Dict[int, List[float]] = defaultdict(lambda: [0, 0.0])
+    for change in changes:
+        for snap, sign in ((change.before, -1), (change.after, 1)):
+            if snap is None or snap["user_id"] is None:
+                continue
+            total = totals[snap["user_id"]]
+            total[0] += sign
+            total[1] += sign * (snap["price"] or 0.0)
+    return {user_id: total for user_id, total in totals.items() if total != [0, 0.0]}
+
+
+def apply(db: Session, changes: List[BookChange]):
+    """Transaction listener: add the changes' deltas to each owner's row"""
+    aggregates.add(db, UserLibraryStats.__table__, [
+        {"user_id": user_id, "book_count": count, "total_value": value}
+        for user_id, (count, value) in sorted(deltas(changes).items())
+    ])
+
+
+def empty(user_id: int) -> dict:
+    return {"user_id": user_id, "book_count": 0, "total_value": 0.0}
+
+
+def as_dict(stats: Optional[UserLibraryStats], user_id: int) -> dict:
+    if stats is None:
+        return empty(user_id)
+    return {"user_id": user_id, "book_count": stats.book_count, "total_value": round(stats.total_value, 2)}
+
+
+def rebuild(db: Session, user_id: Optional[int] = None):
+    """Recompute stats from books, for every user or just one; the caller commits"""
+    table = UserLibraryStats.__table__
+    totals = select(
+        Book.user_id, func.count(Book.id), func.coalesce(func.sum(Book.price), 0.0)
+    ).where(Book.user_id.isnot(None)).group_by(Book.user_id)
+    wipe = delete(table)
+    if user_id is not None:
+        totals = totals.where(Book.user_id == user_id)
+        wipe = wipe.where(table.c.user_id == user_id)
+    db.execute(wipe)
+    db.execute(insert(table).from_select(["user_id", "book_count", "total_value"], totals))
+
+
+def start():
+    book_events.subscribe_in_transaction(apply)
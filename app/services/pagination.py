@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Select, String, func, literal, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.models import Book
+from app.schemas.schemas import BookSortField, SortOrder
+
+
+SORT_COLUMNS = {
+    BookSortField.created_at: Book.created_at,
+    BookSortField.id: Book.id,
+    BookSortField.title: Book.title,
+    BookSortField.author: Book.author,
+}
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded or doesn't match the query"""
+
+
+def encode_cursor(sort: BookSortField, order: SortOrder, value: Any, book_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort.value, order.value, value, book_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: BookSortField, order: SortOrder) -> Tuple[Any, int]:
+    """Return the (sort value, id) a cursor points after"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, book_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_sort != sort.value or cursor_order != order.value:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    if sort == BookSortField.created_at:
+        value = datetime.fromisoformat(value)
+    return value, int(book_id)
+
+
+def order_books(stmt: Select, sort: BookSortField, order: SortOrder) -> Select:
+    column = SORT_COLUMNS[sort]
+    if order == SortOrder.desc:
+        return stmt.order_by(column.desc(), Book.id.desc())
+    return stmt.order_by(column.asc(), Book.id.asc())
+
+
+def _sqlite_timestamp(value: datetime) -> str:
+    # SQLite keeps CURRENT_TIMESTAMP as text without fractional seconds, and the
+    # DateTime type would bind microseconds, which breaks ties between equal timestamps
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    return f"{text}.{value.microsecond:06d}" if value.microsecond else text
+
+
+def after_cursor(db: Session, stmt: Select, cursor: str, sort: BookSortField, order: SortOrder) -> Select:
+    """Restrict a query to rows after the cursor using a row-value comparison
+
+    (sort column, id) is unique, so the seek is exact and walks the index
+    instead of counting past OFFSET rows.
+    """
+    value, book_id = decode_cursor(cursor, sort, order)
+    column = SORT_COLUMNS[sort]
+    if sort == BookSortField.created_at and db.get_bind().dialect.name == "sqlite":
+        value = literal(_sqlite_timestamp(value), String)
+    if sort == BookSortField.id:
+        return stmt.where(Book.id < book_id if order == SortOrder.desc else Book.id > book_id)
+    key = tuple_(column, Book.id)
+    bound = tuple_(value, book_id)
+    return stmt.where(key < bound if order == SortOrder.desc else key > bound)
+
+
+def next_cursor(items: List[Book], has_more: bool, sort: BookSortField, order: SortOrder) -> Optional[str]:
+    if not has_more or not items:
+        return None
+    last = items[-1]
+    return encode_cursor(sort, order, getattr(last, sort.value), last.id)
+
+
+def exact_count(db: Session, stmt: Select) -> int:
+    return db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+
+def explain_statement(stmt: Select, dialect) -> Tuple[str, Any]:
+    """EXPLAIN (FORMAT JSON) of stmt as driver SQL and parameters in the dialect's paramstyle
+
+    Positional drivers such as asyncpg ($1, $2, ...) take a tuple in
+    placeholder order; named ones such as psycopg2 take the dict.
+    """
+    compiled = stmt.order_by(None).compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return "EXPLAIN (FORMAT JSON) " + str(compiled), params
+
+
+def estimated_count(db: Session, stmt: Select) -> Tuple[int, bool]:
+    """Planner row estimate on PostgreSQL, exact count elsewhere, as (count, is_estimate)"""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return exact_count(db, stmt), False
+    sql, params = explain_statement(stmt, bind.dialect)
+    plan = db.connection().exec_driver_sql(sql, params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"]), True
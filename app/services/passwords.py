@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from app.config import settings
+
+
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+PASSWORD_HASH_QUEUE_SIZE = settings.password_hash_queue_size or PASSWORD_HASH_WORKERS * 4
+
+
+@lru_cache
+def bcrypt_context():
+    """The passlib context, built on first use; only hashing workers ever need it"""
+    from passlib.context import CryptContext
+
+    # Hashes made with a different cost are flagged by verify_and_update and replaced on login
+    return CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when every hashing worker is busy and the wait queue is full"""
+
+
+def _hash(password: str) -> Tuple[str, float]:
+    started = time.perf_counter()
+    hashed = bcrypt_context().hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str], float]:
+    started = time.perf_counter()
+    ok, new_hash = bcrypt_context().verify_and_update(password, hashed)
+    return ok, new_hash, time.perf_counter() - started
+
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.calls = {"hash": 0, "verify": 0}
+        self.seconds_total = {"hash": 0.0, "verify": 0.0}
+        self.seconds_max = {"hash": 0.0, "verify": 0.0}
+
+
+_metrics = _Metrics()
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, since forking a process that already runs threads can deadlock the child
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+async def _submit(operation: str, fn, *args):
+    with _metrics.lock:
+        if _metrics.in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+            _metrics.rejected += 1
+            raise PasswordHasherBusy("Too many password operations in progress")
+        _metrics.in_flight += 1
+    try:
+        *result, seconds = await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _metrics.lock:
+            _metrics.in_flight -= 1
+    with _metrics.lock:
+        _metrics.calls[operation] += 1
+        _metrics.seconds_total[operation] += seconds
+        _metrics.seconds_max[operation] = max(_metrics.seconds_max[operation], seconds)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    hashed, = await _submit("hash", _hash, password)
+    return hashed
+
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; on success also return a new hash if the stored one uses an outdated cost"""
+    ok, new_hash = await _submit("verify", _verify_and_update, password, hashed)
+    if new_hash:
+        with _metrics.lock:
+            _metrics.rehashed += 1
+    return ok, new_hash
+
+
+def stats() -> dict:
+    with _metrics.lock:
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "in_flight": _metrics.in_flight,
+            "queue_depth": max(0, _metrics.in_flight - PASSWORD_HASH_WORKERS),
+            "rejected": _metrics.rejected,
+            "rehashed": _metrics.rehashed,
+            **{
+                f"{operation}_ms_avg": round(1000 * _metrics.seconds_total[operation] / calls, 3) if calls else 0.0
+                for operation, calls in _metrics.calls.items()
+            },
+            **{f"{operation}_ms_max": round(1000 * seconds, 3) for operation, seconds in _metrics.seconds_max.items()},
+            "calls": dict(_metrics.calls),
+        }
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
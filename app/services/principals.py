@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import User
+from app.services.cache import LRUTTLCache
+
+
+PRINCIPAL_CACHE_TTL_SECONDS = settings.principal_cache_ttl_seconds
+PRINCIPAL_CACHE_MAX_ENTRIES = settings.principal_cache_max_entries
+
+# Changing any of these revokes the user's outstanding tokens
+CREDENTIAL_FIELDS = ("email", "hashed_password", "deleted_at")
+
+_SESSION_KEY = "principal_changes"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as routes see it, detached from any session"""
+    id: int
+    email: str
+    token_version: int
+    username: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, token_version=user.token_version, username=user.username)
+
+
+# Per process: another worker can accept a revoked token until its entry expires
+_cache = LRUTTLCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+
+# Bumped on every invalidation, so a principal read before a credential change
+# committed is not cached after the change
+_generation = 0
+
+
+def generation() -> int:
+    return _generation
+
+
+def get(user_id: int) -> Optional[Principal]:
+    return _cache.get(user_id)
+
+
+def put(principal: Principal, since: int):
+    if since == _generation:
+        _cache.set(principal.id, principal)
+
+
+def invalidate(user_id: int):
+    global _generation
+    _generation += 1
+    _cache.pop(user_id)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_token_version(session: Session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[name].history.has_changes() for name in CREDENTIAL_FIELDS):
+            obj.token_version = (obj.token_version or 0) + 1
+            session.info.setdefault(_SESSION_KEY, set()).add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            session.info.setdefault(_SESSION_KEY, set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    for user_id in session.info.pop(_SESSION_KEY, ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session):
+    session.info.pop(_SESSION_KEY, None)
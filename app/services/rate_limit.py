@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.services.cache import LRUTTLCache
+
+
+RATE_LIMIT_ENABLED = settings.rate_limit_enabled
+RATE_LIMIT_BACKEND = settings.rate_limit_backend
+RATE_LIMIT_MAX_KEYS = settings.rate_limit_max_keys
+REDIS_URL = settings.redis_url
+REDIS_CONNECT_TIMEOUT_SECONDS = settings.redis_connect_timeout_seconds
+REDIS_SOCKET_TIMEOUT_SECONDS = settings.redis_socket_timeout_seconds
+
+DEFAULT_CLASS = "default"
+# never limited: probes and docs must keep answering while clients are shed
+EXEMPT_PATHS = frozenset(("/", "/health", "/metrics", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"))
+# (method, path) of requests that make the server do a lot of work per call
+BULK_ROUTES = frozenset((
+    ("POST", "/books/batch"),
+    ("POST", "/upload/books/upload"),
+    ("GET", "/books/export"),
+))
+SEARCH_PATHS = frozenset(("/books", "/books/", "/books/suggest", "/authors", "/authors/"))
+WRITE_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """A bucket of requests that holds at most this many and refills them evenly over seconds"""
+    requests: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.seconds
+
+
+def parse_limits(value: str) -> Dict[str, Limit]:
+    """"auth=10/60,search=120/60" -> {"auth": Limit(10, 60), "search": Limit(120, 60)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = item.partition("=")
+        requests, _, seconds = limit.partition("/")
+        limits[name.strip()] = Limit(int(requests), float(seconds or 1))
+    return limits
+
+
+def parse_concurrency(value: str) -> Dict[str, int]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, count = item.partition("=")
+        limits[name.strip()] = int(count)
+    return limits
+
+
+RATE_LIMITS = parse_limits(settings.rate_limits)
+IP_RATE_LIMITS = {**RATE_LIMITS, **parse_limits(settings.ip_rate_limits)}
+CONCURRENCY_LIMITS = parse_concurrency(settings.concurrency_limits)
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Route class of a request, None for the ones never limited"""
+    if path in EXEMPT_PATHS:
+        return None
+    if (method, path) in BULK_ROUTES:
+        return "bulk"
+    if method == "POST" and path.startswith("/user/"):
+        return "auth"
+    if method == "GET" and path in SEARCH_PATHS:
+        return "search"
+    if method in WRITE_METHODS:
+        return "write"
+    return DEFAULT_CLASS
+
+
+class RateLimitStore(ABC):
+    """Token buckets by key"""
+
+    @abstractmethod
+    async def take(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        """Take one token from key's bucket: (allowed, seconds until a token is available)"""
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Per-process buckets; with several workers each enforces the limit on its own"""
+
+    def __init__(self, maxsize: int):
+        # a bucket left alone until it is full again is the same as no bucket, so it can expire then
+        self._buckets = LRUTTLCache(maxsize, 0)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.requests, now))
+            tokens = min(limit.requests, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets.set(key, (tokens, now), (limit.requests - tokens) / limit.rate)
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+# runs atomically on the server, timed by the server's clock so workers on different hosts agree
+_TAKE_SCRIPT = """
+local requests = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or requests
+local updated = tonumber(state[2]) or now
+tokens = math.min(requests, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((requests - tokens) / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets shared by every process, on a redis.asyncio client (or one with the same eval API)"""
+
+    def __init__(self, client, prefix: str = "bookstore:ratelimit:"):
+        self._client = client
+        self._prefix = prefix
+
+    async def take(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        allowed, tokens = await self._client.eval(_TAKE_SCRIPT, 1, self._prefix + key, limit.requests, limit.rate)
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+def _create_store() -> RateLimitStore:
+    if RATE_LIMIT_BACKEND == "redis":
+        import redis.asyncio
+        # short timeouts: every limited request waits on this call, and an outage lets requests through
+        return RedisRateLimitStore(redis.asyncio.Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        ))
+    return MemoryRateLimitStore(RATE_LIMIT_MAX_KEYS)
+
+
+store: RateLimitStore = _create_store()
+
+
+def set_store(new_store: RateLimitStore):
+    """Swap the bucket store, e.g. for a fake Redis client in tests"""
+    global store
+    store = new_store
+
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Counter = Counter()
+        self.limited: Counter = Counter()
+        self.shed: Counter = Counter()
+        self.store_errors = 0
+
+
+_metrics = _Metrics()
+
+
+async def admit_rate(route_class: str, identities: Iterable[str]) -> float:
+    """0 if the request may go ahead, otherwise the seconds the client should wait
+
+    The request takes a token from the bucket of each identity ("ip:..." and
+    "user:..."), and is turned away if any of them is empty.
+    """
+    limits = [(identity, _limit_for(route_class, identity)) for identity in identities]
+    limits = [(identity, limit) for identity, limit in limits if limit is not None]
+    if not limits:
+        return 0.0
+    try:
+        taken = await asyncio.gather(*(store.take(f"{route_class}:{identity}", limit) for identity, limit in limits))
+    except Exception:
+        # a store outage shouldn't take the API down with it
+        with _metrics.lock:
+            _metrics.store_errors += 1
+        logger.warning("Rate limit store failed, letting the request through", exc_info=True)
+        return 0.0
+    if all(allowed for allowed, _ in taken):
+        return 0.0
+    with _metrics.lock:
+        _metrics.limited[route_class] += 1
+    return max(retry_after for allowed, retry_after in taken if not allowed)
+
+
+def _limit_for(route_class: str, identity: str) -> Optional[Limit]:
+    limits = IP_RATE_LIMITS if identity.startswith("ip:") else RATE_LIMITS
+    return limits.get(route_class)
+
+
+def enter(route_class: str) -> bool:
+    """Count a request of route_class as in flight, unless the class is at its concurrency limit"""
+    cap = CONCURRENCY_LIMITS.get(route_class)
+    with _metrics.lock:
+        if cap is not None and _metrics.in_flight[route_class] >= cap:
+            _metrics.shed[route_class] += 1
+            return False
+        _metrics.in_flight[route_class] += 1
+        return True
+
+
+def leave(route_class: str):
+    with _metrics.lock:
+        _metrics.in_flight[route_class] -= 1
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def stats() -> dict:
+    with _metrics.lock:
+        return {
+            "backend": RATE_LIMIT_BACKEND,
+            "limits": {name: f"{limit.requests}/{limit.seconds:g}" for name, limit in RATE_LIMITS.items()},
+            "ip_limits": {name: f"{limit.requests}/{limit.seconds:g}" for name, limit in IP_RATE_LIMITS.items()},
+            "concurrency_limits": dict(CONCURRENCY_LIMITS),
+            "in_flight": {name: count for name, count in _metrics.in_flight.items() if count},
+            "limited": dict(_metrics.limited),
+            "shed": dict(_metrics.shed),
+            "store_errors": _metrics.store_errors,
+        }
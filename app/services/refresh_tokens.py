@@ -0,0 +1,83 @@
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.models import RefreshToken, User
+
+
+REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_token_expire_days
+
+
+class InvalidRefreshToken(Exception):
+    """Raised when a refresh token is unknown, expired, revoked or replayed"""
+
+
+def _hash(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands timestamps back without a timezone
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def issue(db: AsyncSession, user: User, family_id: Optional[str] = None) -> str:
+    """Add a new refresh token for user to the session and return it; the caller commits"""
+    raw = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user.id,
+        token_hash=_hash(raw),
+        family_id=family_id or uuid.uuid4().hex,
+        token_version=user.token_version or 0,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return raw
+
+
+async def _revoke_family(db: AsyncSession, family_id: str, now: datetime):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    await db.commit()
+
+
+async def rotate(db: AsyncSession, raw: str) -> Tuple[User, str]:
+    """Spend a refresh token and return its user with the next token in the family
+
+    Each token works once. Presenting one that was already spent means a copy
+    leaked, so the whole family is revoked and the user has to log in again.
+    """
+    now = datetime.now(timezone.utc)
+    token = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == _hash(raw)))
+    if token is None or token.revoked_at is not None:
+        raise InvalidRefreshToken("Invalid refresh token")
+    if _aware(token.expires_at) <= now:
+        raise InvalidRefreshToken("Refresh token has expired")
+
+    # conditional update, so two concurrent refreshes can't both spend the token
+    spent = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == token.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    )
+    if spent.rowcount != 1:
+        await _revoke_family(db, token.family_id, now)
+        raise InvalidRefreshToken("Refresh token has already been used")
+
+    user = await db.get(User, token.user_id)
+    if user is None or user.deleted_at is not None or user.token_version != token.token_version:
+        # credentials changed since this family was issued
+        await _revoke_family(db, token.family_id, now)
+        raise InvalidRefreshToken("Invalid refresh token")
+
+    new_raw = issue(db, user, token.family_id)
+    await db.commit()
+    return user, new_raw
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import logging
+from typing import Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from app.config import settings
+from app.services import authors, book_events
+from app.services.book_events import BookChange
+from app.services.cache import CacheBackend, MemoryCacheBackend, NullCacheBackend, RedisCacheBackend
+
+
+CACHE_BACKEND = settings.cache_backend
+CACHE_TTL_SECONDS = settings.cache_ttl_seconds
+CACHE_MAX_ENTRIES = settings.cache_max_entries
+REPLICA_CACHE_DELAY_SECONDS = settings.replica_cache_delay_seconds
+REDIS_URL = settings.redis_url
+REDIS_CONNECT_TIMEOUT_SECONDS = settings.redis_connect_timeout_seconds
+REDIS_SOCKET_TIMEOUT_SECONDS = settings.redis_socket_timeout_seconds
+
+# Tags shared by list entries; see list_tags and change_tags for how they pair up
+ALL_LISTS = "books:all"
+SEARCH_LISTS = "books:search"
+PRICE_LISTS = "books:price"
+
+logger = logging.getLogger(__name__)
+
+
+def _create_backend() -> CacheBackend:
+    if CACHE_BACKEND == "none":
+        return NullCacheBackend()
+    if CACHE_BACKEND == "redis":
+        import redis.asyncio
+        return RedisCacheBackend(redis.asyncio.Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        ))
+    return MemoryCacheBackend(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+
+backend: CacheBackend = _create_backend()
+
+# The app's event loop; book changes are committed on other threads too, and the
+# backend's invalidations have to run here
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Invalidations started on the event loop and not finished yet; see flush
+_pending: Set["asyncio.Task[None]"] = set()
+
+
+def set_backend(new_backend: CacheBackend):
+    """Swap the cache backend, e.g. for a fake Redis client in tests"""
+    global backend
+    backend = new_backend
+
+
+def book_tag(book_id: int) -> str:
+    return f"book:{book_id}"
+
+
+def author_tag(author: str) -> str:
+    return f"books:author:{authors.normalize(author)}"
+
+
+def author_id_tag(author_id: int) -> str:
+    return f"books:author_id:{author_id}"
+
+
+def list_key(**params) -> str:
+    """Stable cache key for a book listing: defaults dropped, parameters sorted"""
+    items = sorted((name, str(value)) for name, value in params.items() if value is not None)
+    return "books?" + urlencode(items)
+
+
+def list_tags(
+    book_ids: Iterable[int],
+    title: Optional[str] = None,
+    author: Optional[str] = None,
+    query: Optional[str] = None,
+    price_filtered: bool = False,
+    author_id: Optional[int] = None,
+) -> List[str]:
+    """Tags for a cached listing: its books plus the filters that decide membership
+
+    An author filter is tagged by its normalized spelling, which catches the
+    author's first book, and by the author it resolved to, which catches books
+    filed under any alias.
+    """
+    tags = {book_tag(book_id) for book_id in book_ids}
+    if title:
+        tags.add(f"books:title:{title}")
+    if author:
+        tags.add(author_tag(author))
+    if author_id is not None:
+        tags.add(author_id_tag(author_id))
+    if query:
+        tags.add(SEARCH_LISTS)
+    if not (title or author or query):
+        tags.add(ALL_LISTS)
+    if price_filtered:
+        tags.add(PRICE_LISTS)
+    return sorted(tags)
+
+
+def change_tags(change: BookChange) -> Set[str]:
+    """Tags of every cached response a committed change could have altered"""
+    tags = {book_tag(change.book_id)}
+    before, after = change.before, change.after
+    if before is None or after is None or any(before[f] != after[f] for f in ("title", "author")):
+        # membership or ordering may change for any list that could hold this book
+        tags.update((ALL_LISTS, SEARCH_LISTS, PRICE_LISTS))
+        for snap in (before, after):
+            if snap is not None:
+                tags.add(f"books:title:{snap['title']}")
+                tags.add(author_tag(snap["author"]))
+                if snap.get("author_id") is not None:
+                    tags.add(author_id_tag(snap["author_id"]))
+        return tags
+    if before["description"] != after["description"]:
+        tags.add(SEARCH_LISTS)
+    if before["price"] != after["price"]:
+        tags.add(PRICE_LISTS)
+    return tags
+
+
+def invalidate(changes: List[BookChange]):
+    """Book change listener: drop exactly the entries the changes touch"""
+    tags = set()
+    for change in changes:
+        tags.update(change_tags(change))
+    invalidate_tags(tags)
+
+
+def invalidate_tags(tags: Iterable[str]):
+    """Drop the entries under tags; safe to call from any thread
+
+    Off the app's event loop this waits for the backend. On it, where commits
+    from async sessions land, it can't, so the invalidation is left running
+    and flush must be awaited before the write is answered.
+    """
+    coroutine = _invalidate(set(tags))
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        task = running.create_task(coroutine)
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+        return
+    if _loop is not None and _loop.is_running():
+        asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+        return
+    # no app running, e.g. a management command
+    asyncio.run(coroutine)
+
+
+async def _invalidate(tags: Set[str]):
+    try:
+        await backend.invalidate_tags(tags)
+    except Exception:
+        logger.exception("Cache invalidation failed for %s", sorted(tags))
+
+
+async def flush():
+    """Wait for every invalidation started on the event loop so far"""
+    while _pending:
+        await asyncio.gather(*_pending)
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+async def lookup(key: str) -> Tuple[Optional[bytes], int]:
+    """The cached body, or None, and the generation to pass to store"""
+    try:
+        return await backend.get(key)
+    except Exception:
+        logger.exception("Cache lookup failed for %s", key)
+        # no generation matches -1, so nothing computed now is stored
+        return None, -1
+
+
+async def store(
+    key: str, content: Union[BaseModel, bytes], tags: Iterable[str], generation: int, from_replica: bool = False
+) -> bytes:
+    """Serialize a response (unless already rendered) and cache it unless a write landed since generation
+
+    Responses read from the replica are also left out for a while after any
+    write, since the replica may not have caught up with it.
+    """
+    body = content if isinstance(content, bytes) else content.model_dump_json().encode()
+    if generation < 0:
+        return body
+    settle_seconds = REPLICA_CACHE_DELAY_SECONDS if from_replica else 0
+    try:
+        await backend.set(key, body, CACHE_TTL_SECONDS, tags, generation, settle_seconds)
+    except Exception:
+        logger.exception("Cache store failed for %s", key)
+    return body
+
+
+def respond(request: Request, body: bytes) -> Response:
+    """JSON response with an ETag, or an empty 304 if the client already has it"""
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def start():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    book_events.subscribe(invalidate)
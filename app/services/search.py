@@ -0,0 +1,132 @@
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, column, func, inspect, literal, literal_column, or_, table
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.models import Book
+
+
+logger = logging.getLogger(__name__)
+
+# Generated tsvector column plus trigram indexes; mirrors the search migration so a
+# database built with create_all gets the same schema
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING gin (author gin_trgm_ops)",
+]
+
+# External-content FTS5 index kept in step with books by triggers
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, description, content='books', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+]
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+# Set by ensure_search_schema; a SQLite build without FTS5 falls back to LIKE
+_fts_enabled = False
+
+
+def ensure_search_schema(engine: Engine):
+    """Create the search column/indexes (PostgreSQL) or FTS5 table (SQLite) if missing"""
+    global _fts_enabled
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        columns = {c["name"] for c in inspect(engine).get_columns("books")}
+        if "search_vector" in columns:
+            return
+        with engine.begin() as conn:
+            for statement in POSTGRES_SEARCH_DDL:
+                conn.exec_driver_sql(statement)
+    elif dialect == "sqlite":
+        try:
+            with engine.begin() as conn:
+                created = not conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'books_fts'"
+                ).first()
+                for statement in SQLITE_SEARCH_DDL:
+                    conn.exec_driver_sql(statement)
+                if created:
+                    conn.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+            _fts_enabled = True
+        except Exception:
+            logger.warning("SQLite FTS5 is unavailable, book search falls back to LIKE")
+
+
+def search_terms(query: Optional[str]) -> List[str]:
+    return _WORDS.findall(query.lower()) if query else []
+
+
+def apply_search(stmt: Select, terms: List[str], dialect: str) -> Tuple[Select, ColumnElement]:
+    """Filter a books query to rows matching every term and return a relevance score
+
+    Terms match as prefixes, so results show up while the user is still typing.
+    On PostgreSQL, titles and authors within trigram distance match too, which
+    tolerates typos.
+    """
+    if dialect == "postgresql":
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        phrase = " ".join(terms)
+        vector = literal_column("books.search_vector")
+        stmt = stmt.where(or_(
+            vector.op("@@")(tsquery),
+            Book.title.op("%")(phrase),
+            Book.author.op("%")(phrase),
+        ))
+        rank = func.ts_rank_cd(vector, tsquery) + func.greatest(
+            func.similarity(Book.title, phrase),
+            func.similarity(Book.author, phrase),
+        )
+        return stmt, rank
+
+    if dialect == "sqlite" and _fts_enabled:
+        fts = table("books_fts", column("rowid"), column("rank"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        stmt = stmt.join(fts, fts.c.rowid == Book.id).where(
+            literal_column("books_fts").op("MATCH")(match)
+        )
+        # FTS5 rank is bm25, where lower is better
+        return stmt, -fts.c.rank
+
+    for term in terms:
+        pattern = f"%{term}%"
+        stmt = stmt.where(or_(
+            Book.title.ilike(pattern),
+            Book.author.ilike(pattern),
+            Book.description.ilike(pattern),
+        ))
+    return stmt, literal(0)
+
+
+def apply_price_range(stmt: Select, min_price: Optional[float], max_price: Optional[float]) -> Select:
+    if min_price is not None:
+        stmt = stmt.where(Book.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Book.price <= max_price)
+    return stmt
@@ -0,0 +1,234 @@
+import bisect
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.models.models import Book
+from app.services import book_events
+from app.services.book_events import SNAPSHOT_COLUMNS, SNAPSHOT_FIELDS, BookChange
+from app.services.search import search_terms
+
+
+SEARCH_INDEX_ENABLED = settings.search_index_enabled
+
+BUILD_BATCH_SIZE = 5000
+
+# positions in a stored document tuple, which follows SNAPSHOT_COLUMNS
+_ID, _TITLE, _AUTHOR, _AUTHOR_ID, _DESCRIPTION, _PRICE = (
+    SNAPSHOT_COLUMNS.index(name) for name in ("id", "title", "author", "author_id", "description", "price")
+)
+_FIELD_WEIGHTS = ((_TITLE, 3.0), (_AUTHOR, 2.0), (_DESCRIPTION, 1.0))
+
+logger = logging.getLogger(__name__)
+
+
+def _document_terms(doc: tuple) -> Set[str]:
+    terms = set()
+    for position, _ in _FIELD_WEIGHTS:
+        terms.update(search_terms(doc[position]))
+    return terms
+
+
+def _posting_add(postings: array, book_id: int):
+    # ids mostly arrive in increasing order, so this is usually an append
+    if not postings or postings[-1] < book_id:
+        postings.append(book_id)
+        return
+    position = bisect.bisect_left(postings, book_id)
+    if position == len(postings) or postings[position] != book_id:
+        postings.insert(position, book_id)
+
+
+class InvertedIndex:
+    """Term -> sorted array of book ids, plus the book rows needed to answer a search
+
+    Posting lists are array('I') rather than sets, roughly 4 bytes per entry
+    instead of ~60. A sorted vocabulary list gives prefix expansion by bisect.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, array] = {}
+        self._vocabulary: List[str] = []
+        self._docs: Dict[int, tuple] = {}
+        # changes that arrive while a rebuild is scanning the table
+        self._pending: Optional[List[BookChange]] = None
+        self.ready = False
+        self.build_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+
+    def _add(self, doc: tuple):
+        book_id = doc[_ID]
+        self._docs[book_id] = doc
+        for term in _document_terms(doc):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("I")
+                bisect.insort(self._vocabulary, term)
+            _posting_add(postings, book_id)
+
+    def _remove(self, book_id: int):
+        doc = self._docs.pop(book_id, None)
+        if doc is None:
+            return
+        for term in _document_terms(doc):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            position = bisect.bisect_left(postings, book_id)
+            if position < len(postings) and postings[position] == book_id:
+                del postings[position]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def apply(self, changes: List[BookChange]):
+        """Book change listener: keep the index in step with committed writes"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+                return
+            for change in changes:
+                if change.before is not None:
+                    self._remove(change.book_id)
+                if change.after is not None:
+                    self._add(tuple(change.after[name] for name in SNAPSHOT_COLUMNS))
+
+    def build(self, rows: Iterable[tuple]):
+        """Replace the index contents with rows ordered by id"""
+        started = time.perf_counter()
+        with self._lock:
+            self._pending = []
+
+        postings: Dict[str, array] = {}
+        docs: Dict[int, tuple] = {}
+        for row in rows:
+            doc = tuple(row)
+            docs[doc[_ID]] = doc
+            for term in _document_terms(doc):
+                term_postings = postings.get(term)
+                if term_postings is None:
+                    term_postings = postings[term] = array("I")
+                term_postings.append(doc[_ID])
+
+        with self._lock:
+            self._postings = postings
+            self._vocabulary = sorted(postings)
+            self._docs = docs
+            pending, self._pending = self._pending, None
+            self.apply(pending)
+            self.build_seconds = time.perf_counter() - started
+            self.memory_bytes = self._measure_memory()
+            self.ready = True
+
+    def _measure_memory(self) -> int:
+        size = sys.getsizeof(self._postings) + sys.getsizeof(self._vocabulary) + sys.getsizeof(self._docs)
+        for term, postings in self._postings.items():
+            size += sys.getsizeof(term) + sys.getsizeof(postings)
+        for doc in self._docs.values():
+            size += sys.getsizeof(doc) + sum(sys.getsizeof(value) for value in doc[1:])
+        return size
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        ids: Set[int] = set()
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            ids.update(self._postings[self._vocabulary[position]])
+            position += 1
+        return ids
+
+    def search(
+        self,
+        terms: List[str],
+        title: Optional[str] = None,
+        author_id: Optional[int] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 10,
+    ) -> Tuple[int, List[dict]]:
+        """Books matching every term as a prefix, best first, as (total, page)"""
+        with self._lock:
+            candidates: Optional[Set[int]] = None
+            # expand the longest (most selective) prefixes first
+            for term in sorted(set(terms), key=len, reverse=True):
+                ids = self._prefix_ids(term)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return 0, []
+
+            matches = []
+            for book_id in candidates or ():
+                doc = self._docs[book_id]
+                price = doc[_PRICE]
+                if title is not None and doc[_TITLE] != title:
+                    continue
+                if author_id is not None and doc[_AUTHOR_ID] != author_id:
+                    continue
+                if min_price is not None and (price is None or price < min_price):
+                    continue
+                if max_price is not None and (price is None or price > max_price):
+                    continue
+                matches.append(doc)
+
+        def score(doc: tuple) -> Tuple[float, int]:
+            total = 0.0
+            for position, weight in _FIELD_WEIGHTS:
+                words = search_terms(doc[position])
+                total += weight * sum(1 for term in terms if any(word.startswith(term) for word in words))
+            return total, doc[_ID]
+
+        page = heapq.nlargest(offset + limit, matches, key=score)[offset:]
+        return len(matches), [dict(zip(SNAPSHOT_COLUMNS, doc)) for doc in page]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                "postings": sum(len(postings) for postings in self._postings.values()),
+                "memory_bytes": self.memory_bytes,
+                "build_seconds": self.build_seconds,
+            }
+
+
+index = InvertedIndex()
+
+
+def is_ready() -> bool:
+    return SEARCH_INDEX_ENABLED and index.ready
+
+
+def rebuild():
+    """Load every book into the index, streaming the table in batches"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(*SNAPSHOT_FIELDS)
+            .order_by(Book.id)
+            .execution_options(yield_per=BUILD_BATCH_SIZE)
+        )
+        index.build(rows)
+    finally:
+        db.close()
+    logger.info(
+        "Search index built: %(documents)s books, %(terms)s terms, %(memory_bytes)s bytes in %(build_seconds).2fs",
+        index.stats(),
+    )
+
+
+def start():
+    """Subscribe to book changes and build the index in the background"""
+    if not SEARCH_INDEX_ENABLED:
+        return
+    book_events.subscribe(index.apply)
+    threading.Thread(target=rebuild, name="search-index-build", daemon=True).start()
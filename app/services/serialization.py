@@ -0,0 +1,57 @@
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import literal
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.models import Book
+from app.schemas.schemas import BookResponse
+
+
+BOOK_FIELDS: Tuple[str, ...] = tuple(BookResponse.model_fields)
+
+
+class InvalidFields(ValueError):
+    """Raised when ?fields= names something that is not a book field"""
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Requested book fields in response order; every field when none are given"""
+    if not fields:
+        return BOOK_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(BOOK_FIELDS)
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in BOOK_FIELDS if name in requested)
+
+
+def book_columns(fields: Iterable[str]) -> List[ColumnElement]:
+    """Columns to select for fields; response fields without a column come back as null"""
+    columns = []
+    for name in fields:
+        column = getattr(Book, name, None)
+        columns.append(column if column is not None else literal(None).label(name))
+    return columns
+
+
+def project(rows: Iterable[Any], fields: Tuple[str, ...]) -> List[dict]:
+    """Plain dicts of just fields, from result rows or book dicts"""
+    if not isinstance(rows, list):
+        rows = list(rows)
+    if rows and isinstance(rows[0], Mapping):
+        return [{name: row.get(name) for name in fields} for row in rows]
+    return [{name: getattr(row, name) for name in fields} for row in rows]
+
+
+def dumps(content: Any) -> bytes:
+    # UTC as "Z", the way pydantic writes it, so both paths render the same JSON
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-rendered response for routes that return plain rows instead of models"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,40 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Where the time to get ready went: importing the app, then each boot step"""
+
+    def __init__(self, import_seconds: float):
+        self.import_ms = round(1000 * import_seconds, 3)
+        self.steps: Dict[str, float] = {}
+        self.schema: Optional[dict] = None
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(1000 * (time.perf_counter() - started), 3)
+
+    def as_dict(self) -> dict:
+        return {
+            "import_ms": self.import_ms,
+            "boot_ms": round(sum(self.steps.values()), 3),
+            "steps": dict(self.steps),
+            "schema": self.schema,
+        }
+
+    def log(self):
+        report = self.as_dict()
+        logger.info(
+            "Ready after %.1fms import and %.1fms boot (%s); schema %s",
+            report["import_ms"], report["boot_ms"],
+            ", ".join(f"{name} {ms:.1f}ms" for name, ms in report["steps"].items()),
+            (self.schema or {}).get("state", "unchecked"),
+        )
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Collection, List, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+
+
+STORAGE_BACKEND = settings.storage_backend
+STORAGE_DIR = settings.storage_dir
+STORAGE_CHUNK_SIZE = settings.storage_chunk_size
+MAX_UPLOAD_BYTES = settings.max_upload_bytes
+MAX_COVER_BYTES = settings.max_cover_bytes
+
+# Pillow format -> the content type covers in it are served with
+COVER_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+COVER_TYPES = tuple(COVER_FORMATS.values())
+
+
+class InvalidUpload(ValueError):
+    """Raised when an upload is malformed, empty, or of a rejected type"""
+
+
+class UploadTooLarge(InvalidUpload):
+    """Raised when an upload goes past its size limit"""
+
+
+class StorageBackend(ABC):
+    """Content-addressed blob store: a key is written once and never changes
+
+    Uploads are written to a staging area first, because the key (the
+    content hash) is only known once the last byte has arrived.
+    """
+
+    @abstractmethod
+    async def write_staged(self, chunks: AsyncIterator[bytes]) -> str:
+        """Write chunks to a new staging object and return its id"""
+
+    @abstractmethod
+    async def commit(self, staged: str, key: str):
+        """Publish a staged object under key; if key already exists the staged copy is dropped"""
+
+    @abstractmethod
+    async def discard(self, staged: str):
+        """Drop a staged object that won't be committed"""
+
+    @abstractmethod
+    def read(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes start..end inclusive of the object at key, as an async generator"""
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Size in bytes of the object at key, or None if there is none"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of key when the backend has one, for zero-copy sends"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """Files under a root directory, fanned out by key prefix"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.staging = os.path.join(root, ".staging")
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    async def write_staged(self, chunks: AsyncIterator[bytes]) -> str:
+        await aiofiles.os.makedirs(self.staging, exist_ok=True)
+        staged = os.path.join(self.staging, uuid.uuid4().hex)
+        try:
+            async with aiofiles.open(staged, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+        except BaseException:
+            await self.discard(staged)
+            raise
+        return staged
+
+    async def commit(self, staged: str, key: str):
+        path = self.local_path(key)
+        if await aiofiles.os.path.exists(path):
+            await self.discard(staged)
+            return
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # rename is atomic, so readers never see a partly written file
+        await aiofiles.os.replace(staged, path)
+
+    async def discard(self, staged: str):
+        try:
+            await aiofiles.os.remove(staged)
+        except FileNotFoundError:
+            pass
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await aiofiles.os.stat(self.local_path(key))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def read(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.local_path(key), "rb") as f:
+            await f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await f.read(min(STORAGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _create_backend() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorageBackend(STORAGE_DIR)
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+
+
+backend: StorageBackend = _create_backend()
+
+
+def set_backend(new_backend: StorageBackend):
+    """Swap the storage backend, e.g. for an object store"""
+    global backend
+    backend = new_backend
+
+
+class UploadStream:
+    """The bytes of one uploaded file, read straight off the request
+
+    A multipart/form-data body is parsed incrementally and only the part named
+    field is passed on; any other body is taken as the raw file. Nothing is
+    spooled, so a file touches disk once, in the storage backend.
+    """
+
+    def __init__(self, request: Request, field: str = "file", allowed_types: Optional[Collection[str]] = None):
+        self.request = request
+        self.field = field
+        self.allowed_types = allowed_types
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+
+    def _accept(self, content_type: Optional[str]):
+        self.content_type = (content_type or "application/octet-stream").split(";")[0].strip().lower()
+        if self.allowed_types is not None and self.content_type not in self.allowed_types:
+            raise InvalidUpload(f"Unsupported file type {self.content_type}")
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        content_type = self.request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            return self._multipart(content_type)
+        self._accept(content_type)
+        return self.request.stream()
+
+    async def _multipart(self, content_type: str) -> AsyncIterator[bytes]:
+        _, params = parse_options_header(content_type)
+        if b"boundary" not in params:
+            raise InvalidUpload("Missing boundary in multipart body")
+
+        pending: List[bytes] = []
+        part = {"headers": {}, "name": b"", "value": b"", "target": False}
+        found = False
+
+        def on_part_begin():
+            part.update(headers={}, target=False)
+
+        def on_header_field(data: bytes, start: int, end: int):
+            part["name"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int):
+            part["value"] += data[start:end]
+
+        def on_header_end():
+            part["headers"][part["name"].lower()] = part["value"]
+            part.update(name=b"", value=b"")
+
+        def on_headers_finished():
+            nonlocal found
+            _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+            if found or options.get(b"name", b"").decode("latin-1") != self.field or b"filename" not in options:
+                return
+            found = part["target"] = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._accept(part["headers"].get(b"content-type", b"").decode("latin-1"))
+
+        def on_part_data(data: bytes, start: int, end: int):
+            if part["target"]:
+                pending.append(data[start:end])
+
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        })
+        async for chunk in self.request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise InvalidUpload(f"Malformed multipart body: {e}")
+            if pending:
+                yield b"".join(pending)
+                pending.clear()
+        parser.finalize()
+        if not found:
+            raise InvalidUpload(f"No file in form field {self.field!r}")
+
+
+@dataclass
+class StoredUpload:
+    sha256: str
+    size: int
+    content_type: str
+    filename: Optional[str]
+
+
+def identify_cover(data: bytes) -> str:
+    """Content type of a cover image, from what Pillow finds in it rather than what the client said"""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise InvalidUpload("Cover is not a readable image")
+    if image_format not in COVER_FORMATS:
+        raise InvalidUpload(f"Unsupported image format {image_format}")
+    return COVER_FORMATS[image_format]
+
+
+async def store_upload(
+    upload: UploadStream, max_bytes: int = MAX_UPLOAD_BYTES, identify: Optional[Callable[[bytes], str]] = None
+) -> StoredUpload:
+    """Write an upload to the backend, hashing it on the way, and publish it under its sha256
+
+    With identify, the upload is also kept in memory (so max_bytes should be
+    small) and checked before it is published: identify returns the content
+    type to record, or raises InvalidUpload.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    kept = bytearray() if identify else None
+
+    async def hashed() -> AsyncIterator[bytes]:
+        nonlocal size
+        async for chunk in upload:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File is larger than {max_bytes} bytes")
+            digest.update(chunk)
+            if kept is not None:
+                kept.extend(chunk)
+            yield chunk
+
+    staged = await backend.write_staged(hashed())
+    if size == 0:
+        await backend.discard(staged)
+        raise InvalidUpload("File is empty")
+    content_type = upload.content_type
+    if identify:
+        try:
+            content_type = await asyncio.to_thread(identify, bytes(kept))
+        except InvalidUpload:
+            await backend.discard(staged)
+            raise
+    sha256 = digest.hexdigest()
+    await backend.commit(staged, sha256)
+    return StoredUpload(sha256=sha256, size=size, content_type=content_type, filename=upload.filename)
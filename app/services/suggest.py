@@ -0,0 +1,317 @@
+import bisect
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.models.models import Book
+from app.services import book_events
+from app.services.authors import normalize
+from app.services.book_events import BookChange
+
+
+SUGGEST_INDEX_ENABLED = settings.suggest_index_enabled
+
+BUILD_BATCH_SIZE = 5000
+# names added since the last compaction are kept in a small side list that queries scan
+PENDING_LIMIT = 2048
+
+KINDS = ("title", "author")
+_AFTER_PREFIX = "\U0010ffff"
+
+logger = logging.getLogger(__name__)
+
+
+def query_prefix(q: str) -> str:
+    """Normalized form of what has been typed, keeping a trailing space so "harry " won't match "harryhausen\""""
+    prefix = normalize(q)
+    if prefix and q[-1:].isspace():
+        prefix += " "
+    return prefix
+
+
+def _tree(counts: array) -> List[array]:
+    """Max-tree levels over counts: levels[0] is counts padded to a power of two, levels[-1] the root"""
+    size = 1
+    while size < len(counts):
+        size *= 2
+    levels = [array("I", counts) + array("I", [0]) * (size - len(counts))]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append(array("I", map(max, level[0::2], level[1::2])))
+    return levels
+
+
+class _Names:
+    """The names of one kind: sorted normalized keys, their labels, a max-tree over their book counts, and the side list"""
+
+    def __init__(self, keys: List[str], labels: List[str], counts: array):
+        self.keys = keys
+        self.labels = labels
+        self.levels = _tree(counts)
+        self.new_keys: List[str] = []
+        self.new: Dict[str, list] = {}
+
+    def memory_bytes(self) -> int:
+        size = sys.getsizeof(self.keys) + sys.getsizeof(self.labels) + sum(map(sys.getsizeof, self.levels))
+        return size + sum(map(sys.getsizeof, self.keys)) + sum(map(sys.getsizeof, self.labels))
+
+    def _set_count(self, position: int, count: int):
+        for level in self.levels:
+            level[position] = count
+            if position ^ 1 < len(level):
+                count = max(count, level[position ^ 1])
+            position >>= 1
+
+    def add(self, key: str, label: str, delta: int):
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self._set_count(position, max(self.levels[0][position] + delta, 0))
+            return
+        entry = self.new.get(key)
+        if entry is None:
+            if delta <= 0:
+                return
+            entry = self.new[key] = [label, 0]
+            bisect.insort(self.new_keys, key)
+        entry[1] = max(entry[1] + delta, 0)
+
+    def snapshot(self) -> tuple:
+        """Copies of the main list and the side list, for a compaction to merge outside the lock"""
+        new = [(key, *self.new[key]) for key in self.new_keys]
+        return self.keys[:], self.labels[:], self.levels[0][:len(self.keys)], new
+
+    def _top(self, start: int, stop: int, limit: int) -> List[int]:
+        """Positions of the limit highest counts in [start, stop), highest first"""
+        heap = []
+        level = 0
+        while start < stop:
+            if start & 1:
+                heap.append((-self.levels[level][start], start << level, level, start))
+                start += 1
+            if stop & 1:
+                stop -= 1
+                heap.append((-self.levels[level][stop], stop << level, level, stop))
+            start >>= 1
+            stop >>= 1
+            level += 1
+        heapq.heapify(heap)
+        found = []
+        while heap and len(found) < limit:
+            count, _, level, position = heapq.heappop(heap)
+            if not count:
+                break
+            if not level:
+                found.append(position)
+                continue
+            for child in (position * 2, position * 2 + 1):
+                heapq.heappush(heap, (-self.levels[level - 1][child], child << (level - 1), level - 1, child))
+        return found
+
+    def candidates(self, prefix: str, limit: int) -> List[Tuple[int, str, str]]:
+        """(count, key, label) of the limit most used names starting with prefix, plus any in the side list"""
+        stop_key = prefix + _AFTER_PREFIX
+        start = bisect.bisect_left(self.keys, prefix)
+        stop = bisect.bisect_left(self.keys, stop_key, start)
+        found = [(self.levels[0][position], self.keys[position], self.labels[position])
+                 for position in self._top(start, stop, limit)]
+        position = bisect.bisect_left(self.new_keys, prefix)
+        while position < len(self.new_keys) and self.new_keys[position] < stop_key:
+            key = self.new_keys[position]
+            label, count = self.new[key]
+            if count:
+                found.append((count, key, label))
+            position += 1
+        return found
+
+
+def _merge(keys: List[str], labels: List[str], counts: array, new: List[tuple]) -> Tuple[List[str], List[str], array]:
+    """Splice the side list into the main one and drop names no book uses any more"""
+    # between slices of the main list, rather than sorting it all again
+    merged_keys, merged_labels, merged_counts = [], [], array("I")
+    previous = 0
+    for key, label, count in new:
+        position = bisect.bisect_left(keys, key, previous)
+        merged_keys += keys[previous:position]
+        merged_labels += labels[previous:position]
+        merged_counts += counts[previous:position]
+        merged_keys.append(key)
+        merged_labels.append(label)
+        merged_counts.append(count)
+        previous = position
+    merged_keys += keys[previous:]
+    merged_labels += labels[previous:]
+    merged_counts += counts[previous:]
+    return (
+        list(compress(merged_keys, merged_counts)),
+        list(compress(merged_labels, merged_counts)),
+        array("I", compress(merged_counts, merged_counts)),
+    )
+
+
+class SuggestIndex:
+    """Titles and authors, each with the number of books using it, for prefix autocomplete
+
+    Each kind keeps its names in its own sorted list, so a prefix is a
+    contiguous range found by bisect. A max-tree over the per-name book counts
+    gives the most popular k names of any range in O(k log n), however many
+    names share the prefix; without a kind, the top k of each are merged.
+    New names go to a small sorted side list until the next compaction, since
+    inserting into the main list would shift the tree.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._names: Dict[str, _Names] = {kind: _Names([], [], array("I")) for kind in KINDS}
+        # count deltas that arrive while a build or compaction runs, replayed onto its result
+        self._pending: Optional[List[Tuple[str, str, str, int]]] = None
+        self._compacting = False
+        self.ready = False
+        self.build_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+
+    def apply(self, changes: List[BookChange]):
+        """Book change listener: count the names of created, updated and deleted books"""
+        deltas: Counter = Counter()
+        labels: Dict[Tuple[str, str], str] = {}
+        for change in changes:
+            for snapshot, sign in ((change.before, -1), (change.after, 1)):
+                if snapshot is None:
+                    continue
+                for kind in KINDS:
+                    key = (kind, normalize(snapshot[kind]))
+                    deltas[key] += sign
+                    labels.setdefault(key, snapshot[kind])
+        with self._lock:
+            for (kind, key), delta in deltas.items():
+                if delta:
+                    self._names[kind].add(key, labels[kind, key], delta)
+                    if self._pending is not None:
+                        self._pending.append((kind, key, labels[kind, key], delta))
+            new_names = sum(len(names.new_keys) for names in self._names.values())
+            compact = self.ready and not self._compacting and new_names > PENDING_LIMIT
+            if compact:
+                self._compacting = True
+        if compact:
+            threading.Thread(target=self.compact, name="suggest-index-compact", daemon=True).start()
+
+    def _install(self, names: Dict[str, _Names], started: float):
+        memory_bytes = sum(kind_names.memory_bytes() for kind_names in names.values())
+        with self._lock:
+            self._names = names
+            pending, self._pending = self._pending, None
+            for kind, key, label, delta in pending:
+                self._names[kind].add(key, label, delta)
+            self.build_seconds = time.perf_counter() - started
+            self.memory_bytes = memory_bytes
+            self.ready = True
+
+    def build(self, rows: Iterable[Tuple[str, str, int]]):
+        """Replace the contents with (kind, name, book count) rows
+
+        Spellings that normalize alike are counted together, under the most
+        used one.
+        """
+        started = time.perf_counter()
+        # a write that commits while the table is read can be counted twice; the
+        # counts only rank suggestions, and the next build corrects them
+        with self._lock:
+            self._pending = []
+        totals: Dict[str, Dict[str, int]] = {kind: {} for kind in KINDS}
+        best: Dict[str, Dict[str, Tuple[int, str]]] = {kind: {} for kind in KINDS}
+        for kind, name, count in rows:
+            key = normalize(name)
+            kind_totals, kind_best = totals[kind], best[kind]
+            kind_totals[key] = kind_totals.get(key, 0) + count
+            if key not in kind_best or count > kind_best[key][0]:
+                kind_best[key] = (count, name)
+        names = {}
+        for kind in KINDS:
+            keys = sorted(totals[kind])
+            names[kind] = _Names(
+                keys, [best[kind][key][1] for key in keys], array("I", (totals[kind][key] for key in keys))
+            )
+        self._install(names, started)
+
+    def compact(self):
+        """Merge the side lists into the main ones and drop names no book uses any more"""
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self._pending = []
+                snapshots = {kind: names.snapshot() for kind, names in self._names.items()}
+            self._install({kind: _Names(*_merge(*snapshot)) for kind, snapshot in snapshots.items()}, started)
+        finally:
+            self._compacting = False
+
+    def suggest(self, prefix: str, limit: int = 10, kind: Optional[str] = None) -> List[dict]:
+        """Most used titles and authors starting with the normalized prefix"""
+        candidates = []
+        with self._lock:
+            for entry_kind in (KINDS if kind is None else (kind,)):
+                candidates += [
+                    (count, key, entry_kind, label)
+                    for count, key, label in self._names[entry_kind].candidates(prefix, limit)
+                ]
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+        return [
+            {"text": label, "kind": entry_kind, "book_count": count}
+            for count, _, entry_kind, label in candidates[:limit]
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "names": sum(len(names.keys) for names in self._names.values()),
+                "new_names": sum(len(names.new_keys) for names in self._names.values()),
+                "memory_bytes": self.memory_bytes,
+                "build_seconds": self.build_seconds,
+            }
+
+
+index = SuggestIndex()
+
+
+def is_ready() -> bool:
+    return SUGGEST_INDEX_ENABLED and index.ready
+
+
+def _name_counts(db) -> Iterable[Tuple[str, str, int]]:
+    for kind in KINDS:
+        column = getattr(Book, kind)
+        rows = db.execute(
+            select(column, func.count()).group_by(column).execution_options(yield_per=BUILD_BATCH_SIZE)
+        )
+        for name, count in rows:
+            yield kind, name, count
+
+
+def rebuild():
+    """Count every title and author in the books table"""
+    db = SessionLocal()
+    try:
+        index.build(_name_counts(db))
+    finally:
+        db.close()
+    logger.info(
+        "Suggest index built: %(names)s names, %(memory_bytes)s bytes in %(build_seconds).2fs",
+        index.stats(),
+    )
+
+
+def start():
+    """Subscribe to book changes and build the index in the background"""
+    if not SUGGEST_INDEX_ENABLED:
+        return
+    book_events.subscribe(index.apply)
+    threading.Thread(target=rebuild, name="suggest-index-build", daemon=True).start()
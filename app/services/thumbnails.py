@@ -0,0 +1,216 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, FrozenSet, Optional, Tuple, Union
+
+from app.config import settings
+from app.services import storage
+from app.services.cache import LRUTTLCache
+
+
+THUMBNAIL_SIZES = tuple(sorted(int(size) for size in settings.thumbnail_sizes.split(',')))
+THUMBNAIL_FORMAT = settings.thumbnail_format.lower()
+THUMBNAIL_QUALITY = settings.thumbnail_quality
+THUMBNAIL_WORKERS = settings.thumbnail_workers
+THUMBNAIL_QUEUE_SIZE = settings.thumbnail_queue_size
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+RECENT_JOBS = 20
+
+logger = logging.getLogger(__name__)
+
+
+def derivative_key(sha256: str, size: int) -> str:
+    """Content-addressed key of a variant: same cover, size and format, same key"""
+    return f"{sha256}-{size}.{THUMBNAIL_FORMAT}"
+
+
+def media_type() -> str:
+    return MEDIA_TYPES[THUMBNAIL_FORMAT]
+
+
+def _render(source: Union[str, bytes], sizes: Tuple[int, ...], fmt: str, quality: int) -> Tuple[Dict[int, bytes], float, float]:
+    """Resize one image to every size; runs in a worker process"""
+    from PIL import Image, ImageOps
+
+    started_at = time.time()
+    started = time.perf_counter()
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as image:
+        # lets JPEG decode at a reduced scale instead of full resolution
+        image.draft("RGB", (max(sizes), max(sizes)))
+        current = ImageOps.exif_transpose(image)
+        current = current.convert("RGBA" if fmt in ("webp", "png") and "A" in current.getbands() else "RGB")
+        outputs = {}
+        # each variant is scaled down from the next larger one, not from the original
+        for size in sorted(sizes, reverse=True):
+            current = current.copy()
+            current.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            current.save(buffer, format=fmt.upper(), quality=quality)
+            outputs[size] = buffer.getvalue()
+    return outputs, started_at, time.perf_counter() - started
+
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.render_seconds_total = 0.0
+        self.render_seconds_max = 0.0
+        self.wait_seconds_total = 0.0
+        self.recent: deque = deque(maxlen=RECENT_JOBS)
+
+
+_metrics = _Metrics()
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+# source sha256 -> running job, so a cover is never rendered twice at once
+_pending: Dict[str, asyncio.Task] = {}
+# source sha256 -> sizes known to be stored; derivatives never change once written
+_available = LRUTTLCache(10000, 24 * 3600)
+# sources whose last job failed, left alone for a while instead of retried on every read
+_failed = LRUTTLCache(10000, 300)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, since forking a process that already runs threads can deadlock the child
+            _executor = ProcessPoolExecutor(
+                max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+async def _write(key: str, data: bytes):
+    async def chunks():
+        yield data
+
+    await storage.backend.commit(await storage.backend.write_staged(chunks()), key)
+
+
+async def _run(sha256: str, sizes: Tuple[int, ...], enqueued_at: float):
+    job = {"sha256": sha256, "sizes": list(sizes)}
+    try:
+        source = storage.backend.local_path(sha256)
+        if source is None:
+            size = await storage.backend.size(sha256)
+            source = b"".join([chunk async for chunk in storage.backend.read(sha256, 0, size - 1)])
+        outputs, started_at, render_seconds = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), _render, source, sizes, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+        )
+        for size, data in outputs.items():
+            await _write(derivative_key(sha256, size), data)
+        _available.set(sha256, frozenset(_available.get(sha256) or ()) | frozenset(outputs))
+    except Exception as e:
+        logger.exception("Thumbnail job for %s failed", sha256)
+        job.update(status="failed", error=str(e), total_ms=round(1000 * (time.time() - enqueued_at), 3))
+        _failed.set(sha256, True)
+        with _metrics.lock:
+            _metrics.failed += 1
+            _metrics.recent.append(job)
+        return
+    finally:
+        _pending.pop(sha256, None)
+
+    wait_seconds = max(0.0, started_at - enqueued_at)
+    job.update(
+        status="completed",
+        wait_ms=round(1000 * wait_seconds, 3),
+        render_ms=round(1000 * render_seconds, 3),
+        total_ms=round(1000 * (time.time() - enqueued_at), 3),
+    )
+    logger.info("Rendered %d thumbnails of %s in %.1fms (waited %.1fms)",
+                len(sizes), sha256, job["render_ms"], job["wait_ms"])
+    with _metrics.lock:
+        _metrics.completed += 1
+        _metrics.render_seconds_total += render_seconds
+        _metrics.render_seconds_max = max(_metrics.render_seconds_max, render_seconds)
+        _metrics.wait_seconds_total += wait_seconds
+        _metrics.recent.append(job)
+
+
+def enqueue(sha256: str, sizes: Tuple[int, ...] = THUMBNAIL_SIZES) -> bool:
+    """Queue rendering of a cover's variants; False if the queue is full
+
+    A rejected job is not retried here: the next read of a missing size queues
+    it again. A failed one is retried that way once it has been a while.
+    """
+    if sha256 in _pending:
+        return True
+    if _failed.get(sha256):
+        return False
+    if len(_pending) >= THUMBNAIL_WORKERS + THUMBNAIL_QUEUE_SIZE:
+        with _metrics.lock:
+            _metrics.rejected += 1
+        return False
+    _pending[sha256] = asyncio.get_running_loop().create_task(_run(sha256, sizes, time.time()))
+    return True
+
+
+async def available_sizes(sha256: str) -> FrozenSet[int]:
+    known = _available.get(sha256)
+    if known is not None and len(known) == len(THUMBNAIL_SIZES):
+        return known
+    found = frozenset([
+        size for size in THUMBNAIL_SIZES
+        if await storage.backend.size(derivative_key(sha256, size)) is not None
+    ])
+    _available.set(sha256, found)
+    return found
+
+
+def target_size(requested: int) -> int:
+    """The smallest configured size that covers requested, or the largest one"""
+    return next((size for size in THUMBNAIL_SIZES if size >= requested), THUMBNAIL_SIZES[-1])
+
+
+async def nearest(sha256: str, requested: int) -> Tuple[Optional[int], int]:
+    """(closest stored size or None, wanted size); queues rendering when the wanted size is missing"""
+    wanted = target_size(requested)
+    available = await available_sizes(sha256)
+    if wanted not in available:
+        enqueue(sha256)
+    if not available:
+        return None, wanted
+    return min(available, key=lambda size: (abs(size - wanted), -size)), wanted
+
+
+def placeholder(size: int) -> bytes:
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">'
+        f'<rect width="100%" height="100%" fill="#e5e7eb"/></svg>'
+    ).encode()
+
+
+def stats() -> dict:
+    with _metrics.lock:
+        completed = _metrics.completed
+        return {
+            "workers": THUMBNAIL_WORKERS,
+            "sizes": list(THUMBNAIL_SIZES),
+            "pending": len(_pending),
+            "completed": completed,
+            "failed": _metrics.failed,
+            "rejected": _metrics.rejected,
+            "render_ms_avg": round(1000 * _metrics.render_seconds_total / completed, 3) if completed else 0.0,
+            "render_ms_max": round(1000 * _metrics.render_seconds_max, 3),
+            "wait_ms_avg": round(1000 * _metrics.wait_seconds_total / completed, 3) if completed else 0.0,
+            "recent_jobs": list(_metrics.recent),
+        }
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,137 @@
+"""Synthetic catalog generator
+
+    python -m benchmarks.catalog --books 100000 --users 500 --reset
+
+Writes to DATABASE_URL (or --database-url). The same --seed always produces
+the same catalog, so runs against different commits compare like for like.
+Every generated user has the password BENCH_PASSWORD.
+"""
+import argparse
+import random
+import time
+from typing import Iterator, List
+
+from app.config import settings
+
+
+BENCH_PASSWORD = "benchmark"
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+BATCH_SIZE = 10000
+
+_SYLLABLES = (
+    "an", "bel", "cor", "da", "el", "fen", "gar", "hol", "is", "jor", "ka", "lin", "mor",
+    "nel", "or", "pra", "quin", "ros", "sil", "tor", "ul", "var", "wen", "xan", "yor", "zel",
+)
+_TOPICS = (
+    "history", "garden", "wizard", "ocean", "mystery", "cooking", "war", "love", "science",
+    "travel", "music", "dragon", "city", "river", "winter", "machine", "empire", "poetry",
+)
+
+
+def user_email(index: int) -> str:
+    return f"bench{index}@example.com"
+
+
+def book_isbn(index: int) -> str:
+    return f"979{index:010d}"
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def vocabulary(seed: int = 42, size: int = 200) -> List[str]:
+    """Words that occur in generated titles, for search scenarios"""
+    rng = random.Random(seed)
+    return [_word(rng).lower() for _ in range(size)] + list(_TOPICS)
+
+
+def generate_books(count: int, users: int, seed: int = 42, start: int = 0) -> Iterator[dict]:
+    words = vocabulary(seed)
+    authors = [f"{_word(random.Random(seed + i))} {_word(random.Random(-seed - i))}" for i in range(max(users * 4, 1))]
+    rng = random.Random(seed * 7919 + start)
+    for index in range(start, start + count):
+        topic = rng.choice(_TOPICS)
+        yield {
+            "title": f"{rng.choice(words).capitalize()} {rng.choice(words).capitalize()} of the {topic.capitalize()}",
+            "author": rng.choice(authors),
+            "description": f"A {topic} story about {rng.choice(words)} and {rng.choice(words)}.",
+            "isbn": book_isbn(index),
+            "price": round(rng.uniform(1, 120), 2),
+            "user_id": rng.randint(1, users),
+        }
+
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def populate(database_url: str, books: int, users: int, seed: int = 42, reset: bool = False, rounds: int = BCRYPT_ROUNDS):
+    # imported here so scenarios can use the generator without a configured database
+    from passlib.context import CryptContext
+    from sqlalchemy import create_engine, insert, text
+
+    from app.models.models import Base, Book, User
+    from app.services import catalog_stats
+    from app.services.search import ensure_search_schema
+
+    engine = create_engine(database_url)
+    if reset:
+        Base.metadata.drop_all(engine)
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS books_fts")
+    Base.metadata.create_all(engine)
+    ensure_search_schema(engine)
+
+    # one hash for everyone: generating a bcrypt hash per user would dominate setup time
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash(BENCH_PASSWORD)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "email": user_email(i), "username": f"bench{i}", "hashed_password": hashed}
+            for i in range(1, users + 1)
+        ])
+
+    inserted = 0
+    for batch in _batches(generate_books(books, users, seed), BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(insert(Book), batch)
+        inserted += len(batch)
+        print(f"\r{inserted}/{books} books", end="", flush=True)
+
+    # books went in without the app's write hooks, so derive the aggregates once
+    with engine.begin() as conn:
+        catalog_stats.rebuild(conn)
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE users"))
+            conn.execute(text("ANALYZE books"))
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))"))
+    print(f"\n{users} users and {books} books in {time.perf_counter() - started:.1f}s")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS,
+                        help="bcrypt cost of the shared password; keep it equal to the server's BCRYPT_ROUNDS")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    args = parser.parse_args()
+    populate(args.database_url, args.books, args.users, args.seed, args.reset, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
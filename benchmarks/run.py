@@ -0,0 +1,202 @@
+"""Run benchmark scenarios and compare results against a baseline
+
+    python -m benchmarks.run run --books 100000 --users 500 --output results.json
+    python -m benchmarks.run compare baseline.json results.json
+
+Without --base-url the app runs in-process over ASGI against DATABASE_URL,
+so no server is needed; with it, requests go to a running server. The
+catalog must already exist (python -m benchmarks.catalog) with matching
+--books/--users/--seed.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.scenarios import SCENARIOS, Context, prepare
+
+
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "csv_import"]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, rows_per_request: int) -> dict:
+    latencies.sort()
+    ok = len(latencies)
+    return {
+        "requests": ok + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(ok * rows_per_request / elapsed, 2) if elapsed else 0.0,
+        "throughput_unit": "rows/s" if rows_per_request > 1 else "req/s",
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_scenario(ctx: Context, name: str, duration: float, concurrency: int, warmup: float, seed: int) -> dict:
+    request, rows_per_request = SCENARIOS[name]
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(worker_id: int, until: float, record: bool):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            try:
+                response = await request(ctx, rng)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if not record:
+                continue
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    if warmup:
+        await asyncio.gather(*(worker(i, time.perf_counter() + warmup, False) for i in range(concurrency)))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, started + duration, True) for i in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started, rows_per_request)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        app = None
+    else:
+        from app.main import app
+        from app.services import rate_limit
+        # every benchmark request comes from one client; measure the app, not the limiter
+        rate_limit.RATE_LIMIT_ENABLED = False
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    results: Dict[str, dict] = {}
+    try:
+        ctx = Context(client=client, books=args.books, users=args.users, seed=args.seed)
+        await prepare(ctx)
+        for name in args.scenarios:
+            result = await run_scenario(ctx, name, args.duration, args.concurrency, args.warmup, args.seed)
+            results[name] = result
+            print(
+                f"{name:18} {result['throughput']:>10} {result['throughput_unit']:6} "
+                f"p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  p99 {result['p99_ms']:>8}ms  "
+                f"errors {result['errors']}",
+                flush=True,
+            )
+    finally:
+        await client.aclose()
+        if app is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "target": args.base_url or "in-process",
+        "books": args.books,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """Scenarios whose p95 latency rose or throughput fell by more than tolerance"""
+    regressions = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if before["throughput"] and now["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {before['throughput']} -> {now['throughput']} {now['throughput_unit']}"
+            )
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run scenarios")
+    run_parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    run_parser.add_argument("--books", type=int, default=10000)
+    run_parser.add_argument("--users", type=int, default=100)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--scenarios", type=lambda value: value.split(","), default=DEFAULT_SCENARIOS,
+                            help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    run_parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    run_parser.add_argument("--warmup", type=float, default=2, help="unrecorded seconds before each scenario")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--output", help="write results as JSON")
+    run_parser.add_argument("--baseline", help="compare against this results file when done")
+    run_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10,
+                                help="allowed relative change before a scenario counts as regressed")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        unknown = set(args.scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        current = asyncio.run(run(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    regressions = compare(baseline, current, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.catalog import BENCH_PASSWORD, generate_books, user_email, vocabulary
+
+
+@dataclass
+class Context:
+    """What scenarios need to know about the generated catalog"""
+    client: httpx.AsyncClient
+    books: int
+    users: int
+    seed: int = 42
+    token: Optional[str] = None
+    words: List[str] = field(default_factory=list)
+    # isbn indexes past the generated catalog, so writes never collide with it
+    next_isbn: int = 0
+
+    def auth(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+Request = Callable[[Context, random.Random], Awaitable[httpx.Response]]
+
+
+async def list_first_page(ctx: Context, rng: random.Random) -> httpx.Response:
+    return await ctx.client.get("/books/", params={"size": 20})
+
+
+async def list_deep_offset(ctx: Context, rng: random.Random) -> httpx.Response:
+    last_page = max(1, min(ctx.books // 20, 500))
+    return await ctx.client.get("/books/", params={"size": 20, "page": rng.randint(last_page // 2, last_page)})
+
+
+async def list_cursor_walk(ctx: Context, rng: random.Random) -> httpx.Response:
+    """Follow next_cursor five pages deep; timed as one request"""
+    params = {"size": 20, "sort": "id"}
+    response = None
+    for _ in range(5):
+        response = await ctx.client.get("/books/", params=params)
+        cursor = response.json().get("next_cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    return response
+
+
+async def search(ctx: Context, rng: random.Random) -> httpx.Response:
+    terms = " ".join(rng.sample(ctx.words, rng.randint(1, 2)))
+    return await ctx.client.get("/books/", params={"query": terms, "size": 20})
+
+
+async def search_prefix(ctx: Context, rng: random.Random) -> httpx.Response:
+    word = rng.choice(ctx.words)
+    return await ctx.client.get("/books/", params={"query": word[:3], "size": 20})
+
+
+async def suggest(ctx: Context, rng: random.Random) -> httpx.Response:
+    word = rng.choice(ctx.words)
+    return await ctx.client.get("/books/suggest", params={"q": word[:rng.randint(1, 4)]})
+
+
+async def get_book(ctx: Context, rng: random.Random) -> httpx.Response:
+    return await ctx.client.get(f"/books/{rng.randint(1, ctx.books)}")
+
+
+async def create_book(ctx: Context, rng: random.Random) -> httpx.Response:
+    row = next(generate_books(1, ctx.users, ctx.seed, start=ctx.next_isbn))
+    ctx.next_isbn += 1
+    del row["user_id"]
+    return await ctx.client.post("/books/", json=row, headers=ctx.auth())
+
+
+async def login(ctx: Context, rng: random.Random) -> httpx.Response:
+    email = user_email(rng.randint(1, ctx.users))
+    return await ctx.client.post("/user/log_in", json={"email": email, "password": BENCH_PASSWORD})
+
+
+CSV_IMPORT_ROWS = 5000
+
+
+async def csv_import(ctx: Context, rng: random.Random) -> httpx.Response:
+    rows = generate_books(CSV_IMPORT_ROWS, ctx.users, ctx.seed, start=ctx.next_isbn)
+    ctx.next_isbn += CSV_IMPORT_ROWS
+    lines = ["title,author,description,isbn,price"]
+    for row in rows:
+        lines.append(f'"{row["title"]}","{row["author"]}","{row["description"]}",{row["isbn"]},{row["price"]}')
+    body = ("\n".join(lines) + "\n").encode()
+    return await ctx.client.post(
+        "/upload/books/upload", files={"file": ("bench.csv", body, "text/csv")}, headers=ctx.auth()
+    )
+
+
+# name -> (request, rows per request); rows turn csv_import throughput into rows/s
+SCENARIOS: Dict[str, tuple] = {
+    "list_first_page": (list_first_page, 1),
+    "list_deep_offset": (list_deep_offset, 1),
+    "list_cursor_walk": (list_cursor_walk, 1),
+    "search": (search, 1),
+    "search_prefix": (search_prefix, 1),
+    "suggest": (suggest, 1),
+    "get_book": (get_book, 1),
+    "create_book": (create_book, 1),
+    "login": (login, 1),
+    "csv_import": (csv_import, CSV_IMPORT_ROWS),
+}
+
+
+async def prepare(ctx: Context):
+    """Log in as the first benchmark user, pick search words and where new books' ISBNs start"""
+    ctx.words = vocabulary(ctx.seed)
+    # past every book already there, so a rerun with the same --seed sends the same
+    # books without colliding with the ones earlier runs created
+    stats = await ctx.client.get("/books/stats")
+    stats.raise_for_status()
+    ctx.next_isbn = max(ctx.books, stats.json()["book_count"])
+    response = await ctx.client.post("/user/log_in", json={"email": user_email(1), "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    ctx.token = response.json()["access_token"]
@@ -0,0 +1,29 @@
+import os
+import tempfile
+import uuid
+
+_workdir = tempfile.mkdtemp(prefix="bookstore-tests-")
+# settings are read once, at first import of app.config, so these go in before any app import
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/test.db")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("STORAGE_DIR", f"{_workdir}/files")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    client.post("/user/sign_up", json={"username": "tester", "email": email, "password": "pw"})
+    response = client.post("/user/log_in", json={"email": email, "password": "pw"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,134 @@
+import fnmatch
+import math
+import time
+from typing import Dict, Optional, Set
+
+from app.services import cache, rate_limit
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+class FakeRedis:
+    """In-memory stand-in for a redis.asyncio client, with the commands and scripts the app uses
+
+    eval runs a Python port of each known script instead of Lua, so the Lua
+    itself is only exercised against a real server (TEST_REDIS_URL).
+    """
+
+    def __init__(self):
+        self.strings: Dict[bytes, bytes] = {}
+        self.sets: Dict[bytes, Set[bytes]] = {}
+        self.hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.calls = 0
+        self.scripts = {
+            cache._STORE_SCRIPT: self._store_script,
+            cache._INVALIDATE_SCRIPT: self._invalidate_script,
+            rate_limit._TAKE_SCRIPT: self._take_script,
+        }
+
+    def _alive(self, key: bytes) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._delete(key)
+        return key in self.strings or key in self.sets or key in self.hashes
+
+    def _delete(self, key: bytes) -> int:
+        self.expires.pop(key, None)
+        return sum(int(store.pop(key, None) is not None) for store in (self.strings, self.sets, self.hashes))
+
+    def _expire(self, key: bytes, seconds) -> None:
+        self.expires[key] = time.monotonic() + float(seconds)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        return self.strings.get(key) if self._alive(key) else None
+
+    async def get(self, key) -> Optional[bytes]:
+        self.calls += 1
+        return self._get(_encode(key))
+
+    async def mget(self, *keys):
+        self.calls += 1
+        return [self._get(_encode(key)) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.calls += 1
+        key = _encode(key)
+        self._delete(key)
+        self.strings[key] = _encode(value)
+        if ex is not None:
+            self._expire(key, ex)
+        return True
+
+    async def incr(self, key) -> int:
+        self.calls += 1
+        return self._incr(_encode(key))
+
+    def _incr(self, key: bytes) -> int:
+        value = int(self._get(key) or 0) + 1
+        self.strings[key] = _encode(value)
+        return value
+
+    async def delete(self, *keys) -> int:
+        self.calls += 1
+        return sum(self._delete(_encode(key)) for key in keys)
+
+    async def scan_iter(self, match=None, count=None):
+        self.calls += 1
+        for key in [*self.strings, *self.sets, *self.hashes]:
+            if self._alive(key) and (match is None or fnmatch.fnmatchcase(key.decode(), match)):
+                yield key
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        self.calls += 1
+        values = [_encode(value) for value in keys_and_args]
+        return self.scripts[script](values[:numkeys], values[numkeys:])
+
+    def _store_script(self, keys, args):
+        generation_key, invalidated_at_key, entry_key, tag_keys = keys[0], keys[1], keys[2], keys[3:]
+        generation, value, ttl, key, settle = args
+        if (self._get(generation_key) or b"0") != generation:
+            return 0
+        if time.time() - float(self._get(invalidated_at_key) or 0) < float(settle):
+            return 0
+        self.strings[entry_key] = value
+        self._expire(entry_key, ttl)
+        for tag_key in tag_keys:
+            if not self._alive(tag_key):
+                self.sets[tag_key] = set()
+            self.sets[tag_key].add(key)
+            self._expire(tag_key, ttl)
+        return 1
+
+    def _invalidate_script(self, keys, args):
+        generation_key, invalidated_at_key, tag_keys = keys[0], keys[1], keys[2:]
+        prefix = args[0]
+        self._incr(generation_key)
+        self.strings[invalidated_at_key] = _encode(time.time())
+        for tag_key in tag_keys:
+            members = self.sets.get(tag_key, set()) if self._alive(tag_key) else set()
+            for member in members:
+                self._delete(prefix + member)
+            self._delete(tag_key)
+        return 1
+
+    def _take_script(self, keys, args):
+        requests, rate = float(args[0]), float(args[1])
+        now = time.time()
+        state = self.hashes.get(keys[0], {}) if self._alive(keys[0]) else {}
+        tokens = float(state.get(b"tokens", requests))
+        updated = float(state.get(b"updated", now))
+        tokens = min(requests, tokens + max(0, now - updated) * rate)
+        allowed = 0
+        if tokens >= 1:
+            tokens -= 1
+            allowed = 1
+        self.hashes[keys[0]] = {b"tokens": _encode(tokens), b"updated": _encode(now)}
+        self._expire(keys[0], math.ceil((requests - tokens) / rate) + 1)
+        return [allowed, _encode(tokens)]
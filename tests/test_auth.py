@@ -0,0 +1,26 @@
+import time
+import uuid
+
+from jose import jwt
+
+from app.config import settings
+
+
+def _sign_up_and_log_in(client):
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    client.post("/user/sign_up", json={"username": "tester", "email": email, "password": "pw"})
+    return client.post("/user/log_in", json={"email": email, "password": "pw"}).json()
+
+
+def _lifetime(token: str) -> float:
+    claims = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    return claims["exp"] - time.time()
+
+
+def test_access_token_expires_after_the_configured_minutes(client):
+    tokens = _sign_up_and_log_in(client)
+    refreshed = client.post("/user/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    for token in (tokens["access_token"], refreshed["access_token"]):
+        lifetime = _lifetime(token)
+        assert settings.access_token_expire_minutes * 60 - 60 < lifetime <= settings.access_token_expire_minutes * 60
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import uuid
+
+from app.services import book_batch
+
+
+def _ndjson(operations) -> bytes:
+    return b"".join(json.dumps(operation).encode() + b"\n" for operation in operations)
+
+
+def test_ndjson_lines_split_across_chunks_are_joined():
+    async def chunks():
+        for chunk in (b'{"op": "del', b'ete", "id": 1}\n\n{"op"', b': "delete", "id": 2}'):
+            yield chunk
+
+    async def collect():
+        return [item async for item in book_batch.iter_ndjson(chunks())]
+
+    assert asyncio.run(collect()) == [{"op": "delete", "id": 1}, {"op": "delete", "id": 2}]
+
+
+def test_ndjson_batch_is_applied(client, auth_headers):
+    title = uuid.uuid4().hex
+    response = client.post(
+        "/books/batch", headers={**auth_headers, "Content-Type": "application/x-ndjson"},
+        content=_ndjson([{"op": "create", "book": {"title": title, "author": "A"}}] * 3),
+    )
+
+    assert response.json()["applied"] == 3
+
+
+def test_conflicting_operation_fails_alone(client, auth_headers, monkeypatch):
+    isbn = str(uuid.uuid4().int)[:20]
+    client.post("/books/", headers=auth_headers, json={"title": "Taken", "author": "A", "isbn": isbn})
+    # as if the ISBN was claimed by a write that committed after the chunk looked it up
+    monkeypatch.setattr(book_batch, "find_existing_isbns", lambda db, isbns: {})
+
+    response = client.post("/books/batch", headers=auth_headers, json=[
+        {"op": "create", "book": {"title": "Fine", "author": "A"}},
+        {"op": "create", "book": {"title": "Clash", "author": "A", "isbn": isbn}},
+        {"op": "create", "book": {"title": "Also fine", "author": "A"}},
+    ])
+
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == ["created", "error", "created"]
+    assert body["results"][1]["error"] == book_batch.CONFLICT_ERROR
+    assert body["applied"] == 2
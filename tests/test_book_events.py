@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime
+
+import orjson
+import pytest
+from sqlalchemy import insert, select
+
+from app.database.database import SessionLocal
+from app.models.models import BookChangeLog
+from app.services import book_events, search_index
+
+
+@pytest.fixture
+def feed(client):
+    feed = book_events.ChangeFeed(SessionLocal)
+    feed.skip_to_end()
+    return feed
+
+
+@pytest.fixture
+def received():
+    changes = []
+    book_events.subscribe(changes.extend)
+    yield changes
+    book_events.unsubscribe(changes.extend)
+
+
+def _log(origin, before, after):
+    with SessionLocal() as db:
+        db.execute(insert(BookChangeLog).values(origin=origin, changes=orjson.dumps([[before, after]]).decode()))
+        db.commit()
+
+
+def _snapshot(book_id, title):
+    return {
+        "id": book_id, "title": title, "author": "Remote Author", "author_id": None, "description": None,
+        "isbn": None, "price": 3.0, "user_id": 1, "created_at": "2025-10-20T10:00:00", "updated_at": None,
+        "file_path": None, "cover_image": None,
+    }
+
+
+def test_book_writes_are_logged(client, auth_headers):
+    title = f"Logged {uuid.uuid4().hex}"
+    client.post("/books/", headers=auth_headers, json={"title": title, "author": "Someone", "isbn": uuid.uuid4().hex})
+
+    with SessionLocal() as db:
+        payload = db.scalars(select(BookChangeLog.changes).order_by(BookChangeLog.id.desc()).limit(1)).one()
+    [[before, after]] = orjson.loads(payload)
+    assert before is None
+    assert after["title"] == title
+    assert after["author_id"] is not None
+
+
+def test_feed_delivers_other_processes_changes_once(feed, received):
+    _log("another-worker", None, _snapshot(900001, "Remote Title"))
+
+    assert feed.poll() == 1
+    assert feed.poll() == 0
+    [change] = received
+    assert change.after["title"] == "Remote Title"
+    assert isinstance(change.after["created_at"], datetime)
+
+
+def test_feed_skips_this_processes_changes(feed, received):
+    _log(book_events._origin(), None, _snapshot(900002, "Local Title"))
+
+    assert feed.poll() == 0
+    assert received == []
+
+
+def test_feed_keeps_the_search_index_current(feed):
+    search_index.index.apply([])
+    _log("another-worker", None, _snapshot(900003, "Zanzibar Chronicles"))
+    book_events.subscribe(search_index.index.apply)
+    try:
+        feed.poll()
+        total, books = search_index.index.search(["zanzibar"])
+        assert [book["id"] for book in books] == [900003]
+
+        _log("another-worker", _snapshot(900003, "Zanzibar Chronicles"), None)
+        feed.poll()
+        assert search_index.index.search(["zanzibar"]) == (0, [])
+    finally:
+        book_events.unsubscribe(search_index.index.apply)
@@ -0,0 +1,42 @@
+import itertools
+
+from sqlalchemy import func, select
+
+from app.database.database import SessionLocal
+from app.models.models import PriceBucketStats
+from app.services import catalog_stats
+
+
+def _bucket(client, min_price):
+    buckets = client.get("/books/stats/prices").json()["buckets"]
+    return next(bucket for bucket in buckets if bucket["min_price"] == min_price)
+
+
+def test_price_range_totals_are_summed_over_shards(client, auth_headers, monkeypatch):
+    shards = itertools.cycle(range(3))
+    monkeypatch.setattr(catalog_stats.random, "randrange", lambda stop: next(shards))
+    before = _bucket(client, 50.0)
+
+    book_ids = [
+        client.post("/books/", headers=auth_headers, json={"title": "Sharded", "author": "S. Hard", "price": 60}).json()["id"]
+        for _ in range(4)
+    ]
+    client.delete(f"/books/{book_ids[0]}", headers=auth_headers)
+
+    after = _bucket(client, 50.0)
+    assert after["book_count"] == before["book_count"] + 3
+    assert after["total_value"] == round(before["total_value"] + 180, 2)
+    with SessionLocal() as db:
+        bucket = catalog_stats.bucket_of(60)
+        used = db.scalar(select(func.count()).where(PriceBucketStats.bucket == bucket, PriceBucketStats.shard > 0))
+        assert used >= 2
+        assert all(not table["mismatches"] for table in catalog_stats.check(db).values())
+
+
+def test_rebuild_folds_shards_into_one_row(client, auth_headers):
+    client.post("/books/", headers=auth_headers, json={"title": "Folded", "author": "F. Old", "price": 7})
+    with SessionLocal() as db:
+        catalog_stats.rebuild(db)
+        db.commit()
+        assert db.scalar(select(func.count()).where(PriceBucketStats.shard != 0)) == 0
+        assert all(not table["mismatches"] for table in catalog_stats.check(db).values())
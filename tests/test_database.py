@@ -0,0 +1,41 @@
+import asyncio
+
+from app.database import database
+
+
+class _Connection:
+    def __init__(self):
+        self.statements = []
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+
+def test_statement_timeout_is_set_per_transaction(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 1500)
+    conn = _Connection()
+
+    database._set_statement_timeout(conn)
+
+    assert conn.statements == ["SET LOCAL statement_timeout = 1500"]
+    assert "connect_args" not in database.engine_options("postgresql://u:p@db/bookstore")
+    assert "connect_args" not in database.engine_options("postgresql+asyncpg://u:p@db/bookstore", is_async=True)
+
+
+def test_pgbouncer_turns_off_prepared_statement_caches(monkeypatch):
+    monkeypatch.setattr(database, "DB_PGBOUNCER", True)
+
+    connect_args = database.engine_options("postgresql+asyncpg://u:p@db/bookstore", is_async=True)["connect_args"]
+
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
+    assert "connect_args" not in database.engine_options("sqlite:///books.db", is_async=True)
+
+
+def test_primary_sessions_do_not_read_the_replica(client):
+    async def check():
+        async with database.AsyncSessionLocal() as db:
+            return database.reads_replica(db)
+
+    assert asyncio.run(check()) is False
@@ -0,0 +1,57 @@
+import io
+import random
+
+import pytest
+
+from app.services.isbn import normalize_isbn
+
+
+def _unique_isbn10() -> str:
+    first9 = "".join(random.choice("0123456789") for _ in range(9))
+    check = -sum(int(digit) * (10 - i) for i, digit in enumerate(first9)) % 11
+    return first9 + ("X" if check == 10 else str(check))
+
+
+def test_isbn10_is_promoted_to_isbn13():
+    assert normalize_isbn("0-306-40615-2") == "9780306406157"
+    assert normalize_isbn("0 8044 2957 x") == "9780804429573"
+    assert normalize_isbn("978-0-306-40615-7") == "9780306406157"
+
+
+@pytest.mark.parametrize("isbn", ["0-306-40615-0", "0-306-40615-1", "0-306-40615-X", "978-0-306-40615-0"])
+def test_wrong_check_digit_is_rejected(isbn):
+    with pytest.raises(ValueError):
+        normalize_isbn(isbn)
+
+
+def test_other_values_only_lose_their_separators():
+    assert normalize_isbn(" abc-123 ") == "ABC123"
+    assert normalize_isbn(" - ") is None
+
+
+def test_mistyped_isbn10_does_not_overwrite_another_book(client, auth_headers):
+    isbn = _unique_isbn10()
+    assert client.post("/books/", headers=auth_headers, json={"title": "Original", "author": "A", "isbn": isbn}).status_code == 201
+
+    mistyped = isbn[:9] + ("0" if isbn[9] != "0" else "1")
+    response = client.post(
+        "/books/?on_conflict=overwrite", headers=auth_headers,
+        json={"title": "Overwritten", "author": "A", "isbn": mistyped},
+    )
+
+    assert response.status_code == 422
+
+
+def test_import_rejects_a_mistyped_isbn10(client, auth_headers):
+    isbn = _unique_isbn10()
+    mistyped = isbn[:9] + ("0" if isbn[9] != "0" else "1")
+    csv = f"title,author,isbn\nGood,A,{isbn}\nBad,A,{mistyped}\n".encode()
+
+    response = client.post(
+        "/upload/books/upload?on_conflict=overwrite", headers=auth_headers,
+        files={"file": ("books.csv", io.BytesIO(csv), "text/csv")},
+    )
+
+    body = response.json()
+    assert body["inserted_records"] == 1
+    assert body["rejected_records"] == 1
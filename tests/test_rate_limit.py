@@ -0,0 +1,132 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.services import rate_limit
+from app.services.rate_limit import Limit, MemoryRateLimitStore, RateLimitStore, RedisRateLimitStore
+from tests.fake_redis import FakeRedis
+
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+
+def _real_redis_store():
+    import redis.asyncio
+    return RedisRateLimitStore(redis.asyncio.Redis.from_url(TEST_REDIS_URL), prefix=f"test:{uuid.uuid4().hex}:")
+
+
+@pytest.fixture(params=[
+    "memory",
+    "fake_redis",
+    pytest.param("redis", marks=pytest.mark.skipif(not TEST_REDIS_URL, reason="TEST_REDIS_URL is not set")),
+])
+def make_store(request):
+    """Store factory; called inside the test's event loop, since a real client is bound to it"""
+    if request.param == "memory":
+        return lambda: MemoryRateLimitStore(100)
+    if request.param == "fake_redis":
+        return lambda: RedisRateLimitStore(FakeRedis())
+    return _real_redis_store
+
+
+class _BrokenStore(rate_limit.RateLimitStore):
+    async def take(self, key, limit):
+        raise ConnectionError("store is down")
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """Turn limiting on with a tiny search bucket, on a fresh store"""
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"search": Limit(2, 60)})
+    monkeypatch.setattr(rate_limit, "IP_RATE_LIMITS", {"search": Limit(2, 60)})
+    previous = rate_limit.store
+    rate_limit.set_store(MemoryRateLimitStore(100))
+    yield
+    rate_limit.set_store(previous)
+
+
+def test_bucket_empties_and_reports_when_to_retry(make_store):
+    async def check():
+        store = make_store()
+        limit = Limit(2, 60)
+        assert (await store.take("search:ip:1", limit))[0]
+        assert (await store.take("search:ip:1", limit))[0]
+        allowed, retry_after = await store.take("search:ip:1", limit)
+        assert not allowed
+        assert 0 < retry_after <= 30
+        assert (await store.take("search:ip:2", limit))[0]
+
+    asyncio.run(check())
+
+
+def test_redis_buckets_are_shared_between_processes():
+    async def check():
+        client = FakeRedis()
+        limit = Limit(1, 60)
+        assert (await RedisRateLimitStore(client).take("auth:ip:1", limit))[0]
+        assert not (await RedisRateLimitStore(client).take("auth:ip:1", limit))[0]
+
+    asyncio.run(check())
+
+
+def test_store_outage_lets_requests_through():
+    previous = rate_limit.store
+    rate_limit.set_store(_BrokenStore())
+    try:
+        errors = rate_limit.stats()["store_errors"]
+        assert asyncio.run(rate_limit.admit_rate("auth", ["ip:1"])) == 0.0
+        assert rate_limit.stats()["store_errors"] == errors + 1
+    finally:
+        rate_limit.set_store(previous)
+
+
+def test_redis_client_has_timeouts(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BACKEND", "redis")
+    monkeypatch.setattr(rate_limit, "REDIS_URL", "redis://localhost:6379/0")
+
+    store = rate_limit._create_store()
+
+    connection_kwargs = store._client.connection_pool.connection_kwargs
+    assert connection_kwargs["socket_connect_timeout"] == rate_limit.REDIS_CONNECT_TIMEOUT_SECONDS
+    assert connection_kwargs["socket_timeout"] == rate_limit.REDIS_SOCKET_TIMEOUT_SECONDS
+
+
+def test_requests_past_the_limit_get_429(client, limited):
+    statuses = [client.get("/books/").status_code for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    response = client.get("/books/")
+    assert int(response.headers["retry-after"]) >= 1
+    assert client.get("/health").status_code == 200
+
+
+def _token(client, email):
+    client.post("/user/sign_up", json={"username": "limited", "email": email, "password": "pw"})
+    return client.post("/user/log_in", json={"email": email, "password": "pw"}).json()["access_token"]
+
+
+def test_signed_in_requests_also_count_against_their_ip(client, limited):
+    tokens = [_token(client, f"{uuid.uuid4().hex[:12]}@example.com") for _ in range(3)]
+
+    statuses = [client.get("/books/", headers={"Authorization": f"Bearer {token}"}).status_code for token in tokens]
+
+    assert statuses == [200, 200, 429]
+
+
+def test_users_have_their_own_bucket_behind_a_looser_ip_limit(client, limited, monkeypatch):
+    monkeypatch.setattr(rate_limit, "IP_RATE_LIMITS", {"search": Limit(10, 60)})
+    token = _token(client, f"{uuid.uuid4().hex[:12]}@example.com")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    statuses = [client.get("/books/", headers=headers).status_code for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    assert client.get("/books/").status_code == 200
+
+
+def test_rate_limit_stores_must_implement_take():
+    with pytest.raises(TypeError):
+        RateLimitStore()
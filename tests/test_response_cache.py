@@ -0,0 +1,195 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.services import response_cache
+from app.services.cache import CacheBackend, MemoryCacheBackend, RedisCacheBackend
+from tests.fake_redis import FakeRedis
+
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+
+def _real_redis_backend():
+    import redis.asyncio
+    return RedisCacheBackend(redis.asyncio.Redis.from_url(TEST_REDIS_URL), prefix=f"test:{uuid.uuid4().hex}:")
+
+
+@pytest.fixture(params=[
+    "memory",
+    "fake_redis",
+    pytest.param("redis", marks=pytest.mark.skipif(not TEST_REDIS_URL, reason="TEST_REDIS_URL is not set")),
+])
+def make_backend(request):
+    """Backend factory; called inside the test's event loop, since a real client is bound to it"""
+    if request.param == "memory":
+        return lambda: MemoryCacheBackend(100, 60)
+    if request.param == "fake_redis":
+        return lambda: RedisCacheBackend(FakeRedis())
+    return _real_redis_backend
+
+
+def test_entries_are_stored_and_found(make_backend):
+    async def check():
+        backend = make_backend()
+        value, generation = await backend.get("books?page=1")
+        assert value is None
+        assert await backend.set("books?page=1", b"[1]", 60, ["book:1", "books:all"], generation)
+        assert (await backend.get("books?page=1"))[0] == b"[1]"
+        await backend.clear()
+
+    asyncio.run(check())
+
+
+def test_invalidation_drops_tagged_entries_only(make_backend):
+    async def check():
+        backend = make_backend()
+        _, generation = await backend.get("book:1")
+        await backend.set("book:1", b"one", 60, ["book:1"], generation)
+        await backend.set("book:2", b"two", 60, ["book:2"], generation)
+        await backend.set("books?page=1", b"[1,2]", 60, ["book:1", "book:2", "books:all"], generation)
+
+        await backend.invalidate_tags(["book:1"])
+
+        assert (await backend.get("book:1"))[0] is None
+        assert (await backend.get("books?page=1"))[0] is None
+        assert (await backend.get("book:2"))[0] == b"two"
+        await backend.clear()
+
+    asyncio.run(check())
+
+
+def test_entry_computed_before_an_invalidation_is_not_stored(make_backend):
+    async def check():
+        backend = make_backend()
+        _, generation = await backend.get("book:1")
+        await backend.invalidate_tags(["book:1"])
+        assert not await backend.set("book:1", b"stale", 60, ["book:1"], generation)
+        assert (await backend.get("book:1"))[0] is None
+        await backend.clear()
+
+    asyncio.run(check())
+
+
+def test_clear_drops_everything_and_moves_the_generation_on(make_backend):
+    async def check():
+        backend = make_backend()
+        _, generation = await backend.get("book:1")
+        await backend.set("book:1", b"one", 60, ["book:1"], generation)
+        await backend.clear()
+        assert (await backend.get("book:1"))[0] is None
+        assert not await backend.set("book:1", b"stale", 60, ["book:1"], generation)
+
+    asyncio.run(check())
+
+
+def test_redis_generation_is_shared_between_processes():
+    async def check():
+        client = FakeRedis()
+        worker, other_worker = RedisCacheBackend(client), RedisCacheBackend(client)
+        _, generation = await worker.get("book:1")
+        await other_worker.invalidate_tags(["book:2"])
+        assert not await worker.set("book:1", b"stale", 60, ["book:1"], generation)
+
+    asyncio.run(check())
+
+
+def test_redis_calls_take_one_round_trip():
+    async def check():
+        client = FakeRedis()
+        backend = RedisCacheBackend(client)
+        tags = [f"book:{book_id}" for book_id in range(20)] + ["books:all"]
+
+        _, generation = await backend.get("books?page=1")
+        await backend.set("books?page=1", b"[]", 60, tags, generation)
+        await backend.invalidate_tags(tags)
+
+        assert client.calls == 3
+
+    asyncio.run(check())
+
+
+def test_redis_clear_keeps_other_prefixes():
+    async def check():
+        client = FakeRedis()
+        await client.set("bookstore:ratelimit:auth:ip:1", b"x")
+        backend = RedisCacheBackend(client)
+        _, generation = await backend.get("book:1")
+        await backend.set("book:1", b"one", 60, ["book:1"], generation)
+
+        await backend.clear()
+
+        assert await client.get("bookstore:ratelimit:auth:ip:1") == b"x"
+        assert [key async for key in client.scan_iter(match="bookstore:cache:*")] == [b"bookstore:cache:generation"]
+
+    asyncio.run(check())
+
+
+def test_book_update_invalidates_shared_cache(client, auth_headers):
+    previous = response_cache.backend
+    response_cache.set_backend(RedisCacheBackend(FakeRedis()))
+    try:
+        book = client.post("/books/", json={"title": "Cached", "author": "A. Writer", "price": 5}, headers=auth_headers).json()
+        assert client.get(f"/books/{book['id']}").json()["title"] == "Cached"
+
+        client.put(f"/books/{book['id']}", json={"title": "Recached"}, headers=auth_headers)
+
+        assert client.get(f"/books/{book['id']}").json()["title"] == "Recached"
+    finally:
+        response_cache.set_backend(previous)
+
+
+class SlowFakeRedis(FakeRedis):
+    """Takes its time over every script, like a Redis a network hop away"""
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        await asyncio.sleep(0.05)
+        return await super().eval(script, numkeys, *keys_and_args)
+
+
+def test_reads_right_after_a_write_see_the_write(client, auth_headers):
+    previous = response_cache.backend
+    redis = SlowFakeRedis()
+    response_cache.set_backend(RedisCacheBackend(redis))
+    try:
+        book = client.post("/books/", json={"title": "Before", "author": "A. Writer", "price": 5}, headers=auth_headers).json()
+        first = client.get(f"/books/{book['id']}")
+        assert f"bookstore:cache:book:{book['id']}".encode() in redis.strings
+        assert first.json()["title"] == "Before"
+
+        client.put(f"/books/{book['id']}", json={"title": "After"}, headers=auth_headers)
+        reread = client.get(f"/books/{book['id']}", headers={"If-None-Match": first.headers["etag"]})
+
+        assert reread.status_code == 200
+        assert reread.json()["title"] == "After"
+
+        client.delete(f"/books/{book['id']}", headers=auth_headers)
+        assert client.get(f"/books/{book['id']}").status_code == 404
+    finally:
+        response_cache.set_backend(previous)
+
+
+def test_replica_reads_wait_for_the_replica_to_catch_up(make_backend):
+    async def check():
+        backend = make_backend()
+        await backend.invalidate_tags(["book:1"])
+        _, generation = await backend.get("book:1")
+
+        assert not await backend.set("book:1", b"maybe stale", 60, ["book:1"], generation, settle_seconds=30)
+        assert await backend.set("book:1", b"from primary", 60, ["book:1"], generation)
+        await asyncio.sleep(0.05)
+        assert await backend.set("book:2", b"settled", 60, ["book:2"], generation, settle_seconds=0.01)
+        await backend.clear()
+
+    asyncio.run(check())
+
+
+def test_cache_backends_must_implement_every_method():
+    class Partial(CacheBackend):
+        async def get(self, key):
+            return None, 0
+
+    with pytest.raises(TypeError):
+        Partial()
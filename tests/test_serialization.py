@@ -0,0 +1,21 @@
+import uuid
+
+from app.schemas.schemas import BookFields, BookResponse
+
+
+def test_listing_items_document_every_book_field_as_optional(client):
+    schema = client.get("/openapi.json").json()["components"]["schemas"]["BookFields"]
+
+    assert set(BookFields.model_fields) == set(BookResponse.model_fields)
+    assert "required" not in schema
+
+
+def test_fields_limits_the_listed_book_fields(client, auth_headers):
+    title = uuid.uuid4().hex
+    client.post("/books/", headers=auth_headers, json={"title": title, "author": "A", "price": 4})
+
+    listed = client.get("/books/", params={"title": title, "fields": "id,title,price"}).json()["items"]
+    mine = client.get("/books/my/books", headers=auth_headers, params={"title": title, "fields": "title"}).json()["items"]
+
+    assert [set(book) for book in listed] == [{"id", "title", "price"}]
+    assert mine == [{"title": title}]
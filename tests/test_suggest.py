@@ -0,0 +1,70 @@
+import time
+import uuid
+
+from app.services import suggest
+from app.services.book_events import BookChange
+from app.services.suggest import SuggestIndex
+
+
+def _book(title, author):
+    return {"title": title, "author": author}
+
+
+def _index(rows):
+    index = SuggestIndex()
+    index.build(rows)
+    return index
+
+
+def test_suggestions_merge_kinds_by_book_count():
+    index = _index([("title", "Dune", 5), ("title", "Dune Messiah", 2), ("author", "Dunnett", 3)])
+
+    assert [(s["text"], s["kind"], s["book_count"]) for s in index.suggest("dun")] == [
+        ("Dune", "title", 5), ("Dunnett", "author", 3), ("Dune Messiah", "title", 2),
+    ]
+    assert [s["text"] for s in index.suggest("dun", kind="author")] == ["Dunnett"]
+    assert [s["text"] for s in index.suggest("dun", limit=1)] == ["Dune"]
+
+
+def test_new_names_are_found_before_and_after_compaction():
+    index = _index([("title", "Emma", 1), ("author", "Austen", 1)])
+
+    index.apply([BookChange(None, _book("Emmanuelle", "Arsan"))])
+    assert [s["text"] for s in index.suggest("emm")] == ["Emma", "Emmanuelle"]
+
+    index.apply([BookChange(_book("Emma", "Austen"), None)])
+    index.compact()
+    assert [s["text"] for s in index.suggest("emm")] == ["Emmanuelle"]
+    assert [s["text"] for s in index.suggest("a", kind="author")] == ["Arsan"]
+    assert index.stats()["names"] == 2
+
+
+def test_kind_filter_is_as_fast_as_no_filter():
+    # every author outranks every title, which made a kind filter walk the whole range
+    rows = [("author", f"Author {i:06d}", 1000 + i) for i in range(100000)]
+    rows += [("title", f"Atlas {i:06d}", 1) for i in range(100000)]
+    index = _index(rows)
+
+    def seconds(kind):
+        started = time.perf_counter()
+        for _ in range(50):
+            suggestions = index.suggest("a", limit=10, kind=kind)
+        assert len(suggestions) == 10
+        return (time.perf_counter() - started) / 50
+
+    assert seconds("title") < 0.01
+    assert index.suggest("a", kind="title")[0]["kind"] == "title"
+    assert seconds(None) < 0.01
+
+
+def test_database_fallback_matches_title_prefixes_literally(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(suggest, "is_ready", lambda: False)
+    marker = uuid.uuid4().hex
+    client.post("/books/", headers=auth_headers, json={"title": f"{marker} 100% Cotton", "author": "A"})
+    client.post("/books/", headers=auth_headers, json={"title": f"{marker} 1000 Nights", "author": "A"})
+
+    found = client.get("/books/suggest", params={"q": f"{marker.upper()} 100%", "kind": "title"}).json()["items"]
+    wildcard = client.get("/books/suggest", params={"q": f"{marker} 10_", "kind": "title"}).json()["items"]
+
+    assert [item["text"] for item in found] == [f"{marker} 100% Cotton"]
+    assert wildcard == []
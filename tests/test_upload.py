@@ -0,0 +1,65 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services import storage
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _create_book(client, headers) -> int:
+    response = client.post("/books/", headers=headers, json={"title": "Covered", "author": "A. Painter"})
+    return response.json()["id"]
+
+
+def test_cover_must_be_an_image(client, auth_headers):
+    book_id = _create_book(client, auth_headers)
+    html = b"<html><script>alert(1)</script></html>"
+
+    response = client.post(
+        f"/upload/books/{book_id}/cover", headers=auth_headers, files={"file": ("x.png", html, "image/png")}
+    )
+
+    assert response.status_code == 400
+    assert client.get(f"/upload/books/{book_id}/cover").status_code == 404
+
+
+def test_cover_is_served_as_the_type_found_in_it(client, auth_headers):
+    book_id = _create_book(client, auth_headers)
+
+    response = client.post(
+        f"/upload/books/{book_id}/cover", headers=auth_headers, files={"file": ("x.jpg", _png(), "image/jpeg")}
+    )
+    assert response.status_code == 200
+
+    cover = client.get(f"/upload/books/{book_id}/cover")
+    assert cover.headers["content-type"] == "image/png"
+    assert cover.headers["x-content-type-options"] == "nosniff"
+
+
+def test_content_type_is_kept_per_book(client, auth_headers):
+    png = _png() + b"<script>alert(1)</script>"
+    file_book, cover_book = _create_book(client, auth_headers), _create_book(client, auth_headers)
+    client.post(f"/upload/books/{file_book}/file", headers=auth_headers, files={"file": ("x.html", png, "text/html")})
+
+    client.post(f"/upload/books/{cover_book}/cover", headers=auth_headers, files={"file": ("x.png", png, "image/png")})
+
+    assert client.get(f"/upload/books/{cover_book}/cover").headers["content-type"] == "image/png"
+    download = client.get(f"/upload/books/{file_book}/file", headers=auth_headers)
+    assert download.headers["content-type"].startswith("text/html")
+    assert download.headers["content-disposition"].startswith("attachment")
+    assert download.headers["x-content-type-options"] == "nosniff"
+
+
+def test_storage_backends_must_implement_every_method():
+    class Partial(storage.StorageBackend):
+        async def size(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()